@@ -1,11 +1,12 @@
 import os
-import pandas as pd
-from modelo import modelo_hibrido_svr_dbscan_2, riesgo_cluster
-import shutil
+import almacen
+from comparacion import comparar_versiones
+from reentrenamiento import reentrenar
 
-DATA_DIR = "data"
-NUEVO = os.path.join(DATA_DIR, "resultado_modelo_nuevo.xlsx")
-ACTUAL = os.path.join(DATA_DIR, "resultado_modelo_actual.xlsx")
+# Punteros del almacén versionado (ver almacen.py)
+NUEVO = "nuevo"
+ACTUAL = "actual"
+EXPORTACION_EXCEL = os.path.join(almacen.DATA_DIR, "resultado_modelo_actual.xlsx")
 
 
 def reentrenar_modelo():
@@ -13,60 +14,70 @@ def reentrenar_modelo():
     # Leer datos originales
     file_name = 'Datos Contugas.xlsx'
     file_path = os.path.abspath(file_name)
-    excel_data = pd.ExcelFile(file_path)
 
-    df_combined = pd.DataFrame()
-    for i, sheet_name in enumerate(excel_data.sheet_names, start=1):
-        df_temp = excel_data.parse(sheet_name)
-        df_temp['Numero_Cliente'] = f'CLIENTE{i}'
-        df_combined = pd.concat([df_combined, df_temp], ignore_index=True)
+    version = reentrenar(file_path, puntero=NUEVO)
+    print(f"Modelo reentrenado y guardado como versión: {version}")
 
-    df_combined['Fecha'] = pd.to_datetime(df_combined['Fecha'])
-    df_combined['Mes'] = df_combined['Fecha'].dt.month
-    df_combined['dia_semana'] = df_combined['Fecha'].dt.dayofweek
-    df_combined['semana_anio'] = df_combined['Fecha'].dt.isocalendar().week
-    df_combined['es_fin_de_semana'] = df_combined['dia_semana'].apply(lambda x: 1 if x >= 5 else 0)
 
-    df_resultado = modelo_hibrido_svr_dbscan_2(df_combined, usar_temperatura=True, usar_presion=False)
-    df_resultado_riesgo = riesgo_cluster(df_resultado)
-
-    df_resultado_riesgo.to_excel(NUEVO, index=False)
-    print(f"Modelo reentrenado y guardado en: {NUEVO}")
+def _formato(valor):
+    # Las métricas quedan en None si no hay lecturas comparables
+    return 'sin datos' if valor is None else f"{valor:.4f}"
 
 
 def comparar_modelos():
-    if not os.path.exists(NUEVO):
+    version_nueva = almacen.leer_puntero(NUEVO)
+    version_actual = almacen.leer_puntero(ACTUAL)
+    if not version_nueva:
         print("Debes reentrenar el modelo primero.")
         return
 
-    if not os.path.exists(ACTUAL):
+    if not version_actual:
         print("No hay modelo actual para comparar.")
         return
 
     print("Comparando modelos...")
 
-    nuevo = pd.read_excel(NUEVO)
-    viejo = pd.read_excel(ACTUAL)
-
-    mse_nuevo = nuevo['Residual'].abs().mean()
-    mse_viejo = viejo['Residual'].abs().mean()
-
-    print(f"MSE del modelo nuevo : {mse_nuevo:.4f}")
-    print(f"MSE del modelo actual: {mse_viejo:.4f}")
-
-    if mse_nuevo < mse_viejo:
+    # Cliente por cliente, leyendo solo las columnas necesarias de cada versión
+    reporte = comparar_versiones(version_actual, version_nueva)
+    ruta = almacen.guardar_reporte(version_nueva, reporte, almacen.ARCHIVO_COMPARACION)
+    total = reporte['total']
+
+    print(f"MAE del modelo nuevo : {_formato(total['mae_nuevo'])} | MSE: {_formato(total['mse_nuevo'])}")
+    print(f"MAE del modelo actual: {_formato(total['mae_actual'])} | MSE: {_formato(total['mse_actual'])}")
+    if total['coincidencia_outlier'] is not None:
+        print(f"Coincidencia de outliers: {total['coincidencia_outlier']:.2%}")
+    if total['tasa_cambio_riesgo'] is not None:
+        print(f"Registros que cambian de riesgo: {total['tasa_cambio_riesgo']:.2%}")
+    print(f"Reporte por cliente: {ruta}")
+
+    if total['mae_nuevo'] is None or total['mae_actual'] is None:
+        print("No hay lecturas comparables para decidir qué modelo es mejor.")
+    elif total['mae_nuevo'] < total['mae_actual']:
         print("El modelo NUEVO es mejor.")
     else:
         print("El modelo ACTUAL es mejor.")
 
 
 def aplicar_nuevo_modelo():
-    if not os.path.exists(NUEVO):
+    version_nueva = almacen.leer_puntero(NUEVO)
+    if not version_nueva:
         print("No hay modelo nuevo entrenado.")
         return
 
-    shutil.copyfile(NUEVO, ACTUAL)
-    print(f"Modelo aplicado correctamente: {ACTUAL}")
+    almacen.fijar_puntero(ACTUAL, version_nueva)
+    # Los workers del servidor toman la versión nueva al revisar el puntero
+    # (o al llamar a POST /admin/recargar), sin reiniciar
+    print(f"Modelo aplicado correctamente: versión {version_nueva}")
+
+
+def exportar_modelo_actual():
+    version_actual = almacen.leer_puntero(ACTUAL)
+    if not version_actual:
+        print("No hay modelo actual para exportar.")
+        return
+
+    almacen.exportar_excel(version_actual, EXPORTACION_EXCEL)
+    print(f"Modelo actual exportado a: {EXPORTACION_EXCEL}")
 
 
 def menu():
@@ -75,7 +86,8 @@ def menu():
         print("1.Reentrenar modelo")
         print("2.Comparar modelos")
         print("3.Aplicar modelo nuevo")
-        print("4.Salir")
+        print("4.Exportar modelo actual a Excel")
+        print("5.Salir")
         opcion = input("Seleccione una opción: ")
 
         if opcion == "1":
@@ -85,6 +97,8 @@ def menu():
         elif opcion == "3":
             aplicar_nuevo_modelo()
         elif opcion == "4":
+            exportar_modelo_actual()
+        elif opcion == "5":
             break
         else:
             print("Opción inválida")
@@ -0,0 +1,314 @@
+import json
+import os
+import shutil
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ------------------------------------------------------
+# Almacén versionado de resultados del modelo.
+# Cada versión es un archivo Arrow IPC sin comprimir con un lote
+# (record batch) por cliente, ordenado por (Numero_Cliente, Fecha).
+# El servidor lo abre con memory-map, así que los workers comparten
+# las páginas del archivo y solo se leen las columnas que se usan.
+# Los punteros 'actual' y 'nuevo' indican qué versión usar.
+# ------------------------------------------------------
+DATA_DIR = os.environ.get(
+    'CONTUGAS_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+)
+DIR_RESULTADOS = os.path.join(DATA_DIR, 'resultados')
+ARCHIVO_DATOS = 'resultado.arrow'
+ARCHIVO_META = 'meta.json'
+# Copia compacta para servir (ver conjunto.compactar); se genera al publicar
+# la versión o, si falta, al cargarla
+ARCHIVO_SERVICIO = 'servicio.arrow'
+# Índice y cubos del conjunto servido (ver conjunto.preparar_servicio): un
+# .npy por arreglo que cada worker abre con memory-map en lugar de recalcular
+DIR_AGREGADOS = 'agregados'
+# Cambia cuando cambia la copia compacta; las de otro formato se regeneran
+FORMATO_SERVICIO = 2
+DIR_MODELOS = 'modelos'
+# Reporte del entrenamiento (tiempos por etapa y por cliente)
+ARCHIVO_REPORTE = 'entrenamiento.json'
+# Comparación contra la versión que estaba en 'actual' (ver comparacion.py)
+ARCHIVO_COMPARACION = 'comparacion.json'
+FORMATO = 1
+
+# Tipos fijos al escribir; las demás columnas se infieren
+TIPOS = {
+    'Fecha': pa.timestamp('ns'),
+    'Numero_Cliente': pa.dictionary(pa.int32(), pa.string()),
+    'Presion': pa.float64(),
+    'Temperatura': pa.float64(),
+    'Volumen': pa.float64(),
+    'Volumen_Predicho': pa.float64(),
+    'Residual': pa.float64(),
+    'MSE': pa.float64(),
+    'outlier': pa.bool_(),
+    'cluster_dbscan': pa.float64(),
+    'Riesgo': pa.dictionary(pa.int32(), pa.string()),
+    'Residual_Promedio_Abs': pa.float64(),
+}
+
+
+def ruta_version(version):
+    return os.path.join(DIR_RESULTADOS, version)
+
+
+def leer_puntero(nombre):
+    ruta = os.path.join(DIR_RESULTADOS, nombre)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        version = f.read().strip()
+    return version or None
+
+
+def fijar_puntero(nombre, version):
+    # Escritura atómica: nunca se lee un puntero a medio escribir
+    os.makedirs(DIR_RESULTADOS, exist_ok=True)
+    ruta = os.path.join(DIR_RESULTADOS, nombre)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(temporal, ruta)
+
+
+def _columna(serie, tipo):
+    if tipo is None:
+        return pa.array(serie, from_pandas=True)
+    if pa.types.is_dictionary(tipo):
+        return pa.array(serie.astype('string'), type=pa.string()).dictionary_encode()
+    if pa.types.is_timestamp(tipo):
+        return pa.array(pd.to_datetime(serie).to_numpy(dtype='datetime64[ns]'), type=tipo)
+    if pa.types.is_boolean(tipo):
+        return pa.array(serie.fillna(False).astype(bool).to_numpy(), type=tipo)
+    # Los NaN se guardan como valores (no como nulos) para que la lectura
+    # desde el memory-map no tenga que copiar
+    return pa.array(pd.to_numeric(serie, errors='coerce').to_numpy(dtype=np.float64), type=tipo, from_pandas=False)
+
+
+def _escribir_version(esquema, partes, puntero, metadatos, paquetes):
+    # partes: (cliente, tabla del cliente ordenada por Fecha) en orden de
+    # cliente; cada cliente queda en un lote con el diccionario común
+    version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    directorio = ruta_version(version)
+    temporal = directorio + '.tmp'
+    os.makedirs(temporal)
+
+    particiones = {}
+    filas = 0
+    with pa.OSFile(os.path.join(temporal, ARCHIVO_DATOS), 'wb') as sink:
+        with pa.ipc.new_file(sink, esquema) as writer:
+            for cliente, parte in partes:
+                for batch in parte.combine_chunks().to_batches(max_chunksize=max(len(parte), 1)):
+                    writer.write_batch(batch)
+                particiones[cliente] = [filas, filas + len(parte)]
+                filas += len(parte)
+
+    if paquetes:
+        os.makedirs(os.path.join(temporal, DIR_MODELOS))
+        for cliente, paquete in paquetes.items():
+            joblib.dump(paquete, os.path.join(temporal, DIR_MODELOS, f'{cliente}.joblib'))
+
+    meta = {
+        'version': version,
+        'formato': FORMATO,
+        'creado': datetime.now().isoformat(timespec='seconds'),
+        'filas': filas,
+        'columnas': {campo.name: str(campo.type) for campo in esquema},
+        'clientes': particiones,
+        'modelos': sorted(paquetes or []),
+    }
+    meta.update(metadatos or {})
+    with open(os.path.join(temporal, ARCHIVO_META), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    os.replace(temporal, directorio)
+    if puntero:
+        fijar_puntero(puntero, version)
+    return version
+
+
+def guardar_resultado(df, puntero='nuevo', metadatos=None, paquetes=None):
+    # paquetes: {cliente: paquete del modelo ajustado} (ver modelo._entrenar_cliente)
+    if 'Fecha' not in df.columns and df.index.name == 'Fecha':
+        df = df.reset_index()
+    df = df.dropna(subset=['Fecha']).copy()
+    df['Fecha'] = pd.to_datetime(df['Fecha'])
+    df = df.sort_values(['Numero_Cliente', 'Fecha'], kind='stable').reset_index(drop=True)
+
+    tabla = pa.table({col: _columna(df[col], TIPOS.get(col)) for col in df.columns})
+    # Diccionario común a todos los lotes
+    tabla = tabla.unify_dictionaries()
+
+    clientes = df['Numero_Cliente'].astype(str).to_numpy()
+    cortes = np.flatnonzero(clientes[1:] != clientes[:-1]) + 1
+    inicios = np.r_[0, cortes] if len(df) else []
+    fines = np.r_[cortes, len(df)] if len(df) else []
+    partes = ((clientes[a], tabla.slice(a, b - a)) for a, b in zip(inicios, fines))
+    return _escribir_version(tabla.schema, partes, puntero, metadatos, paquetes)
+
+
+def agregar_resultado(version_base, df, puntero='nuevo', metadatos=None, paquetes=None):
+    # Versión nueva = version_base + filas de df (con las columnas de la base).
+    # La base no pasa por pandas ni se reordena: cada cliente se copia tal
+    # cual desde el memory-map y se le agregan sus filas nuevas; solo si
+    # alguna fila nueva es anterior a las de la base se reordena ese cliente.
+    base = abrir_tabla(version_base)
+    particiones = leer_meta(version_base)['clientes']
+
+    df = df.dropna(subset=['Fecha']).copy()
+    df['Fecha'] = pd.to_datetime(df['Fecha'])
+    df = df.sort_values(['Numero_Cliente', 'Fecha'], kind='stable').reset_index(drop=True)
+    columnas = {}
+    for campo in base.schema:
+        if campo.name in df.columns:
+            columnas[campo.name] = _columna(df[campo.name], TIPOS.get(campo.name)).cast(campo.type)
+        else:
+            columnas[campo.name] = pa.nulls(len(df), campo.type)
+    nuevas = pa.table(columnas, schema=base.schema)
+
+    # Diccionario común a la base y a las filas nuevas
+    tabla = pa.concat_tables([base, nuevas]).unify_dictionaries()
+    clientes = df['Numero_Cliente'].astype(str).to_numpy()
+    cortes = np.flatnonzero(clientes[1:] != clientes[:-1]) + 1
+    rangos_nuevos = {
+        clientes[a]: (base.num_rows + int(a), base.num_rows + int(b))
+        for a, b in zip(np.r_[0, cortes], np.r_[cortes, len(df)]) if len(df)
+    }
+
+    def partes():
+        for cliente in sorted(set(particiones) | set(rangos_nuevos)):
+            a, b = particiones.get(cliente, (0, 0))
+            c, d = rangos_nuevos.get(cliente, (0, 0))
+            parte = pa.concat_tables([tabla.slice(a, b - a), tabla.slice(c, d - c)])
+            if b > a and d > c and tabla['Fecha'][c].value < tabla['Fecha'][b - 1].value:
+                parte = parte.take(pc.sort_indices(parte, [('Fecha', 'ascending')]))
+            yield cliente, parte
+
+    return _escribir_version(base.schema, partes(), puntero, metadatos, paquetes)
+
+
+def leer_meta(version):
+    with open(os.path.join(ruta_version(version), ARCHIVO_META), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def abrir_tabla(version, columnas=None):
+    # Lectura sin copia: los buffers apuntan al archivo mapeado en memoria
+    fuente = pa.memory_map(os.path.join(ruta_version(version), ARCHIVO_DATOS), 'r')
+    tabla = pa.ipc.open_file(fuente).read_all()
+    if columnas is not None:
+        tabla = tabla.select([c for c in columnas if c in tabla.column_names])
+    return tabla
+
+
+def leer_dataframe(version, columnas=None):
+    return abrir_tabla(version, columnas).to_pandas(split_blocks=True)
+
+
+def leer_columna(version, columna):
+    return abrir_tabla(version, [columna]).column(columna).to_numpy()
+
+
+def guardar_servicio(version, df):
+    # Un solo lote por columna para que la lectura sea sin copia
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    tabla = tabla.replace_schema_metadata({**tabla.schema.metadata, b'formato': str(FORMATO_SERVICIO).encode()})
+    ruta = os.path.join(ruta_version(version), ARCHIVO_SERVICIO)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with pa.OSFile(temporal, 'wb') as sink:
+        with pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla, max_chunksize=max(len(df), 1))
+    os.replace(temporal, ruta)
+
+
+def leer_servicio(version):
+    # None si no está guardada o es de otro formato. Las columnas numéricas
+    # y de fecha quedan apuntando al archivo mapeado: todos los procesos que
+    # abren la misma versión comparten esas páginas
+    ruta = os.path.join(ruta_version(version), ARCHIVO_SERVICIO)
+    if not os.path.exists(ruta):
+        return None
+    tabla = pa.ipc.open_file(pa.memory_map(ruta, 'r')).read_all()
+    if (tabla.schema.metadata or {}).get(b'formato') != str(FORMATO_SERVICIO).encode():
+        return None
+    return tabla.to_pandas(split_blocks=True)
+
+
+def guardar_agregados(version, arreglos, meta):
+    # Se escriben en un directorio temporal y se publican con un rename; si
+    # otro proceso ya los publicó, se conservan los suyos
+    directorio = os.path.join(ruta_version(version), DIR_AGREGADOS)
+    temporal = f'{directorio}.{os.getpid()}.tmp'
+    os.makedirs(temporal)
+    for nombre, arreglo in arreglos.items():
+        np.save(os.path.join(temporal, f'{nombre}.npy'), arreglo)
+    with open(os.path.join(temporal, ARCHIVO_META), 'w', encoding='utf-8') as f:
+        json.dump(dict(meta, formato=FORMATO_SERVICIO), f, ensure_ascii=False)
+    if leer_agregados(version) is None:
+        shutil.rmtree(directorio, ignore_errors=True)
+    try:
+        os.replace(temporal, directorio)
+    except OSError:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+
+def leer_agregados(version):
+    # (arreglos de solo lectura mapeados en memoria, meta) o None si no están
+    # guardados o son de otro formato
+    directorio = os.path.join(ruta_version(version), DIR_AGREGADOS)
+    ruta_meta = os.path.join(directorio, ARCHIVO_META)
+    if not os.path.exists(ruta_meta):
+        return None
+    with open(ruta_meta, encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('formato') != FORMATO_SERVICIO:
+        return None
+    arreglos = {
+        nombre[:-len('.npy')]: np.load(os.path.join(directorio, nombre), mmap_mode='r')
+        for nombre in os.listdir(directorio) if nombre.endswith('.npy')
+    }
+    return arreglos, meta
+
+
+def cargar_paquete(version, cliente):
+    # cliente puede venir de una petición (/puntuar) y joblib.load ejecuta lo
+    # que haya en el archivo: solo se cargan los clientes con modelo en la
+    # versión y la ruta tiene que quedar dentro de su directorio de modelos
+    if not isinstance(cliente, str) or '..' in cliente or os.sep in cliente or '/' in cliente:
+        return None
+    if cliente not in leer_meta(version).get('modelos', []):
+        return None
+    directorio = os.path.abspath(os.path.join(ruta_version(version), DIR_MODELOS))
+    ruta = os.path.abspath(os.path.join(directorio, f'{os.path.basename(cliente)}.joblib'))
+    if os.path.commonpath([directorio, ruta]) != directorio or not os.path.exists(ruta):
+        return None
+    return joblib.load(ruta)
+
+
+def guardar_reporte(version, reporte, nombre=ARCHIVO_REPORTE):
+    ruta = os.path.join(ruta_version(version), nombre)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def leer_reporte(version, nombre=ARCHIVO_REPORTE):
+    ruta = os.path.join(ruta_version(version), nombre)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def exportar_excel(version, ruta):
+    leer_dataframe(version).to_excel(ruta, index=False)
+    return ruta
@@ -1,7 +1,25 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, g, jsonify, request, send_from_directory, stream_with_context
 from flask_cors import CORS
 import pandas as pd
+import hashlib
+import hmac
+import json
 import os
+import threading
+import time
+from functools import lru_cache, wraps
+
+import almacen
+import exportacion
+import paneles
+import submuestreo
+from conjunto import cargar_conjunto
+from cache_respuestas import CacheRespuestas
+from consulta import CLAVES_ORDEN
+from metricas import CUBETAS_FILAS, TIPO_CONTENIDO, RegistroMetricas, metricas_entrenamiento
+from paneles import ConsultaPanel
+from puntuacion import puntuar
+import trabajos
 
 # ------------------------------------------------------
 # 19/05 12:25 CAMBIOS PARA SOPORTE EN RAILWAY - SOFIA SALAZAR
@@ -10,239 +28,444 @@ app = Flask(__name__)
 server = app  # Necesario para Gunicorn y Railway
 CORS(app)
 
-# Cargar el archivo
-ruta_excel = os.path.join(os.path.dirname(__file__), 'data', 'resultado_modelo_actual.xlsx')
-df = pd.read_excel(ruta_excel)
-
-# Limpiar y convertir columnas relevantes
-df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
-df['Volumen'] = pd.to_numeric(df['Volumen'], errors='coerce')
-df['Presion'] = pd.to_numeric(df['Presion'], errors='coerce')
-df['Temperatura'] = pd.to_numeric(df['Temperatura'], errors='coerce')
-
-# Convertir columna 'outlier' a booleano si existe
-if 'outlier' in df.columns:
-    df['outlier'] = df['outlier'].astype(str).str.strip().str.upper().map({
-        'VERDADERO': True, 'FALSO': False, 'TRUE': True, 'FALSE': False
-    }).fillna(False)
-
-# Eliminar registros sin fecha válida
-df = df.dropna(subset=['Fecha'])
+# Conjunto activo (resultado + índice + cubos). Se reemplaza entero al
+# cambiar el puntero 'actual': cada petición toma una referencia al inicio
+# y termina con esa versión aunque en el medio se publique otra.
+conjunto = cargar_conjunto(almacen.leer_puntero('actual'))
+
+# Cada cuántos segundos revisar el puntero 'actual' (0 = solo recarga manual)
+INTERVALO_RECARGA = float(os.environ.get('CONTUGAS_INTERVALO_RECARGA', '30'))
+TOKEN_ADMIN = os.environ.get('CONTUGAS_TOKEN_ADMIN')
+MAX_LIMITE_TABLA = 500
+_cerrojo_recarga = threading.Lock()
+_vigilante_pid = None
+
+# Caché de respuestas (ver cache_respuestas.py para la configuración)
+cache = CacheRespuestas()
+
+# Métricas de este proceso en formato Prometheus (ver metricas.py y /metrics)
+metricas = RegistroMetricas()
+latencia_rutas = metricas.histograma('contugas_peticion_segundos', 'Latencia de las peticiones por ruta')
+peticiones_rutas = metricas.contador('contugas_peticiones_total', 'Peticiones atendidas por ruta y estado')
+filas_filtro = metricas.histograma(
+    'contugas_filtro_filas', 'Registros que cumplen el filtro de la petición', CUBETAS_FILAS
+)
+filas_recorridas = metricas.histograma(
+    'contugas_filas_recorridas', 'Registros leídos para responder la petición', CUBETAS_FILAS
+)
+filas_exportadas = metricas.contador('contugas_filas_exportadas_total', 'Registros entregados por /exportar')
+
+
+def recargar_conjunto():
+    # Construye el conjunto nuevo fuera de las peticiones y lo publica con
+    # una sola asignación. Devuelve True si cambió la versión servida.
+    global conjunto
+    with _cerrojo_recarga:
+        version = almacen.leer_puntero('actual')
+        if not version or version == conjunto.version:
+            return False
+        nuevo = cargar_conjunto(version)
+        conjunto = nuevo
+        cache.limpiar(version)
+        print(f"Versión servida: {version}")
+        return True
+
+
+def _vigilar_puntero():
+    while True:
+        time.sleep(INTERVALO_RECARGA)
+        try:
+            recargar_conjunto()
+        except Exception as e:
+            print(f"Error al recargar el modelo: {e}")
+
+
+@app.before_request
+def iniciar_vigilante():
+    # Un hilo por proceso; se arranca en la primera petición para que
+    # cada worker de gunicorn tenga el suyo (los hilos no sobreviven al fork)
+    global _vigilante_pid
+    if INTERVALO_RECARGA > 0 and _vigilante_pid != os.getpid():
+        _vigilante_pid = os.getpid()
+        threading.Thread(target=_vigilar_puntero, daemon=True).start()
+
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+
+
+def tipo_filtro(filtro):
+    # Forma del filtro (qué campos trae) como etiqueta de baja cardinalidad
+    partes = []
+    if filtro['cliente'] and filtro['cliente'].lower() != 'todos':
+        partes.append('cliente')
+    if filtro['inicio'] or filtro['fin']:
+        partes.append('fechas')
+    if filtro['riesgos']:
+        partes.append('riesgos')
+    return '+'.join(partes) or 'ninguno'
+
+
+@app.after_request
+def medir_peticion(respuesta):
+    ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    if 'inicio_peticion' in g:
+        latencia_rutas.observar(time.perf_counter() - g.inicio_peticion, ruta=ruta, metodo=request.method)
+    peticiones_rutas.incrementar(ruta=ruta, metodo=request.method, estado=respuesta.status_code)
+
+    # Solo las rutas del dashboard tienen consulta; en una respuesta de la
+    # caché no se filtra nada y se registran 0 filas leídas
+    consulta = g.get('consulta')
+    if consulta is not None:
+        filtro = tipo_filtro(consulta.filtro)
+        cardinalidad = consulta.cardinalidad()
+        if cardinalidad is not None:
+            filas_filtro.observar(cardinalidad, ruta=ruta, filtro=filtro)
+        filas_recorridas.observar(consulta.estadisticas['filas_recorridas'], ruta=ruta, filtro=filtro)
+    return respuesta
+
+
+def conjunto_peticion():
+    # Toda la petición usa el conjunto vigente al momento de empezar
+    if 'conjunto' not in g:
+        g.conjunto = conjunto
+    return g.conjunto
+
+
+@app.after_request
+def exponer_version(respuesta):
+    respuesta.headers['X-Version-Modelo'] = conjunto_peticion().version or 'legado'
+    return respuesta
+
+
+def parametros_filtro():
+    riesgos_param = request.args.get('riesgos')
+    return {
+        'cliente': request.args.get('cliente'),
+        'inicio': request.args.get('inicio'),
+        'fin': request.args.get('fin'),
+        'riesgos': riesgos_param.split(',') if riesgos_param else None
+    }
 
-# Crear columna con formato detallado para graficar por fecha y hora
-df['Fecha_redonda'] = df['Fecha'].dt.strftime('%Y-%m-%d %H:%M')
+def parametros_panel(nombre):
+    # Opciones propias de cada panel, además del filtro común
+    if nombre == 'grafico_volumen':
+        return {
+            'max_puntos': request.args.get('max_points', type=int),
+            'metodo': request.args.get('metodo', 'lttb')
+        }
+    if nombre == 'tabla_registros':
+        return {
+            'orden': request.args.get('orden', 'riesgo'),
+            'limite': min(max(request.args.get('limite', 30, type=int), 1), MAX_LIMITE_TABLA),
+            'cursor': request.args.get('cursor')
+        }
+    return {}
+
+
+def error_parametros(nombres):
+    metodo = request.args.get('metodo')
+    if 'grafico_volumen' in nombres and metodo and metodo not in submuestreo.METODOS:
+        return f"Método desconocido: {metodo} (usar {', '.join(submuestreo.METODOS)})"
+    max_puntos = request.args.get('max_points', type=int)
+    if 'grafico_volumen' in nombres and 'max_points' in request.args and (max_puntos or 0) < submuestreo.MIN_PUNTOS:
+        return f"max_points debe ser un entero mayor o igual que {submuestreo.MIN_PUNTOS}"
+    orden = request.args.get('orden')
+    if 'tabla_registros' in nombres and orden and orden not in CLAVES_ORDEN:
+        return f"Orden desconocido: {orden} (usar {', '.join(CLAVES_ORDEN)})"
+    return None
+
+
+def consulta_peticion():
+    if 'consulta' not in g:
+        g.consulta = ConsultaPanel(conjunto_peticion(), **parametros_filtro())
+    return g.consulta
+
+
+def clave_peticion():
+    # Ruta + filtro normalizado + el resto de los parámetros ordenados
+    otros = sorted((k, v) for k, v in request.args.items(multi=True) if k not in ('cliente', 'inicio', 'fin', 'riesgos'))
+    return json.dumps([request.path, consulta_peticion().filtro_normalizado(), otros], sort_keys=True)
+
+
+CABECERAS_CACHE = ('Content-Type', 'ETag', 'Cache-Control', 'X-Cursor-Siguiente')
+
+
+def cacheado(vista):
+    # Solo se guardan las respuestas 200; la clave lleva la versión servida
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        version = conjunto_peticion().version
+        clave = clave_peticion()
+        guardado = cache.obtener(version, clave)
+        if guardado is not None:
+            encabezado, cuerpo = guardado.split(b'\n', 1)
+            respuesta = app.response_class(cuerpo, headers=json.loads(encabezado))
+        else:
+            respuesta = app.make_response(vista(*args, **kwargs))
+            if respuesta.status_code == 200:
+                cabeceras = {c: respuesta.headers[c] for c in CABECERAS_CACHE if c in respuesta.headers}
+                cache.guardar(version, clave, json.dumps(cabeceras).encode() + b'\n' + respuesta.get_data())
+        return respuesta.make_conditional(request)
+    return envoltura
 
 # Endpoint KPIs
 @app.route('/kpis', methods=['GET'])
+@cacheado
 def obtener_kpis():
-    cliente = request.args.get('cliente')
-    inicio = request.args.get('inicio')
-    fin = request.args.get('fin')
-    riesgos_param = request.args.get('riesgos')
-
-    df_filtrado = df.copy()
-    if cliente and cliente.lower() != 'todos':
-        df_filtrado = df_filtrado[df_filtrado['Numero_Cliente'] == cliente]
-    if inicio:
-        df_filtrado = df_filtrado[df_filtrado['Fecha'] >= pd.to_datetime(inicio)]
-    if fin:
-        df_filtrado = df_filtrado[df_filtrado['Fecha'] <= pd.to_datetime(fin)]
-    if riesgos_param:
-        riesgos_lista = riesgos_param.split(',')
-        df_filtrado = df_filtrado[df_filtrado['Riesgo'].fillna('').isin(riesgos_lista)]
-
-    kpis = {
-        'total_clientes': df_filtrado['Numero_Cliente'].nunique(),
-        'total_anomalias': int(df_filtrado['outlier'].sum()) if 'outlier' in df_filtrado.columns else 0,
-        'alertas_criticas': int(df_filtrado[df_filtrado['Riesgo'] == 'Alto'].shape[0]),
-        'promedio_volumen': round(df_filtrado['Volumen'].mean(), 2),
-        'promedio_presion': round(df_filtrado['Presion'].mean(), 2),
-        'promedio_temperatura': round(df_filtrado['Temperatura'].mean(), 2)
-    }
-    return jsonify(kpis)
+    return jsonify(paneles.kpis(consulta_peticion()))
 
 # Endpoint rango fechas
 @app.route('/rangos_fechas', methods=['GET'])
+@cacheado
 def rangos_fechas():
     cliente = request.args.get('cliente')
-    df_filtrado = df[df['Numero_Cliente'] == cliente] if cliente and cliente.lower() != 'todos' else df
+    min_fecha, max_fecha = conjunto_peticion().indice.rango_fechas(cliente)
 
-    if df_filtrado.empty:
+    if min_fecha is None:
         return jsonify({"min_fecha": None, "max_fecha": None})
 
     return jsonify({
-        "min_fecha": df_filtrado['Fecha'].min().strftime("%Y-%m-%d"),
-        "max_fecha": df_filtrado['Fecha'].max().strftime("%Y-%m-%d")
+        "min_fecha": min_fecha.strftime("%Y-%m-%d"),
+        "max_fecha": max_fecha.strftime("%Y-%m-%d")
     })
 
 # Endpoint gráfico volumen
 @app.route('/grafico_volumen', methods=['GET'])
+@cacheado
 def grafico_volumen():
-    cliente = request.args.get('cliente')
-    inicio = request.args.get('inicio')
-    fin = request.args.get('fin')
-    riesgos_param = request.args.get('riesgos')
-
-    df_filtrado = df.copy()
-    if cliente and cliente.lower() != 'todos':
-        df_filtrado = df_filtrado[df_filtrado['Numero_Cliente'] == cliente]
-    if inicio:
-        df_filtrado = df_filtrado[df_filtrado['Fecha'] >= pd.to_datetime(inicio)]
-    if fin:
-        df_filtrado = df_filtrado[df_filtrado['Fecha'] <= pd.to_datetime(fin)]
-    if riesgos_param:
-        riesgos_lista = riesgos_param.split(',')
-        df_filtrado = df_filtrado[df_filtrado['Riesgo'].fillna('Sin riesgo').isin(riesgos_lista)]
-
-    if df_filtrado.empty or 'Riesgo' not in df_filtrado.columns:
-        return jsonify({"datos": []})
-
-    def calcular_riesgo(grupo):
-        if grupo.empty:
-            return 'Sin riesgo'
-        if (grupo == 'Alto').any():
-            return 'Alto'
-        elif (grupo == 'Medio').any():
-            return 'Medio'
-        elif (grupo == 'Bajo').any():
-            return 'Bajo'
-        return 'Sin riesgo'
-
-    df_agrupado = df_filtrado.groupby('Fecha_redonda').agg({
-        'Volumen': 'mean',
-        'Presion': 'mean',
-        'Temperatura': 'mean',
-        'Riesgo': calcular_riesgo
-    }).reset_index()
-
-    data = {
-        "datos": [
-            {
-                "x": row['Fecha_redonda'],
-                "y": round(row['Volumen'], 2),
-                "presion": round(row['Presion'], 2),
-                "temperatura": round(row['Temperatura'], 2),
-                "riesgo": row['Riesgo']
-            }
-            for _, row in df_agrupado.iterrows()
-        ]
-    }
-
-    return jsonify(data)
+    # ?max_points=N reduce la serie (LTTB o ?metodo=minmax) a N puntos como máximo
+    error = error_parametros(['grafico_volumen'])
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify(paneles.grafico_volumen(consulta_peticion(), **parametros_panel('grafico_volumen')))
 
 @app.route('/riesgo_por_cliente', methods=['GET'])
+@cacheado
 def riesgo_por_cliente():
     try:
-        cliente = request.args.get('cliente')
-        inicio = request.args.get('inicio')
-        fin = request.args.get('fin')
-        riesgos_param = request.args.get('riesgos')
-
-        df_filtrado = df.copy()
-        if cliente and cliente.lower() != 'todos':
-            df_filtrado = df_filtrado[df_filtrado['Numero_Cliente'] == cliente]
-        if inicio:
-            df_filtrado = df_filtrado[df_filtrado['Fecha'] >= pd.to_datetime(inicio)]
-        if fin:
-            df_filtrado = df_filtrado[df_filtrado['Fecha'] <= pd.to_datetime(fin)]
-        if riesgos_param:
-            riesgos_lista = riesgos_param.split(',')
-            df_filtrado = df_filtrado[df_filtrado['Riesgo'].fillna('').isin(riesgos_lista)]
-
-        conteo = df_filtrado.groupby(['Numero_Cliente', 'Riesgo']).size().unstack(fill_value=0)
-
-        return jsonify({
-            "clientes": list(conteo.index),
-            "riesgos": list(conteo.columns),
-            "valores": conteo.to_dict(orient='list')
-        })
-
+        return jsonify(paneles.riesgo_por_cliente(consulta_peticion()))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
 @app.route('/anomalias_por_dia_hora', methods=['GET'])
+@cacheado
 def anomalias_por_dia_hora():
     try:
-        cliente = request.args.get('cliente')
-        inicio = request.args.get('inicio')
-        fin = request.args.get('fin')
-        riesgos_param = request.args.get('riesgos')
-
-        df_filtrado = df[df['outlier'] == True] if 'outlier' in df.columns else pd.DataFrame()
-
-        # Aplicar filtros adicionales
-        if cliente and cliente.lower() != 'todos':
-            df_filtrado = df_filtrado[df_filtrado['Numero_Cliente'] == cliente]
-        if inicio:
-            df_filtrado = df_filtrado[df_filtrado['Fecha'] >= pd.to_datetime(inicio)]
-        if fin:
-            df_filtrado = df_filtrado[df_filtrado['Fecha'] <= pd.to_datetime(fin)]
-        if riesgos_param and 'Riesgo' in df_filtrado.columns:
-            riesgos_lista = riesgos_param.split(',')
-            df_filtrado = df_filtrado[df_filtrado['Riesgo'].fillna('').isin(riesgos_lista)]
-
-        # ✅ Verificar si hay datos antes de continuar
-        if df_filtrado.empty:
-            return jsonify({"dias": [], "horas": [], "matriz": []})
-
-        # Procesamiento
-        df_filtrado['hora'] = df_filtrado['Fecha'].dt.hour
-        # df_filtrado['dia_nombre'] = df_filtrado['Fecha'].dt.day_name(locale='es') 
-        df_filtrado['dia_nombre'] = df_filtrado['Fecha'].dt.day_name() 
-
-
-        dias_orden = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        dias_es = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-        mapping_dias = dict(zip(dias_orden, dias_es))
-
-
-        df_filtrado['dia_nombre'] = df_filtrado['dia_nombre'].map(lambda d: mapping_dias.get(d, d))
-
-        heatmap = df_filtrado.groupby(['dia_nombre', 'hora']).size().unstack(fill_value=0)
-        # La siguiente línea ya no es necesaria
-        # heatmap.index = heatmap.index.map(lambda d: mapping_dias.get(d, d))
-        heatmap = heatmap.reindex(dias_es) # Esto asegura el orden correcto
-
-        return jsonify({
-            "dias": list(heatmap.index),
-            "horas": [str(h).zfill(2) for h in heatmap.columns],
-            "matriz": heatmap.fillna(0).values.tolist()
-        })
-        
-        #heatmap = df_filtrado.groupby(['dia_nombre', 'hora']).size().unstack(fill_value=0)
-        #heatmap.index = heatmap.index.map(lambda d: mapping_dias.get(d, d))
-        #heatmap = heatmap.reindex(dias_es)
-
+        return jsonify(paneles.anomalias_por_dia_hora(consulta_peticion()))
     except Exception as e:
         print(f"Error en /anomalias_por_dia_hora: {e}")
         return jsonify({"error": str(e)}), 500
-        
+
+# ?orden=riesgo|residual|fecha&limite=N; la respuesta sigue siendo la lista
+# de registros y el cursor de la página siguiente va en X-Cursor-Siguiente
 @app.route('/tabla_registros', methods=['GET'])
+@cacheado
 def tabla_registros():
-    cliente = request.args.get('cliente')
-    inicio = request.args.get('inicio')
-    fin = request.args.get('fin')
-    riesgos_param = request.args.get('riesgos')
+    error = error_parametros(['tabla_registros'])
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        pagina = paneles.tabla_registros(consulta_peticion(), **parametros_panel('tabla_registros'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    respuesta = jsonify(pagina['registros'])
+    if pagina['siguiente']:
+        respuesta.headers['X-Cursor-Siguiente'] = pagina['siguiente']
+    return respuesta
+
+# Todos los paneles en una sola petición con un único filtrado.
+# ?paneles=kpis,tabla_registros elige cuáles incluir (por defecto todos).
+# La respuesta depende solo de la versión servida y de los parámetros,
+# así que se valida con ETag / If-None-Match sin recalcular nada.
+@app.route('/dashboard', methods=['GET'])
+@cacheado
+def dashboard_datos():
+    paneles_param = request.args.get('paneles')
+    nombres = paneles_param.split(',') if paneles_param else list(paneles.PANELES)
+    desconocidos = [n for n in nombres if n not in paneles.PANELES]
+    if desconocidos:
+        return jsonify({"error": f"Paneles desconocidos: {', '.join(desconocidos)}"}), 400
+    error = error_parametros(nombres)
+    if error:
+        return jsonify({"error": error}), 400
+
+    consulta = consulta_peticion()
+    etag = hashlib.sha1(json.dumps([consulta.datos.version, clave_peticion()]).encode()).hexdigest()
+    if etag in request.if_none_match:
+        respuesta = app.response_class(status=304)
+    else:
+        respuesta_datos = {"version": consulta.datos.version}
+        for nombre in nombres:
+            try:
+                respuesta_datos[nombre] = paneles.PANELES[nombre](consulta, **parametros_panel(nombre))
+            except Exception as e:
+                print(f"Error en /dashboard ({nombre}): {e}")
+                respuesta_datos[nombre] = {"error": str(e)}
+        respuesta = jsonify(respuesta_datos)
+
+    respuesta.set_etag(etag)
+    # El navegador revalida siempre con If-None-Match
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+# Registros filtrados como archivo (?formato=csv|parquet) con los mismos
+# filtros del dashboard. La respuesta se arma por bloques mientras se
+# envía; no pasa por la caché y no se cuenta en las métricas de filtro
+# porque el recorrido termina después de la petición.
+@app.route('/exportar', methods=['GET'])
+def exportar_registros():
+    formato = request.args.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS:
+        return jsonify({"error": f"Formato desconocido: {formato} (usar {', '.join(exportacion.FORMATOS)})"}), 400
+
+    datos = conjunto_peticion()
+    consulta = ConsultaPanel(datos, **parametros_filtro())
+    flujo = exportacion.exportar(
+        consulta, formato, al_escribir=lambda filas: filas_exportadas.incrementar(filas, formato=formato)
+    )
+    nombre = f"registros_{datos.version or 'legado'}.{formato}"
+    return app.response_class(
+        stream_with_context(flujo),
+        content_type=exportacion.FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename="{nombre}"', 'Cache-Control': 'no-store'},
+    )
+
+# Puntuación en línea: recibe lecturas nuevas y devuelve el volumen
+# predicho, el residual y el riesgo con el modelo de la versión activa
+@app.route('/puntuar', methods=['POST'])
+def puntuar_lecturas():
+    version = conjunto_peticion().version
+    if not version:
+        return jsonify({"error": "No hay un modelo activo en el almacén"}), 503
+
+    cuerpo = request.get_json(silent=True)
+    lecturas = cuerpo.get('lecturas') if isinstance(cuerpo, dict) else cuerpo
+    if not isinstance(lecturas, list):
+        return jsonify({"error": "Se espera una lista de lecturas"}), 400
+
+    resultado = puntuar(pd.DataFrame(lecturas), version)
+    resultado['Fecha'] = resultado['Fecha'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    resultado = resultado.astype(object).where(resultado.notna(), None)
+
+    return jsonify({
+        "version": version,
+        "resultados": resultado.to_dict(orient='records')
+    })
+
+@lru_cache(maxsize=4)
+def reporte_entrenamiento(version):
+    # El reporte de una versión no cambia una vez publicada
+    return almacen.leer_reporte(version) if version else None
+
+
+@metricas.recolector
+def metricas_servidas():
+    version = conjunto.version
+    estadisticas = cache.estadisticas()
+    return [
+        ('contugas_modelo_info', 'gauge', 'Versión del modelo servida por este proceso',
+         [({'version': version or 'legado'}, 1)]),
+        ('contugas_registros_servidos', 'gauge', 'Registros del conjunto servido', [({}, len(conjunto.df))]),
+        ('contugas_cache_aciertos_total', 'counter', 'Aciertos de la caché de respuestas',
+         [({}, estadisticas['aciertos'])]),
+        ('contugas_cache_fallos_total', 'counter', 'Fallos de la caché de respuestas', [({}, estadisticas['fallos'])]),
+        ('contugas_cache_entradas', 'gauge', 'Entradas en la caché de respuestas', [({}, estadisticas['entradas'])]),
+    ] + metricas_entrenamiento(reporte_entrenamiento(version))
+
+# Métricas en formato de texto de Prometheus (por proceso)
+@app.route('/metrics', methods=['GET'])
+def exponer_metricas():
+    return app.response_class(metricas.exponer(), content_type=TIPO_CONTENIDO)
+
+@app.route('/cache', methods=['GET'])
+def estadisticas_cache():
+    return jsonify(cache.estadisticas())
+
+@app.route('/version', methods=['GET'])
+def version_servida():
+    return jsonify({"version": conjunto_peticion().version})
+
+def requiere_admin(vista):
+    # Sin CONTUGAS_TOKEN_ADMIN las rutas de administración no existen (404);
+    # con token, la petición debe traerlo en X-Token-Admin
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if not TOKEN_ADMIN:
+            return jsonify({"error": "No encontrado"}), 404
+        if not hmac.compare_digest(request.headers.get('X-Token-Admin', '').encode(), TOKEN_ADMIN.encode()):
+            return jsonify({"error": "No autorizado"}), 403
+        return vista(*args, **kwargs)
+    return envoltura
+
+# Recarga manual del puntero 'actual' (p. ej. después de aplicar_nuevo_modelo)
+@app.route('/admin/recargar', methods=['POST'])
+@requiere_admin
+def recargar_modelo():
+    try:
+        cambio = recargar_conjunto()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"version": conjunto.version, "cambio": cambio})
+
+# Reentrenamiento en segundo plano (ver trabajos.py): responde de inmediato
+# con el id del trabajo; el progreso se consulta en /admin/trabajos/<id>
+@app.route('/admin/reentrenar', methods=['POST'])
+@requiere_admin
+def reentrenar_en_segundo_plano():
+    cuerpo = request.get_json(silent=True) or {}
+    try:
+        trabajo = trabajos.enviar(
+            entrada=cuerpo.get('entrada'), incremental=cuerpo.get('incremental', True),
+            n_jobs=cuerpo.get('n_jobs'), regresor=cuerpo.get('regresor')
+        )
+    except trabajos.TrabajoEnCurso as e:
+        return jsonify({"error": str(e), "trabajo": e.trabajo_id}), 409
+    except trabajos.ColaLlena as e:
+        return jsonify({"error": str(e)}), 429
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(trabajo), 202
+
+@app.route('/admin/trabajos', methods=['GET'])
+@requiere_admin
+def listar_trabajos():
+    return jsonify(trabajos.listar_trabajos())
+
+@app.route('/admin/trabajos/<trabajo_id>', methods=['GET'])
+@requiere_admin
+def estado_trabajo(trabajo_id):
+    trabajo = trabajos.leer_trabajo(trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo inexistente"}), 404
+    return jsonify(trabajo)
+
+@app.route('/admin/trabajos/<trabajo_id>/cancelar', methods=['POST'])
+@requiere_admin
+def cancelar_trabajo(trabajo_id):
+    trabajo = trabajos.cancelar(trabajo_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo inexistente"}), 404
+    return jsonify(trabajo)
+
+# Publica la versión candidata del trabajo y la empieza a servir
+@app.route('/admin/trabajos/<trabajo_id>/aplicar', methods=['POST'])
+@requiere_admin
+def aplicar_trabajo(trabajo_id):
+    try:
+        version = trabajos.aplicar(trabajo_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    if version is None:
+        return jsonify({"error": "Trabajo inexistente"}), 404
+    try:
+        cambio = recargar_conjunto()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"version": version, "cambio": cambio})
 
-    df_filtrado = df.copy()
-    if cliente and cliente.lower() != 'todos':
-        df_filtrado = df_filtrado[df_filtrado['Numero_Cliente'] == cliente]
-    if inicio:
-        df_filtrado = df_filtrado[df_filtrado['Fecha'] >= pd.to_datetime(inicio)]
-    if fin:
-        df_filtrado = df_filtrado[df_filtrado['Fecha'] <= pd.to_datetime(fin)]
-    if riesgos_param:
-        riesgos_lista = riesgos_param.split(',')
-        df_filtrado = df_filtrado[df_filtrado['Riesgo'].fillna('').isin(riesgos_lista)]
-
-    columnas = ['Fecha', 'Presion', 'Temperatura', 'Volumen', 'Volumen_Predicho', 'Residual', 'Riesgo']
-    df_filtrado = df_filtrado[columnas].copy()
-    df_filtrado['Riesgo'] = df_filtrado['Riesgo'].fillna('')
-    orden_riesgo = {'Alto': 1, 'Medio': 2, 'Bajo': 3, '': 4}
-    df_filtrado['riesgo_orden'] = df_filtrado['Riesgo'].map(orden_riesgo)
-    df_filtrado = df_filtrado.sort_values('riesgo_orden').drop(columns='riesgo_orden').head(30)
-    df_filtrado['Fecha'] = pd.to_datetime(df_filtrado['Fecha']).dt.strftime('%Y-%m-%d %H:%M:%S')
-
-    return jsonify(df_filtrado.to_dict(orient='records'))
 # ------------------------------------------------------
 # 19/05 12:25 SE REALIZA CAMBIO PARA PODER UTILIZAR 
 # DASHBOARD DESDE HTML
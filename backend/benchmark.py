@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from ingesta import agregar_variables_calendario
+from modelo import entrenar_clientes, riesgo_cluster, umbrales_riesgo
+
+# ------------------------------------------------------
+# Banco de pruebas de rendimiento con datos sintéticos.
+# Genera N clientes x M lecturas horarias con filamentos de
+# anomalías inyectados, mide el entrenamiento (por cliente y por
+# etapa) y la latencia y el tamaño de respuesta de los endpoints
+# con el cliente de pruebas de Flask. El reporte se escribe en
+# JSON para comparar corridas entre versiones:
+#   python benchmark.py --clientes 20 --lecturas 5000 --salida reporte.json
+# ------------------------------------------------------
+ETAPAS = ('escalado', 'knn', 'dbscan', 'svr')
+
+
+def generar_datos(n_clientes=10, m_lecturas=2000, filamentos=3, largo_filamento=24, semilla=0, inicio='2023-01-01'):
+    # Consumo horario con ciclo diario y semanal que depende de la
+    # temperatura y la presión. Cada filamento es un tramo contiguo de
+    # lecturas con el volumen desplazado (fuga o medidor trabado);
+    # 'anomalia_inyectada' marca esas filas para medir la detección.
+    rng = np.random.default_rng(semilla)
+    fechas = pd.date_range(inicio, periods=m_lecturas, freq='h')
+    hora = fechas.hour.to_numpy()
+    dia = fechas.dayofweek.to_numpy()
+
+    partes = []
+    for i in range(1, n_clientes + 1):
+        base = rng.uniform(50, 500)
+        temperatura = 20 + 6 * np.sin(2 * np.pi * (hora - 9) / 24) + rng.normal(0, 1.5, m_lecturas)
+        presion = rng.uniform(3, 8) + rng.normal(0, 0.2, m_lecturas)
+        ciclo = 1 + 0.4 * np.sin(2 * np.pi * (hora - 6) / 24) - 0.2 * (dia >= 5)
+        volumen = base * ciclo * (1 - 0.01 * (temperatura - 20)) * (presion / presion.mean())
+        volumen = volumen + rng.normal(0, 0.03 * base, m_lecturas)
+
+        anomalia = np.zeros(m_lecturas, dtype=bool)
+        largo = min(largo_filamento, m_lecturas)
+        for _ in range(filamentos):
+            a = int(rng.integers(0, m_lecturas - largo + 1))
+            factor = rng.choice([rng.uniform(2, 4), rng.uniform(0, 0.2)])
+            volumen[a:a + largo] *= factor
+            anomalia[a:a + largo] = True
+
+        partes.append(pd.DataFrame({
+            'Fecha': fechas,
+            'Presion': presion,
+            'Temperatura': temperatura,
+            'Volumen': np.maximum(volumen, 0),
+            'Numero_Cliente': f'CLIENTE{i}',
+            'anomalia_inyectada': anomalia,
+        }))
+    return agregar_variables_calendario(pd.concat(partes, ignore_index=True))
+
+
+def _percentiles(valores):
+    valores = np.asarray(valores, dtype=np.float64)
+    if not len(valores):
+        return {}
+    return {
+        'media': round(float(valores.mean()), 6),
+        'p50': round(float(np.percentile(valores, 50)), 6),
+        'p95': round(float(np.percentile(valores, 95)), 6),
+        'max': round(float(valores.max()), 6),
+    }
+
+
+def medir_entrenamiento(df, n_jobs=1, regresor='svr', max_filas_regresor=2000, usar_presion=False):
+    # Mismo flujo que reentrenamiento.reentrenar, sin caché ni almacén
+    verdad = df.set_index(['Numero_Cliente', 'Fecha'])['anomalia_inyectada']
+    entrada = df.drop(columns=['anomalia_inyectada'])
+
+    inicio = time.perf_counter()
+    resultados, paquetes, clientes = [], {}, []
+    for cliente_id, resultado, paquete in entrenar_clientes(
+        entrada, usar_presion=usar_presion, n_jobs=n_jobs, regresor=regresor, max_filas_regresor=max_filas_regresor
+    ):
+        resultado = resultado.reset_index()
+        resultado['Residual'] = resultado['Volumen'] - resultado['Volumen_Predicho']
+        resultados.append(resultado)
+        paquetes[cliente_id] = paquete
+
+        # Detección: filas inyectadas marcadas como outlier
+        inyectadas = verdad.loc[cliente_id].reindex(resultado['Fecha']).to_numpy(dtype=bool)
+        detectadas = resultado['outlier'].to_numpy(dtype=bool)
+        clientes.append({
+            'cliente': cliente_id,
+            'filas': paquete['filas'],
+            **paquete['perfil'],
+            'outliers': int(detectadas.sum()),
+            'recall_filamentos': round(float(detectadas[inyectadas].mean()), 4) if inyectadas.any() else None,
+        })
+    segundos_modelo = time.perf_counter() - inicio
+
+    df_resultado = pd.concat(resultados, ignore_index=True)
+    inicio = time.perf_counter()
+    df_resultado = riesgo_cluster(df_resultado)
+    segundos_riesgo = time.perf_counter() - inicio
+
+    umbrales = umbrales_riesgo(df_resultado)
+    for cliente_id, paquete in paquetes.items():
+        paquete['umbrales_riesgo'] = umbrales.get(cliente_id)
+
+    # Con n_jobs > 1 las etapas se suman entre procesos (tiempo de CPU por etapa)
+    etapas = {
+        etapa: round(sum(c['tiempos'].get(etapa, 0.0) for c in clientes), 6)
+        for etapa in ETAPAS
+    }
+    etapas['riesgo_cluster'] = round(segundos_riesgo, 6)
+    reporte = {
+        'segundos_total': round(segundos_modelo + segundos_riesgo, 6),
+        'segundos_modelo': round(segundos_modelo, 6),
+        'etapas': etapas,
+        'por_cliente_segundos': _percentiles([c['tiempos']['total'] for c in clientes]),
+        'clientes': sorted(clientes, key=lambda c: c['cliente']),
+    }
+    return df_resultado, paquetes, reporte
+
+
+def escenarios_endpoints(df):
+    # (nombre, método, ruta, cuerpo JSON)
+    clientes = sorted(df['Numero_Cliente'].unique())
+    fechas = pd.to_datetime(df['Fecha'])
+    medio = fechas.min() + (fechas.max() - fechas.min()) / 2
+    rango = f"inicio={(medio - pd.Timedelta(days=7)).date()}&fin={medio.date()}"
+    uno = f"cliente={clientes[0]}"
+    lecturas = df[df['Numero_Cliente'] == clientes[0]].tail(24)
+    cuerpo = [
+        {'cliente': fila.Numero_Cliente, 'Fecha': fila.Fecha.isoformat(), 'Temperatura': fila.Temperatura,
+         'Presion': fila.Presion, 'Volumen': fila.Volumen}
+        for fila in lecturas.itertuples()
+    ]
+
+    escenarios = []
+    for nombre, filtro in (('todos', ''), ('cliente', uno), ('rango', rango), ('riesgo', 'riesgos=Alto,Medio')):
+        escenarios += [
+            (f'kpis[{nombre}]', 'GET', f'/kpis?{filtro}', None),
+            (f'grafico_volumen[{nombre}]', 'GET', f'/grafico_volumen?{filtro}', None),
+            (f'grafico_volumen_max500[{nombre}]', 'GET', f'/grafico_volumen?{filtro}&max_points=500', None),
+            (f'riesgo_por_cliente[{nombre}]', 'GET', f'/riesgo_por_cliente?{filtro}', None),
+            (f'anomalias_por_dia_hora[{nombre}]', 'GET', f'/anomalias_por_dia_hora?{filtro}', None),
+            (f'tabla_registros[{nombre}]', 'GET', f'/tabla_registros?{filtro}', None),
+            (f'dashboard[{nombre}]', 'GET', f'/dashboard?{filtro}&max_points=500', None),
+        ]
+    escenarios += [
+        ('rangos_fechas', 'GET', '/rangos_fechas', None),
+        ('puntuar[24]', 'POST', '/puntuar', cuerpo),
+    ]
+    return escenarios
+
+
+def medir_endpoints(df, paquetes, repeticiones=20):
+    # Guarda el resultado como versión 'actual' en CONTUGAS_DATA_DIR (fijado
+    # antes de importar almacen) y levanta la app sobre esa versión
+    import almacen
+    almacen.guardar_resultado(df, puntero='actual', paquetes=paquetes)
+
+    inicio = time.perf_counter()
+    import app as aplicacion
+    segundos_carga = time.perf_counter() - inicio
+
+    cliente = aplicacion.app.test_client()
+    endpoints = []
+    def medir():
+        t0 = time.perf_counter()
+        respuesta = cliente.open(ruta, method=metodo, json=cuerpo)
+        return time.perf_counter() - t0, respuesta
+
+    for nombre, metodo, ruta, cuerpo in escenarios_endpoints(df):
+        # Primera petición (frío: incluye lo que el índice arma en el primer
+        # uso) y luego, en cada repetición, una petición con la caché de
+        # respuestas vacía (mide el endpoint) y otra que la encuentra
+        # (limpiar() sin versión vacía también la caché en disco, si la hay)
+        sin_cache, con_cache = [], []
+        aplicacion.cache.limpiar()
+        frio, respuesta = medir()
+        for _ in range(repeticiones):
+            aplicacion.cache.limpiar()
+            sin_cache.append(medir()[0])
+            con_cache.append(medir()[0])
+        endpoints.append({
+            'nombre': nombre,
+            'ruta': ruta,
+            'estado': respuesta.status_code,
+            'bytes': len(respuesta.get_data()),
+            'ms_frio': round(frio * 1000, 3),
+            'ms_sin_cache': {k: round(v * 1000, 3) for k, v in _percentiles(sin_cache).items()},
+            'ms_cache': {k: round(v * 1000, 3) for k, v in _percentiles(con_cache).items()},
+        })
+    return {
+        'segundos_carga_app': round(segundos_carga, 6),
+        'version': aplicacion.conjunto.version,
+        'cache': aplicacion.cache.estadisticas(),
+        'endpoints': endpoints,
+    }
+
+
+def entorno():
+    return {
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+def ejecutar(n_clientes=10, m_lecturas=2000, filamentos=3, largo_filamento=24, semilla=0, n_jobs=1,
+             regresor='svr', max_filas_regresor=2000, repeticiones=20, endpoints=True):
+    parametros = dict(
+        n_clientes=n_clientes, m_lecturas=m_lecturas, filamentos=filamentos, largo_filamento=largo_filamento,
+        semilla=semilla, n_jobs=n_jobs, regresor=regresor, max_filas_regresor=max_filas_regresor,
+        repeticiones=repeticiones
+    )
+    df = generar_datos(n_clientes, m_lecturas, filamentos, largo_filamento, semilla)
+    df_resultado, paquetes, entrenamiento = medir_entrenamiento(
+        df, n_jobs=n_jobs, regresor=regresor, max_filas_regresor=max_filas_regresor
+    )
+    reporte = {
+        'creado': datetime.now().isoformat(timespec='seconds'),
+        'entorno': entorno(),
+        'parametros': parametros,
+        'filas': len(df),
+        'entrenamiento': entrenamiento,
+    }
+    if endpoints:
+        reporte['servicio'] = medir_endpoints(df_resultado, paquetes, repeticiones)
+    return reporte
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Benchmark de entrenamiento y endpoints con datos sintéticos')
+    parser.add_argument('--clientes', type=int, default=10)
+    parser.add_argument('--lecturas', type=int, default=2000, help='Lecturas horarias por cliente')
+    parser.add_argument('--filamentos', type=int, default=3, help='Filamentos de anomalías por cliente')
+    parser.add_argument('--largo-filamento', type=int, default=24)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--regresor', default='svr')
+    parser.add_argument('--max-filas-regresor', type=int, default=2000)
+    parser.add_argument('--repeticiones', type=int, default=20, help='Repeticiones por endpoint (sin caché y con caché)')
+    parser.add_argument('--sin-endpoints', action='store_true')
+    parser.add_argument('--salida', default=None, help='Archivo JSON del reporte (por defecto, la salida estándar)')
+    args = parser.parse_args(argumentos)
+
+    # El almacén se lee de CONTUGAS_DATA_DIR al importarse: sin un directorio
+    # explícito se usa uno temporal para no tocar los datos del proyecto
+    if not os.environ.get('CONTUGAS_DATA_DIR'):
+        os.environ['CONTUGAS_DATA_DIR'] = tempfile.mkdtemp(prefix='contugas_benchmark_')
+
+    reporte = ejecutar(
+        args.clientes, args.lecturas, args.filamentos, args.largo_filamento, args.semilla, args.n_jobs,
+        args.regresor, args.max_filas_regresor, args.repeticiones, endpoints=not args.sin_endpoints
+    )
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False, default=str)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+        print(f"Reporte guardado en {args.salida}")
+    else:
+        sys.stdout.write(texto + '\n')
+
+
+# El pool de procesos vuelve a importar este módulo en Windows
+if __name__ == '__main__':
+    main()
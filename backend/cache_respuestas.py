@@ -0,0 +1,140 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+# ------------------------------------------------------
+# Caché de respuestas de los endpoints del dashboard.
+# En memoria: LRU con vencimiento (TTL) por entrada. Con un
+# directorio se usa además un respaldo en disco compartido por
+# todos los workers de gunicorn (un archivo por entrada, agrupado
+# por versión del modelo). Las claves llevan la versión servida,
+# así que al cambiar de modelo las entradas viejas no se usan y
+# se descartan con limpiar().
+# ------------------------------------------------------
+TTL = float(os.environ.get('CONTUGAS_CACHE_TTL', '300'))
+MAX_ENTRADAS = int(os.environ.get('CONTUGAS_CACHE_MAX', '512'))
+DIRECTORIO = os.environ.get('CONTUGAS_CACHE_DIR')
+
+
+class _RespaldoDisco:
+
+    def __init__(self, directorio, max_entradas, ttl):
+        self.directorio = directorio
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.escrituras = 0
+
+    def _ruta(self, version, clave):
+        return os.path.join(self.directorio, str(version), hashlib.sha1(clave.encode()).hexdigest())
+
+    def leer(self, version, clave):
+        ruta = self._ruta(version, clave)
+        try:
+            if time.time() - os.path.getmtime(ruta) > self.ttl:
+                return None
+            with open(ruta, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def guardar(self, version, clave, valor):
+        ruta = self._ruta(version, clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f'{ruta}.{os.getpid()}.tmp'
+        with open(temporal, 'wb') as f:
+            f.write(valor)
+        os.replace(temporal, ruta)
+
+        # Recorte de vez en cuando: se borran las entradas más antiguas
+        self.escrituras += 1
+        if self.escrituras % 32 == 0:
+            self._recortar(os.path.dirname(ruta))
+
+    def _recortar(self, directorio):
+        try:
+            entradas = [os.path.join(directorio, n) for n in os.listdir(directorio) if not n.endswith('.tmp')]
+            entradas.sort(key=lambda r: os.path.getmtime(r))
+        except OSError:
+            return
+        for ruta in entradas[:max(len(entradas) - self.max_entradas, 0)]:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def limpiar(self, version_vigente=None):
+        if not os.path.isdir(self.directorio):
+            return
+        for nombre in os.listdir(self.directorio):
+            if nombre != str(version_vigente):
+                shutil.rmtree(os.path.join(self.directorio, nombre), ignore_errors=True)
+
+
+class CacheRespuestas:
+
+    def __init__(self, max_entradas=MAX_ENTRADAS, ttl=TTL, directorio=DIRECTORIO):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.entradas = OrderedDict()
+        self.disco = _RespaldoDisco(directorio, max_entradas, ttl) if directorio else None
+        self.aciertos = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        self._cerrojo = threading.Lock()
+
+    def obtener(self, version, clave):
+        with self._cerrojo:
+            entrada = self.entradas.get((version, clave))
+            if entrada is not None:
+                if entrada[0] >= time.monotonic():
+                    self.entradas.move_to_end((version, clave))
+                    self.aciertos += 1
+                    return entrada[1]
+                del self.entradas[(version, clave)]
+
+        valor = self.disco.leer(version, clave) if self.disco else None
+        with self._cerrojo:
+            if valor is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            self.aciertos_disco += 1
+            self._guardar_memoria(version, clave, valor)
+        return valor
+
+    def _guardar_memoria(self, version, clave, valor):
+        self.entradas[(version, clave)] = (time.monotonic() + self.ttl, valor)
+        self.entradas.move_to_end((version, clave))
+        while len(self.entradas) > self.max_entradas:
+            self.entradas.popitem(last=False)
+
+    def guardar(self, version, clave, valor):
+        with self._cerrojo:
+            self._guardar_memoria(version, clave, valor)
+        if self.disco:
+            self.disco.guardar(version, clave, valor)
+
+    def limpiar(self, version_vigente=None):
+        # Se llama al cambiar el modelo servido
+        with self._cerrojo:
+            self.entradas.clear()
+        if self.disco:
+            self.disco.limpiar(version_vigente)
+
+    def estadisticas(self):
+        with self._cerrojo:
+            consultas = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'aciertos_disco': self.aciertos_disco,
+                'fallos': self.fallos,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else None,
+                'entradas': len(self.entradas),
+                'max_entradas': self.max_entradas,
+                'ttl': self.ttl,
+                'disco': self.disco.directorio if self.disco else None,
+                'pid': os.getpid(),
+            }
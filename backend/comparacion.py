@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+import almacen
+from modelo import CLASES_RIESGO
+
+# ------------------------------------------------------
+# Comparación de dos versiones del almacén, cliente por cliente.
+# De cada versión se abren solo las columnas necesarias (memory-map)
+# y se copia a memoria un cliente a la vez, así el costo en memoria
+# lo fija el cliente más grande. Los totales se acumulan como sumas,
+# sin guardar los datos de los clientes ya procesados.
+# ------------------------------------------------------
+COLUMNAS_COMPARACION = ['Fecha', 'Residual', 'outlier', 'Riesgo']
+
+
+def _alinear(actual, nuevo):
+    # Filas comunes por fecha; las fechas repetidas se emparejan por orden
+    # de aparición. Con las mismas fechas (mismos datos de entrada) no se une.
+    fechas_actual = actual['Fecha'].to_numpy()
+    fechas_nuevo = nuevo['Fecha'].to_numpy()
+    if len(fechas_actual) == len(fechas_nuevo) and np.array_equal(fechas_actual, fechas_nuevo):
+        return actual.reset_index(drop=True), nuevo.reset_index(drop=True)
+    actual = actual.assign(_n=actual.groupby('Fecha').cumcount())
+    nuevo = nuevo.assign(_n=nuevo.groupby('Fecha').cumcount())
+    columnas = [c for c in actual.columns if c not in ('Fecha', '_n') and c in nuevo.columns]
+    comunes = actual.merge(nuevo, on=['Fecha', '_n'], suffixes=('_actual', '_nuevo'))
+    return (
+        comunes[[f'{c}_actual' for c in columnas]].set_axis(columnas, axis=1),
+        comunes[[f'{c}_nuevo' for c in columnas]].set_axis(columnas, axis=1),
+    )
+
+
+def _errores(df):
+    # (n, suma |residual|, suma residual^2) sin contar los NaN
+    if df is None or 'Residual' not in df.columns:
+        return 0, 0.0, 0.0
+    residual = df['Residual'].to_numpy(dtype=np.float64)
+    residual = residual[~np.isnan(residual)]
+    return len(residual), float(np.abs(residual).sum()), float(np.square(residual).sum())
+
+
+def _cociente(a, b):
+    return a / b if b else None
+
+
+def _riesgo(df):
+    if 'Riesgo' not in df.columns:
+        return np.full(len(df), CLASES_RIESGO[-1], dtype=object)
+    return df['Riesgo'].astype(object).fillna(CLASES_RIESGO[-1]).to_numpy()
+
+
+def comparar_cliente(actual, nuevo):
+    # actual / nuevo: filas del cliente en cada versión (o None si no está)
+    n_actual, abs_actual, cuad_actual = _errores(actual)
+    n_nuevo, abs_nuevo, cuad_nuevo = _errores(nuevo)
+    fila = {
+        'filas_actual': 0 if actual is None else len(actual),
+        'filas_nuevo': 0 if nuevo is None else len(nuevo),
+        'mae_actual': _cociente(abs_actual, n_actual),
+        'mae_nuevo': _cociente(abs_nuevo, n_nuevo),
+        'mse_actual': _cociente(cuad_actual, n_actual),
+        'mse_nuevo': _cociente(cuad_nuevo, n_nuevo),
+    }
+    sumas = {'n_actual': n_actual, 'abs_actual': abs_actual, 'cuad_actual': cuad_actual,
+             'n_nuevo': n_nuevo, 'abs_nuevo': abs_nuevo, 'cuad_nuevo': cuad_nuevo}
+    if actual is None or nuevo is None:
+        return fila, sumas, pd.Series(dtype=np.int64)
+
+    a, b = _alinear(actual, nuevo)
+    outlier_a = a['outlier'].to_numpy(dtype=bool)
+    outlier_b = b['outlier'].to_numpy(dtype=bool)
+    ambos = int((outlier_a & outlier_b).sum())
+    alguno = int((outlier_a | outlier_b).sum())
+    riesgo_a, riesgo_b = _riesgo(a), _riesgo(b)
+    cambios = int((riesgo_a != riesgo_b).sum())
+    transiciones = pd.Series(1, index=pd.MultiIndex.from_arrays([riesgo_a, riesgo_b])).groupby(level=[0, 1]).sum()
+
+    fila.update({
+        'filas_comunes': len(a),
+        'outliers_actual': int(outlier_a.sum()),
+        'outliers_nuevo': int(outlier_b.sum()),
+        'outliers_ambos': ambos,
+        # Intersección sobre unión de los outliers de las filas comunes
+        'coincidencia_outlier': _cociente(ambos, alguno),
+        'cambios_riesgo': cambios,
+        'tasa_cambio_riesgo': _cociente(cambios, len(a)),
+    })
+    sumas.update({'comunes': len(a), 'ambos': ambos, 'alguno': alguno, 'cambios': cambios})
+    return fila, sumas, transiciones
+
+
+def comparar_versiones(version_actual, version_nueva):
+    # Reporte por cliente (MAE, MSE, coincidencia de outliers y cambio de
+    # clase de riesgo) más los totales y la matriz de transiciones de riesgo
+    tabla_actual = almacen.abrir_tabla(version_actual, COLUMNAS_COMPARACION)
+    tabla_nueva = almacen.abrir_tabla(version_nueva, COLUMNAS_COMPARACION)
+    particiones_actual = almacen.leer_meta(version_actual)['clientes']
+    particiones_nueva = almacen.leer_meta(version_nueva)['clientes']
+
+    def cliente(tabla, particiones, cliente_id):
+        if cliente_id not in particiones:
+            return None
+        a, b = particiones[cliente_id]
+        return tabla.slice(a, b - a).to_pandas()
+
+    clientes = []
+    totales = {}
+    transiciones = pd.Series(dtype=np.int64)
+    for cliente_id in sorted(set(particiones_actual) | set(particiones_nueva)):
+        fila, sumas, cambios = comparar_cliente(
+            cliente(tabla_actual, particiones_actual, cliente_id),
+            cliente(tabla_nueva, particiones_nueva, cliente_id),
+        )
+        clientes.append({'cliente': cliente_id, **fila})
+        for clave, valor in sumas.items():
+            totales[clave] = totales.get(clave, 0) + valor
+        transiciones = transiciones.add(cambios, fill_value=0)
+
+    total = {
+        'clientes': len(clientes),
+        'mae_actual': _cociente(totales.get('abs_actual', 0.0), totales.get('n_actual', 0)),
+        'mae_nuevo': _cociente(totales.get('abs_nuevo', 0.0), totales.get('n_nuevo', 0)),
+        'mse_actual': _cociente(totales.get('cuad_actual', 0.0), totales.get('n_actual', 0)),
+        'mse_nuevo': _cociente(totales.get('cuad_nuevo', 0.0), totales.get('n_nuevo', 0)),
+        'filas_comunes': totales.get('comunes', 0),
+        'coincidencia_outlier': _cociente(totales.get('ambos', 0), totales.get('alguno', 0)),
+        'tasa_cambio_riesgo': _cociente(totales.get('cambios', 0), totales.get('comunes', 0)),
+    }
+    return {
+        'version_actual': version_actual,
+        'version_nueva': version_nueva,
+        'total': total,
+        'transiciones_riesgo': [
+            {'de': de, 'a': a, 'filas': int(n)} for (de, a), n in transiciones.items()
+        ],
+        'clientes': clientes,
+    }
@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import almacen
+from consulta import CLAVES_ORDEN, IndiceConsulta
+from cubos import CuboAgregados
+
+# ------------------------------------------------------
+# Conjunto de datos que sirve el dashboard: el resultado de una
+# versión del modelo con su índice y sus cubos ya construidos.
+# Se arma completo fuera de las peticiones y después se publica
+# con una sola asignación, así que cada petición trabaja con un
+# conjunto consistente de principio a fin.
+# ------------------------------------------------------
+RUTA_EXCEL_LEGADO = os.path.join(almacen.DATA_DIR, 'resultado_modelo_actual.xlsx')
+
+# Columnas que usa el dashboard; el resto queda solo en el almacén
+COLUMNAS_SERVICIO = [
+    'Numero_Cliente', 'Fecha', 'Presion', 'Temperatura', 'Volumen',
+    'Volumen_Predicho', 'Residual', 'outlier', 'Riesgo'
+]
+COLUMNAS_CATEGORICAS = ('Numero_Cliente', 'Riesgo')
+
+
+def compactar(df):
+    # Representación compacta: fechas int64 (ns), cliente y riesgo como
+    # códigos categóricos y medidas en float32. No quedan objetos Python
+    # por fila, así las páginas se comparten entre workers sin copiarse.
+    columnas = {}
+    for col in COLUMNAS_SERVICIO:
+        if col not in df.columns:
+            continue
+        serie = df[col]
+        if col in COLUMNAS_CATEGORICAS:
+            # Categorías en orden alfabético (como agrupa pandas el texto) y no
+            # en el del diccionario de origen, que cambia según cómo se escribió
+            serie = serie.astype('category')
+            columnas[col] = serie.cat.reorder_categories(sorted(serie.cat.categories))
+        elif col == 'Fecha':
+            columnas[col] = pd.to_datetime(serie).astype('datetime64[ns]')
+        elif col == 'outlier':
+            columnas[col] = serie.fillna(False).astype(bool)
+        else:
+            columnas[col] = pd.to_numeric(serie, errors='coerce').astype(np.float32)
+    return pd.DataFrame(columnas)
+
+
+def _leer_excel_legado(ruta):
+    df = pd.read_excel(ruta)
+
+    # Limpiar y convertir columnas relevantes
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    df['Volumen'] = pd.to_numeric(df['Volumen'], errors='coerce')
+    df['Presion'] = pd.to_numeric(df['Presion'], errors='coerce')
+    df['Temperatura'] = pd.to_numeric(df['Temperatura'], errors='coerce')
+
+    # Convertir columna 'outlier' a booleano si existe
+    if 'outlier' in df.columns:
+        df['outlier'] = df['outlier'].astype(str).str.strip().str.upper().map({
+            'VERDADERO': True, 'FALSO': False, 'TRUE': True, 'FALSE': False
+        }).fillna(False)
+
+    # Eliminar registros sin fecha válida
+    return df.dropna(subset=['Fecha'])
+
+
+class ConjuntoDatos:
+
+    def __init__(self, df, version=None, agregados=None, cubo=None):
+        # agregados: (arreglos, meta) de agregados(), p. ej. leídos del almacén;
+        # cubo: CuboAgregados ya armado para estas filas
+        self.version = version
+        arreglos, meta = agregados or ({}, None)
+
+        # Índice de consulta compartido por todos los endpoints
+        ordenes = {c: (arreglos[f'orden_{c}'], arreglos[f'rango_{c}']) for c in CLAVES_ORDEN if f'orden_{c}' in arreglos}
+        self.indice = IndiceConsulta(df, ordenes)
+        self.df = self.indice.df
+
+        # Cubos pre-agregados (cliente x día x hora x riesgo) para KPIs y mapa
+        # de calor. Solo son exactos si las lecturas caen en horas completas.
+        if cubo is None:
+            cubo = CuboAgregados(self.df, (arreglos, meta['cubo']) if meta else None)
+        self.cubo = cubo
+
+    def agregados(self):
+        # Órdenes de la tabla y cubos como arreglos para guardarlos en el almacén
+        arreglos, meta_cubo = self.cubo.arreglos()
+        for clave in CLAVES_ORDEN:
+            arreglos[f'orden_{clave}'], arreglos[f'rango_{clave}'] = self.indice.orden(clave)
+        return arreglos, {'cubo': meta_cubo}
+
+
+def _cubo_extendido(base, nuevas):
+    # Cubos guardados de la versión base más las filas nuevas: solo se
+    # actualizan las celdas y semanas de los clientes que reciben lecturas
+    agregados = almacen.leer_agregados(base)
+    if agregados is None:
+        return None
+    arreglos, meta = agregados
+    cubo = CuboAgregados(None, (arreglos, meta['cubo']))
+    cubo.agregar(compactar(nuevas))
+    return cubo
+
+
+def preparar_servicio(version, base=None, nuevas=None):
+    # Deja en el almacén la copia compacta, el índice y los cubos de la
+    # versión. Se llama al publicarla; si falta algo (versiones anteriores)
+    # lo completa el primer proceso que la carga. Los demás workers y las
+    # recargas abren todo con memory-map, sin copiar ni recalcular.
+    # Con base y nuevas (version = base + nuevas, ver
+    # almacen.agregar_resultado) los cubos parten de los de la base.
+    df = almacen.leer_servicio(version)
+    if df is None:
+        df = compactar(almacen.leer_dataframe(version, COLUMNAS_SERVICIO))
+        try:
+            almacen.guardar_servicio(version, df)
+            df = almacen.leer_servicio(version)
+        except OSError as e:
+            print(f"No se pudo guardar la copia compacta de {version}: {e}")
+            return ConjuntoDatos(df, version)
+
+    agregados = almacen.leer_agregados(version)
+    if agregados is not None:
+        return ConjuntoDatos(df, version, agregados)
+
+    cubo = _cubo_extendido(base, nuevas) if base and nuevas is not None else None
+    conjunto = ConjuntoDatos(df, version, cubo=cubo)
+    if not len(conjunto.df):
+        return conjunto
+    try:
+        almacen.guardar_agregados(version, *conjunto.agregados())
+    except OSError as e:
+        print(f"No se pudieron guardar el índice y los cubos de {version}: {e}")
+        return conjunto
+    # Se vuelve a abrir desde el almacén para compartir las páginas
+    return ConjuntoDatos(df, version, almacen.leer_agregados(version))
+
+
+def cargar_conjunto(version=None):
+    # Sin versión en el almacén se usa el Excel heredado
+    if not version:
+        return ConjuntoDatos(compactar(_leer_excel_legado(RUTA_EXCEL_LEGADO)))
+    return preparar_servicio(version)
@@ -0,0 +1,244 @@
+import numpy as np
+import pandas as pd
+
+
+def _a_nanosegundos(fecha):
+    return pd.Timestamp(pd.to_datetime(fecha)).as_unit('ns').value
+
+
+# Orden de la tabla de registros: de más a menos grave; los registros sin
+# riesgo van después y cualquier otro valor ('Sin riesgo') al final
+ORDEN_RIESGO = {'Alto': 0, 'Medio': 1, 'Bajo': 2}
+CLAVES_ORDEN = ('riesgo', 'residual', 'fecha')
+
+
+def _contar(estadisticas, filas):
+    # estadisticas: dict opcional donde se acumulan las filas leídas (métricas)
+    if estadisticas is not None:
+        estadisticas['filas_recorridas'] = estadisticas.get('filas_recorridas', 0) + int(filas)
+
+
+def _ordenado(df):
+    clientes = df['Numero_Cliente']
+    if not clientes.is_monotonic_increasing:
+        return False
+    mismo_cliente = clientes.to_numpy()[1:] == clientes.to_numpy()[:-1]
+    fechas = df['Fecha'].to_numpy(dtype='datetime64[ns]')
+    return bool((fechas[1:][mismo_cliente] >= fechas[:-1][mismo_cliente]).all())
+
+
+# ------------------------------------------------------
+# Índice columnar para los filtros del dashboard.
+# Se construye una sola vez al cargar el resultado del modelo:
+# los datos quedan ordenados por (Numero_Cliente, Fecha), cada
+# cliente tiene su rango de filas [inicio, fin) y las fechas se
+# resuelven por búsqueda binaria dentro de ese rango. El riesgo
+# se guarda como códigos categóricos. Los órdenes de la tabla
+# pueden venir ya calculados (ver conjunto.preparar_servicio).
+# ------------------------------------------------------
+class IndiceConsulta:
+
+    def __init__(self, df, ordenes=None):
+        # El almacén ya entrega los datos ordenados; solo se ordena si hace falta
+        if not _ordenado(df):
+            df = df.sort_values(['Numero_Cliente', 'Fecha'], kind='stable')
+        df = df.reset_index(drop=True)
+        self.df = df
+
+        clientes = df['Numero_Cliente'].to_numpy()
+        cortes = np.flatnonzero(clientes[1:] != clientes[:-1]) + 1
+        inicios = np.r_[0, cortes] if len(df) else np.array([], dtype=int)
+        fines = np.r_[cortes, len(df)] if len(df) else np.array([], dtype=int)
+        self.rangos_cliente = {
+            clientes[i]: (int(i), int(f)) for i, f in zip(inicios, fines)
+        }
+
+        self.fechas = df['Fecha'].to_numpy(dtype='datetime64[ns]').view('i8')
+
+        # {clave: (orden, rango)} sobre estas mismas filas
+        self._ordenes = dict(ordenes or {})
+        self._frecuencias_riesgo = None
+
+        if 'Riesgo' in df.columns:
+            riesgo = pd.Categorical(df['Riesgo'])
+            self.categorias_riesgo = list(riesgo.categories)
+            self.codigos_riesgo = np.asarray(riesgo.codes)
+        else:
+            self.categorias_riesgo = []
+            self.codigos_riesgo = None
+
+    def __len__(self):
+        return len(self.df)
+
+    def rangos(self, cliente=None, inicio=None, fin=None):
+        # Lista de rangos [a, b) de filas que cumplen cliente y fechas
+        if cliente and cliente.lower() != 'todos':
+            rango = self.rangos_cliente.get(cliente)
+            candidatos = [rango] if rango else []
+        else:
+            candidatos = list(self.rangos_cliente.values())
+
+        desde = _a_nanosegundos(inicio) if inicio else None
+        hasta = _a_nanosegundos(fin) if fin else None
+
+        rangos = []
+        for a, b in candidatos:
+            fechas = self.fechas[a:b]
+            if desde is not None:
+                a = a + int(np.searchsorted(fechas, desde, side='left'))
+                fechas = self.fechas[a:b]
+            if hasta is not None:
+                b = a + int(np.searchsorted(fechas, hasta, side='right'))
+            if b > a:
+                rangos.append((a, b))
+        return rangos
+
+    def codigos(self, riesgos, riesgo_nulo=''):
+        # Códigos categóricos que corresponden a la lista de riesgos;
+        # los registros sin riesgo (código -1) se tratan como riesgo_nulo
+        codigos = [self.categorias_riesgo.index(r) for r in riesgos if r in self.categorias_riesgo]
+        if riesgo_nulo in riesgos:
+            codigos.append(-1)
+        return np.array(codigos, dtype=self.codigos_riesgo.dtype)
+
+    def posiciones(self, cliente=None, inicio=None, fin=None, riesgos=None, riesgo_nulo='', estadisticas=None):
+        # Devuelve un slice si el resultado es contiguo (sin copia) o un
+        # arreglo de posiciones de tamaño k en otro caso
+        rangos = self.rangos(cliente, inicio, fin)
+
+        if riesgos and self.codigos_riesgo is not None:
+            if not rangos:
+                return np.array([], dtype=np.int64)
+            idx = np.concatenate([np.arange(a, b) for a, b in rangos])
+            _contar(estadisticas, len(idx))
+            mascara = np.isin(self.codigos_riesgo[idx], self.codigos(riesgos, riesgo_nulo))
+            return idx[mascara]
+
+        if not rangos:
+            return slice(0, 0)
+        if len(rangos) == 1 or rangos[-1][1] - rangos[0][0] == sum(b - a for a, b in rangos):
+            return slice(rangos[0][0], rangos[-1][1])
+        return np.concatenate([np.arange(a, b) for a, b in rangos])
+
+    def bloques(self, cliente=None, inicio=None, fin=None, riesgos=None, riesgo_nulo='', tamano=50000,
+                estadisticas=None):
+        # Mismas filas que posiciones(), en orden y de a lo sumo `tamano` filas
+        # recorridas por bloque, sin armar el arreglo completo de posiciones
+        codigos = self.codigos(riesgos, riesgo_nulo) if riesgos and self.codigos_riesgo is not None else None
+        for a, b in self.rangos(cliente, inicio, fin):
+            for desde in range(a, b, tamano):
+                hasta = min(desde + tamano, b)
+                if codigos is None:
+                    yield slice(desde, hasta)
+                    continue
+                _contar(estadisticas, hasta - desde)
+                mascara = np.isin(self.codigos_riesgo[desde:hasta], codigos)
+                if mascara.any():
+                    yield desde + np.flatnonzero(mascara)
+
+    def filtrar(self, cliente=None, inicio=None, fin=None, riesgos=None, riesgo_nulo=''):
+        return self.df.iloc[self.posiciones(cliente, inicio, fin, riesgos, riesgo_nulo)]
+
+    def rango_fechas(self, cliente=None):
+        rangos = self.rangos(cliente)
+        if not rangos:
+            return None, None
+        minimo = min(self.fechas[a] for a, _ in rangos)
+        maximo = max(self.fechas[b - 1] for _, b in rangos)
+        return pd.Timestamp(minimo), pd.Timestamp(maximo)
+
+    def _clave(self, clave):
+        # Menor = primero. Los empates quedan en el orden del índice
+        # (cliente, fecha), así el orden total es estable.
+        if clave == 'riesgo':
+            if self.codigos_riesgo is None:
+                return np.zeros(len(self.df), dtype=np.int8)
+            rangos = np.array([ORDEN_RIESGO.get(c, 4) for c in self.categorias_riesgo] + [3], dtype=np.int8)
+            return rangos[self.codigos_riesgo]
+        if clave == 'residual':
+            if 'Residual' not in self.df.columns:
+                return np.zeros(len(self.df))
+            residual = np.abs(self.df['Residual'].to_numpy(dtype=np.float64))
+            return np.where(np.isnan(residual), np.inf, -residual)
+        if clave == 'fecha':
+            return -self.fechas
+        raise ValueError(f"Clave de orden desconocida: {clave}")
+
+    def orden(self, clave):
+        # (posiciones en orden global, rango de cada posición); se calcula
+        # una vez por clave y se reutiliza en todas las páginas
+        if clave not in self._ordenes:
+            tipo = np.int32 if len(self.df) < 2**31 else np.int64
+            orden = np.argsort(self._clave(clave), kind='stable').astype(tipo)
+            rango = np.empty_like(orden)
+            rango[orden] = np.arange(len(orden), dtype=tipo)
+            self._ordenes[clave] = (orden, rango)
+        return self._ordenes[clave]
+
+    def _pagina_parcial(self, rango, rangos, codigos, despues, limite, estadisticas=None):
+        # Selección parcial sobre los k registros filtrados: O(k)
+        posiciones = np.concatenate([np.arange(a, b) for a, b in rangos])
+        _contar(estadisticas, len(posiciones))
+        if codigos is not None:
+            posiciones = posiciones[np.isin(self.codigos_riesgo[posiciones], codigos)]
+        rangos_filtro = rango[posiciones]
+        rangos_filtro = rangos_filtro[rangos_filtro > despues]
+        if len(rangos_filtro) > limite:
+            rangos_filtro = np.partition(rangos_filtro, limite - 1)[:limite]
+        rangos_filtro.sort()
+        return rangos_filtro
+
+    def _pagina_recorrido(self, orden, rangos, codigos, despues, limite, esperados, presupuesto, estadisticas=None):
+        # Recorre el orden global a partir del cursor; con k registros
+        # filtrados se leen en promedio limite * n / k posiciones. Devuelve
+        # None si se agota el presupuesto sin completar la página.
+        inicios = np.array([a for a, _ in rangos])
+        fines = np.array([b for _, b in rangos])
+        bloque = max(limite * len(orden) // max(esperados, 1) * 2, 256)
+        elegidos, encontrados = [], 0
+        desde = despues + 1
+        while desde < len(orden) and encontrados < limite:
+            if desde - despues > presupuesto:
+                return None
+            candidatos = orden[desde:desde + bloque]
+            _contar(estadisticas, len(candidatos))
+            i = np.searchsorted(inicios, candidatos, side='right') - 1
+            dentro = (i >= 0) & (candidatos < fines[np.maximum(i, 0)])
+            if codigos is not None:
+                dentro &= np.isin(self.codigos_riesgo[candidatos], codigos)
+            elegidos.append(np.flatnonzero(dentro) + desde)
+            encontrados += len(elegidos[-1])
+            desde += bloque
+        return np.concatenate(elegidos)[:limite] if elegidos else np.array([], dtype=np.int64)
+
+    def pagina(self, clave='riesgo', cliente=None, inicio=None, fin=None, riesgos=None,
+               despues=-1, limite=30, riesgo_nulo='', estadisticas=None):
+        # Devuelve las posiciones de los siguientes `limite` registros del
+        # filtro en el orden de `clave` cuyo rango global es mayor que
+        # `despues` (el cursor), y el rango del último devuelto
+        orden, rango = self.orden(clave)
+        rangos = self.rangos(cliente, inicio, fin)
+        total = sum(b - a for a, b in rangos)
+        if total == 0 or limite <= 0:
+            return np.array([], dtype=np.int64), None
+
+        codigos = None
+        esperados = total
+        if riesgos and self.codigos_riesgo is not None:
+            codigos = self.codigos(riesgos, riesgo_nulo)
+            # Estimación de los registros filtrados según la frecuencia global de los riesgos
+            if self._frecuencias_riesgo is None:
+                self._frecuencias_riesgo = np.bincount(self.codigos_riesgo + 1, minlength=len(self.categorias_riesgo) + 1)
+            frecuencias = self._frecuencias_riesgo
+            esperados = total * frecuencias[codigos + 1].sum() // max(len(self.df), 1)
+
+        rangos_filtro = None
+        if esperados * 8 > len(self.df):
+            rangos_filtro = self._pagina_recorrido(orden, rangos, codigos, despues, limite, esperados, presupuesto=total,
+                                                   estadisticas=estadisticas)
+        if rangos_filtro is None:
+            rangos_filtro = self._pagina_parcial(rango, rangos, codigos, despues, limite, estadisticas)
+
+        if len(rangos_filtro) == 0:
+            return np.array([], dtype=np.int64), None
+        return orden[rangos_filtro].astype(np.int64), int(rangos_filtro[-1])
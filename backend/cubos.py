@@ -0,0 +1,321 @@
+import numpy as np
+import pandas as pd
+
+MEDIDAS = ['Volumen', 'Presion', 'Temperatura']
+
+# Estadísticos por celda (hora, riesgo): conteos en int32 (registros y
+# valores válidos de cada medida), outliers y suma / suma de cuadrados
+# de cada medida en float32. En los días acumulados los outliers se
+# guardan por hora del día (para el mapa de calor) y su total se deriva
+# de esas 24 posiciones; las sumas acumuladas van en float64. Las horas
+# (desde 1970) se guardan en int32.
+CONTEOS = ['n'] + [f'{m}_n' for m in MEDIDAS]
+SUMAS = [f'{m}_{e}' for m in MEDIDAS for e in ('suma', 'suma2')]
+N_CONTEOS = len(CONTEOS)
+HORAS_DIA = 24
+# Columnas del resultado de una consulta: conteos, sumas y outliers por hora
+T_SUMAS = slice(N_CONTEOS, N_CONTEOS + len(SUMAS))
+T_OUTLIERS = slice(T_SUMAS.stop, T_SUMAS.stop + HORAS_DIA)
+N_TOTAL = T_OUTLIERS.stop
+
+HORA_NS = 3_600_000_000_000
+DIAS_ES = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+
+def _dia_semana(dia):
+    # El día 0 de la época (1970-01-01) fue jueves
+    return (dia + 3) % 7
+
+
+def _a_hora(fecha, redondeo):
+    ns = pd.Timestamp(pd.to_datetime(fecha)).as_unit('ns').value
+    return -(-ns // HORA_NS) if redondeo == 'arriba' else ns // HORA_NS
+
+
+def _sumar_por_clave(claves, *valores):
+    # Suma las filas de cada arreglo por clave; devuelve las claves únicas
+    # ordenadas y las sumas (reduceat sobre el orden estable de las claves)
+    orden = np.argsort(claves, kind='stable')
+    claves = claves[orden]
+    inicios = np.r_[0, np.flatnonzero(claves[1:] != claves[:-1]) + 1]
+    return claves[inicios], [np.add.reduceat(v[orden], inicios, axis=0, dtype=v.dtype) for v in valores]
+
+
+class _CuboCliente:
+    # Cubo de un cliente en dos niveles:
+    #  - celdas por (hora, riesgo), ordenadas por hora, para los bordes del rango
+    #  - sumas acumuladas por semana de las celdas diarias, de forma que un
+    #    rango de días completos se resuelve con dos lecturas por día de la
+    #    semana (los días sueltos se obtienen como diferencia de semanas)
+
+    def __init__(self, horas, riesgos, conteos, outliers, sumas, n_riesgos, acumulados=None):
+        # acumulados: (acum_conteos, acum_sumas) ya calculados para estas celdas
+        self.n_riesgos = n_riesgos
+        self.horas = horas
+        self.riesgos = riesgos
+        self.conteos = conteos
+        self.outliers = outliers
+        self.sumas = sumas
+        if acumulados is None:
+            self._construir_dias()
+        else:
+            self.base = int(self.horas[0] // 24)
+            self.acum_conteos, self.acum_sumas = acumulados
+
+    def _construir_dias(self):
+        # (semana, día, riesgo, estadístico) con una semana inicial en cero
+        self.base = int(self.horas[0] // 24)
+        n_semanas = -(-(int(self.horas[-1] // 24) - self.base + 1) // 7)
+        forma = (n_semanas + 1, 7, self.n_riesgos)
+        self.acum_conteos = np.zeros(forma + (N_CONTEOS + HORAS_DIA,), dtype=np.int32)
+        self.acum_sumas = np.zeros(forma + (len(SUMAS),))
+        self._acumular(self.horas, self.riesgos, self.conteos, self.outliers, self.sumas)
+
+    def _acumular(self, horas, riesgos, conteos, outliers, sumas):
+        # Suma las celdas a las semanas acumuladas desde la primera que tocan
+        if not self.acum_conteos.flags.writeable:
+            # Los acumulados abiertos desde el almacén son de solo lectura
+            self.acum_conteos = np.array(self.acum_conteos, copy=True)
+            self.acum_sumas = np.array(self.acum_sumas, copy=True)
+        dias = horas // 24 - self.base
+        desde = int(dias.min()) // 7
+        semanas = dias // 7 - desde
+        forma = (len(self.acum_conteos) - 1 - desde, 7, self.n_riesgos)
+        delta_conteos = np.zeros(forma + (N_CONTEOS + HORAS_DIA,), dtype=np.int32)
+        delta_sumas = np.zeros(forma + (len(SUMAS),))
+        celda = (semanas, dias % 7, riesgos)
+        np.add.at(delta_conteos, celda + (slice(None, N_CONTEOS),), conteos)
+        np.add.at(delta_conteos, celda + (N_CONTEOS + horas % 24,), outliers)
+        np.add.at(delta_sumas, celda, sumas)
+        self.acum_conteos[desde + 1:] += np.cumsum(delta_conteos, axis=0, dtype=np.int32)
+        self.acum_sumas[desde + 1:] += np.cumsum(delta_sumas, axis=0)
+
+    def ampliar_riesgos(self, n_riesgos):
+        extra = n_riesgos - self.n_riesgos
+        if extra <= 0:
+            return
+        self.n_riesgos = n_riesgos
+        self.acum_conteos = np.pad(self.acum_conteos, ((0, 0), (0, 0), (0, extra), (0, 0)))
+        self.acum_sumas = np.pad(self.acum_sumas, ((0, 0), (0, 0), (0, extra), (0, 0)))
+
+    def agregar(self, horas, riesgos, conteos, outliers, sumas):
+        # Fusiona nuevas celdas horarias y actualiza solo las semanas afectadas
+        claves, (self.conteos, self.outliers, self.sumas) = _sumar_por_clave(
+            np.concatenate([self.horas, horas]).astype(np.int64) * self.n_riesgos + np.concatenate([self.riesgos, riesgos]),
+            np.concatenate([self.conteos, conteos]),
+            np.concatenate([self.outliers, outliers]),
+            np.concatenate([self.sumas, sumas]),
+        )
+        self.horas = (claves // self.n_riesgos).astype(np.int32)
+        self.riesgos = (claves % self.n_riesgos).astype(np.int8)
+
+        if int(horas.min() // 24) < self.base:
+            self._construir_dias()
+            return
+        n_semanas = -(-(int(self.horas[-1] // 24) - self.base + 1) // 7)
+        faltan = n_semanas + 1 - len(self.acum_conteos)
+        if faltan > 0:
+            # Las semanas nuevas empiezan con el acumulado de la última
+            self.acum_conteos = np.pad(self.acum_conteos, ((0, faltan), (0, 0), (0, 0), (0, 0)), mode='edge')
+            self.acum_sumas = np.pad(self.acum_sumas, ((0, faltan), (0, 0), (0, 0), (0, 0)), mode='edge')
+        self._acumular(horas, riesgos, conteos, outliers, sumas)
+
+    def sumar(self, hora_desde, hora_hasta, total):
+        # Suma en total (7 días de la semana x riesgo x N_TOTAL) las celdas
+        # con hora en [hora_desde, hora_hasta]
+        hora_desde = max(hora_desde, int(self.horas[0]))
+        hora_hasta = min(hora_hasta, int(self.horas[-1]))
+        if hora_desde > hora_hasta:
+            return False
+
+        dia_a = -(-hora_desde // 24)
+        dia_b = (hora_hasta + 1) // 24
+        if dia_a >= dia_b:
+            self._sumar_horas(hora_desde, hora_hasta, total)
+            return True
+
+        self._sumar_horas(hora_desde, dia_a * 24 - 1, total)
+        self._sumar_dias(dia_a - self.base, dia_b - self.base, total)
+        self._sumar_horas(dia_b * 24, hora_hasta, total)
+        return True
+
+    def _sumar_horas(self, hora_desde, hora_hasta, total):
+        a = np.searchsorted(self.horas, hora_desde, side='left')
+        b = np.searchsorted(self.horas, hora_hasta, side='right')
+        if b > a:
+            horas = self.horas[a:b]
+            celda = (_dia_semana(horas // 24), self.riesgos[a:b])
+            np.add.at(total, celda + (slice(None, N_CONTEOS),), self.conteos[a:b])
+            np.add.at(total, celda + (T_SUMAS,), self.sumas[a:b])
+            np.add.at(total, celda + (T_OUTLIERS.start + horas % 24,), self.outliers[a:b])
+
+    def _sumar_dias(self, a, b, total):
+        # Días [a, b) relativos a la base; para cada resto r = día % 7 se
+        # toman las semanas cuyo día r cae dentro del rango
+        r = np.arange(7)
+        semana_desde = -((r - a) // 7)
+        semana_hasta = -((r - b) // 7)
+        dia = _dia_semana(self.base + r)
+        conteos = self.acum_conteos[semana_hasta, r] - self.acum_conteos[semana_desde, r]
+        total[dia, :, :N_CONTEOS] += conteos[..., :N_CONTEOS]
+        total[dia, :, T_OUTLIERS] += conteos[..., N_CONTEOS:]
+        total[dia, :, T_SUMAS] += self.acum_sumas[semana_hasta, r] - self.acum_sumas[semana_desde, r]
+
+
+# Arreglos de CuboAgregados.arreglos(): celdas horarias y semanas acumuladas
+# de todos los clientes concatenadas; la meta guarda el rango de cada cliente
+ARREGLOS_CELDAS = ('horas', 'riesgos', 'conteos', 'outliers', 'sumas')
+ARREGLOS_SEMANAS = ('acum_conteos', 'acum_sumas')
+
+
+class CuboAgregados:
+
+    def __init__(self, df, guardado=None):
+        # guardado: (arreglos, meta) de arreglos(); si se da, no se recorre df
+        self.riesgos = ['Alto', 'Medio', 'Bajo', 'Sin riesgo', '']
+        self.clientes = {}
+        self.alineado = True
+        if guardado is None:
+            self.agregar(df)
+            return
+
+        arreglos, meta = guardado
+        self.riesgos = list(meta['riesgos'])
+        self.alineado = meta['alineado']
+        for cliente, (a, b, c, d) in meta['clientes'].items():
+            celdas = [arreglos[n][a:b] for n in ARREGLOS_CELDAS]
+            acumulados = tuple(arreglos[n][c:d] for n in ARREGLOS_SEMANAS)
+            self.clientes[cliente] = _CuboCliente(*celdas, len(self.riesgos), acumulados)
+
+    def arreglos(self):
+        cubos = list(self.clientes.values())
+        arreglos = {n: np.concatenate([getattr(c, n) for c in cubos]) for n in ARREGLOS_CELDAS + ARREGLOS_SEMANAS}
+        celdas = np.cumsum([0] + [len(c.horas) for c in cubos])
+        semanas = np.cumsum([0] + [len(c.acum_conteos) for c in cubos])
+        clientes = {
+            str(cliente): [int(celdas[i]), int(celdas[i + 1]), int(semanas[i]), int(semanas[i + 1])]
+            for i, cliente in enumerate(self.clientes)
+        }
+        return arreglos, {'riesgos': self.riesgos, 'alineado': self.alineado, 'clientes': clientes}
+
+    def _codigos_riesgo(self, serie):
+        # Los registros sin riesgo se guardan como '' (igual que fillna(''))
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            # Se traducen las categorías, no las filas
+            categorias = [str(c) for c in serie.cat.categories] + ['']
+            for r in categorias:
+                if r not in self.riesgos:
+                    self.riesgos.append(r)
+            mapa = np.array([self.riesgos.index(r) for r in categorias], dtype=np.int64)
+            return mapa[serie.cat.codes.to_numpy()]
+        valores = serie.fillna('').astype(str)
+        for r in pd.unique(valores):
+            if r not in self.riesgos:
+                self.riesgos.append(r)
+        return pd.Categorical(valores, categories=self.riesgos).codes.astype(np.int64)
+
+    def _celdas(self, df):
+        # Agrega las filas de un cliente en celdas (hora, riesgo)
+        ns = df['Fecha'].to_numpy(dtype='datetime64[ns]').view('i8')
+        horas = ns // HORA_NS
+        if 'Riesgo' in df.columns:
+            riesgos = self._codigos_riesgo(df['Riesgo'])
+        else:
+            riesgos = np.full(len(df), self.riesgos.index(''), dtype=np.int64)
+
+        conteos = np.zeros((len(df), N_CONTEOS), dtype=np.int32)
+        conteos[:, 0] = 1
+        sumas = np.zeros((len(df), len(SUMAS)))
+        for j, medida in enumerate(MEDIDAS):
+            x = pd.to_numeric(df[medida], errors='coerce').to_numpy(dtype=np.float64)
+            valido = ~np.isnan(x)
+            x = np.where(valido, x, 0.0)
+            conteos[:, 1 + j] = valido
+            sumas[:, 2 * j] = x
+            sumas[:, 2 * j + 1] = x * x
+        if 'outlier' in df.columns:
+            outliers = df['outlier'].to_numpy(dtype=np.int32)
+        else:
+            outliers = np.zeros(len(df), dtype=np.int32)
+
+        claves, (conteos, outliers, sumas) = _sumar_por_clave(horas * len(self.riesgos) + riesgos, conteos, outliers, sumas)
+        return (
+            (claves // len(self.riesgos)).astype(np.int32), (claves % len(self.riesgos)).astype(np.int8),
+            conteos, outliers, sumas.astype(np.float32), bool((ns % HORA_NS == 0).all()),
+        )
+
+    def agregar(self, df_nuevo):
+        # Actualización incremental: solo se tocan las celdas de los clientes
+        # y días presentes en df_nuevo
+        df_nuevo = df_nuevo.dropna(subset=['Fecha'])
+        if 'Riesgo' in df_nuevo.columns:
+            self._codigos_riesgo(df_nuevo['Riesgo'])
+        for cubo in self.clientes.values():
+            cubo.ampliar_riesgos(len(self.riesgos))
+
+        for cliente, grupo in df_nuevo.groupby('Numero_Cliente', sort=False, observed=True):
+            *celdas, alineado = self._celdas(grupo)
+            self.alineado = self.alineado and alineado
+            if cliente in self.clientes:
+                self.clientes[cliente].agregar(*celdas)
+            else:
+                self.clientes[cliente] = _CuboCliente(*celdas, len(self.riesgos))
+
+    def consultar(self, cliente=None, inicio=None, fin=None, riesgos=None):
+        # Devuelve (clientes con datos, matriz día de la semana x riesgo x
+        # N_TOTAL); los riesgos no seleccionados quedan en cero
+        if cliente and cliente.lower() != 'todos':
+            cubos = [self.clientes[cliente]] if cliente in self.clientes else []
+        else:
+            cubos = list(self.clientes.values())
+
+        hora_desde = _a_hora(inicio, 'arriba') if inicio else np.iinfo(np.int64).min // 2
+        hora_hasta = _a_hora(fin, 'abajo') if fin else np.iinfo(np.int64).max // 2
+
+        seleccion = np.ones(len(self.riesgos), dtype=bool)
+        if riesgos:
+            seleccion = np.isin(self.riesgos, riesgos)
+
+        total = np.zeros((7, len(self.riesgos), N_TOTAL))
+        clientes = 0
+        for cubo in cubos:
+            parcial = np.zeros_like(total)
+            if cubo.sumar(hora_desde, hora_hasta, parcial):
+                parcial[:, ~seleccion] = 0
+                if parcial[..., 0].sum() > 0:
+                    clientes += 1
+                total += parcial
+        return clientes, total
+
+    def kpis(self, cliente=None, inicio=None, fin=None, riesgos=None):
+        clientes, total = self.consultar(cliente, inicio, fin, riesgos)
+        suma = total.sum(axis=(0, 1))
+
+        def promedio(medida):
+            j = MEDIDAS.index(medida)
+            n = suma[1 + j]
+            return round(np.float64(suma[T_SUMAS.start + 2 * j] / n) if n > 0 else np.float64(np.nan), 2)
+
+        return {
+            'total_clientes': clientes,
+            'total_anomalias': int(round(suma[T_OUTLIERS].sum())),
+            'alertas_criticas': int(round(total[:, self.riesgos.index('Alto'), 0].sum())),
+            'promedio_volumen': promedio('Volumen'),
+            'promedio_presion': promedio('Presion'),
+            'promedio_temperatura': promedio('Temperatura')
+        }
+
+    def matriz_anomalias(self, cliente=None, inicio=None, fin=None, riesgos=None):
+        _, total = self.consultar(cliente, inicio, fin, riesgos)
+        conteo = np.rint(total[..., T_OUTLIERS].sum(axis=1)).astype(np.int64)
+        filas = np.flatnonzero(conteo.sum(axis=1) > 0)
+        columnas = np.flatnonzero(conteo.sum(axis=0) > 0)
+        if len(filas) == 0:
+            return pd.DataFrame()
+
+        heatmap = pd.DataFrame(
+            conteo[np.ix_(filas, columnas)],
+            index=[DIAS_ES[d] for d in filas],
+            columns=columnas
+        )
+        return heatmap.reindex(DIAS_ES)
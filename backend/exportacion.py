@@ -0,0 +1,90 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ------------------------------------------------------
+# Exportación de los registros filtrados del dashboard (CSV o
+# Parquet) como un flujo de bytes. Se recorren los rangos del
+# índice de a FILAS_BLOQUE filas y cada bloque se escribe y se
+# entrega antes de leer el siguiente: la memoria la fija el
+# tamaño del bloque y no el de la exportación, y los primeros
+# bytes salen sin esperar al resto.
+# ------------------------------------------------------
+FILAS_BLOQUE = int(os.environ.get('CONTUGAS_FILAS_BLOQUE_EXPORTACION', '50000'))
+COLUMNAS_EXPORTACION = [
+    'Numero_Cliente', 'Fecha', 'Presion', 'Temperatura', 'Volumen',
+    'Volumen_Predicho', 'Residual', 'outlier', 'Riesgo'
+]
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _bloques(consulta, al_escribir=None):
+    indice = consulta.datos.indice
+    columnas = [c for c in COLUMNAS_EXPORTACION if c in indice.df.columns]
+    for posiciones in indice.bloques(**consulta.filtro, tamano=FILAS_BLOQUE, estadisticas=consulta.estadisticas):
+        bloque = indice.df[columnas].iloc[posiciones]
+        if al_escribir:
+            al_escribir(len(bloque))
+        yield bloque
+
+
+def _csv(consulta, al_escribir=None):
+    columnas = [c for c in COLUMNAS_EXPORTACION if c in consulta.datos.indice.df.columns]
+    yield (','.join(columnas) + '\n').encode('utf-8')
+    for bloque in _bloques(consulta, al_escribir):
+        yield bloque.to_csv(index=False, header=False, date_format='%Y-%m-%d %H:%M:%S').encode('utf-8')
+
+
+class _Salida:
+    # Destino de ParquetWriter que guarda lo escrito hasta que se entrega
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self.partes.append(datos)
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def _parquet(consulta, al_escribir=None):
+    # Un grupo de filas por bloque; el pie del archivo se escribe al cerrar
+    indice = consulta.datos.indice
+    columnas = [c for c in COLUMNAS_EXPORTACION if c in indice.df.columns]
+    esquema = pa.Schema.from_pandas(indice.df[columnas].iloc[:0], preserve_index=False)
+    salida = _Salida()
+    escritor = pq.ParquetWriter(salida, esquema, compression='snappy')
+    try:
+        for bloque in _bloques(consulta, al_escribir):
+            escritor.write_table(pa.Table.from_pandas(bloque, schema=esquema, preserve_index=False))
+            yield salida.vaciar()
+    finally:
+        escritor.close()
+    yield salida.vaciar()
+
+
+def exportar(consulta, formato='csv', al_escribir=None):
+    # Generador de bytes; al_escribir(filas) se llama con cada bloque leído
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato} (usar {', '.join(FORMATOS)})")
+    return _csv(consulta, al_escribir) if formato == 'csv' else _parquet(consulta, al_escribir)
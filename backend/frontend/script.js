@@ -15,12 +15,8 @@ async function predecir() {
     contenedor.innerHTML = '<pre>' + JSON.stringify(result, null, 2) + '</pre>';
 }
 
-async function cargarKPIs() {
+function cargarKPIs(data) {
     try {
-        const url = `/kpis?${obtenerParametros()}`;
-        const response = await fetch(url);
-        const data = await response.json();
-
         // Si no hay datos o promedio_volumen es null o NaN, resetear todo a cero
         if (!data || isNaN(data.promedio_volumen)) {
             document.getElementById('clientes').innerText = 0;
@@ -50,12 +46,8 @@ async function cargarKPIs() {
         document.getElementById('temperatura').innerText = '0 °C';
     }
 }
-async function cargarGraficoConsumo() {
+function cargarGraficoConsumo(data) {
     try {
-        const url = `/grafico_volumen?${obtenerParametros()}`;
-        const response = await fetch(url);
-        const data = await response.json();
-
         const ctx = document.getElementById('graficoConsumo').getContext('2d');
         if (window.myChart) window.myChart.destroy();
 
@@ -128,12 +120,8 @@ async function cargarGraficoConsumo() {
 }
 
 
-async function cargarGraficoRiesgoCliente() {
+function cargarGraficoRiesgoCliente(data) {
     try {
-        const url = `/riesgo_por_cliente?${obtenerParametros()}`;
-        const response = await fetch(url);
-        const data = await response.json();
-
         const clientes = data.clientes;
         const riesgos = data.riesgos;
         const valores = data.valores;
@@ -185,11 +173,8 @@ async function cargarGraficoRiesgoCliente() {
 }
 
 
-async function cargarHeatmapAnomalias() {
+function cargarHeatmapAnomalias(data) {
     try {
-        const response = await fetch(`/anomalias_por_dia_hora?${obtenerParametros()}`);
-        const data = await response.json();
-
         let dias = data.dias;
         const horas = data.horas;
         let matriz = data.matriz;
@@ -282,13 +267,18 @@ async function cargarHeatmapAnomalias() {
 };
 
 
-async function cargarTablaRegistros() {
-    try {
-        const url = `/tabla_registros?${obtenerParametros()}`;
-        const response = await fetch(url);
-        const data = await response.json();
+// Registros mostrados y cursor de la página siguiente de la tabla
+let registrosTabla = [];
+let cursorTabla = null;
 
+function cargarTablaRegistros(pagina, agregar = false) {
+    try {
         const contenedor = document.getElementById('tabla-registros');
+        registrosTabla = agregar ? registrosTabla.concat(pagina.registros) : pagina.registros;
+        cursorTabla = pagina.siguiente;
+        document.getElementById('btnMasRegistros').style.display = cursorTabla ? 'inline-block' : 'none';
+
+        const data = registrosTabla;
         if (!data || data.length === 0) {
             contenedor.innerHTML = '<p>No hay registros disponibles.</p>';
             return;
@@ -328,10 +318,49 @@ async function cargarTablaRegistros() {
 
     } catch (error) {
         console.error('Error al cargar la tabla de registros:', error);
+        document.getElementById('btnMasRegistros').style.display = 'none';
         document.getElementById('tabla-registros').innerHTML = '<p style="color:red;">Error al cargar la tabla.</p>';
     }
 }
 
+// Un solo pedido por cambio de filtro: /dashboard devuelve todos los paneles.
+// Con 'no-cache' el navegador revalida con If-None-Match y, si el filtro no
+// cambió, el servidor responde 304 sin volver a calcular.
+const MAX_PUNTOS_GRAFICO = 1000;
+
+async function cargarDashboard() {
+    let data = {};
+    try {
+        // El servidor reduce la serie del gráfico a lo sumo a MAX_PUNTOS_GRAFICO puntos
+        const response = await fetch(`/dashboard?${obtenerParametros()}&max_points=${MAX_PUNTOS_GRAFICO}&orden=${ordenTabla()}`, { cache: 'no-cache' });
+        data = await response.json();
+    } catch (error) {
+        console.error('Error al cargar el dashboard:', error);
+    }
+    cargarKPIs(data.kpis);
+    cargarGraficoConsumo(data.grafico_volumen);
+    cargarGraficoRiesgoCliente(data.riesgo_por_cliente);
+    cargarHeatmapAnomalias(data.anomalias_por_dia_hora);
+    cargarTablaRegistros(data.tabla_registros);
+}
+
+function ordenTabla() {
+    return document.getElementById('ordenTabla').value;
+}
+
+// Página siguiente de la tabla con el cursor que devolvió el servidor
+async function cargarMasRegistros() {
+    if (!cursorTabla) return;
+    try {
+        const url = `/tabla_registros?${obtenerParametros()}&orden=${ordenTabla()}&cursor=${encodeURIComponent(cursorTabla)}`;
+        const response = await fetch(url);
+        const registros = await response.json();
+        cargarTablaRegistros({ registros: registros, siguiente: response.headers.get('X-Cursor-Siguiente') }, true);
+    } catch (error) {
+        console.error('Error al cargar más registros:', error);
+    }
+}
+
 function obtenerParametros() {
     const cliente = document.getElementById('cliente').value;
     const fechaInicio = document.getElementById('fechaInicio').value;
@@ -381,11 +410,7 @@ async function actualizarRangoFechas() {
 
         // ⚡ Forzar carga de datos si las fechas fueron autoasignadas
         if (fechasPredefinidas) {
-            cargarKPIs();
-            cargarGraficoConsumo();
-            cargarGraficoRiesgoCliente();
-            cargarHeatmapAnomalias();
-            cargarTablaRegistros();
+            cargarDashboard();
         }
 
     } catch (error) {
@@ -395,11 +420,9 @@ async function actualizarRangoFechas() {
 
 
 
+// Los paneles se recargan con el listener común de los filtros
 document.getElementById('cliente').addEventListener('change', () => {
-    const cliente = document.getElementById('cliente').value;
     actualizarRangoFechas();
-    cargarKPIs(cliente);
-    cargarGraficoConsumo(cliente);
 });
 
 
@@ -421,6 +444,143 @@ document.getElementById('btnGenerarPDF').addEventListener('click', () => {
         document.body.classList.remove('exportar');
     });
 });
+// Reentrenamiento en segundo plano: el servidor responde con el id del
+// trabajo y el progreso se consulta cada pocos segundos
+const INTERVALO_TRABAJO_MS = 2000;
+const ESTADOS_FINALES = ['terminado', 'cancelado', 'error'];
+let trabajoActual = null;
+
+// Las acciones de administración solo se muestran con un token válido
+function mostrarAdmin(habilitado) {
+    document.getElementById('accionesAdmin').style.display = habilitado ? 'inline' : 'none';
+    document.getElementById('btnIngresarAdmin').style.display = habilitado ? 'none' : 'inline-block';
+}
+
+async function pedirAdmin(url, metodo = 'GET', cuerpo = null) {
+    const token = sessionStorage.getItem('tokenAdmin');
+    const response = await fetch(url, {
+        method: metodo,
+        cache: 'no-cache',
+        headers: { 'Content-Type': 'application/json', ...(token ? { 'X-Token-Admin': token } : {}) },
+        body: cuerpo ? JSON.stringify(cuerpo) : undefined
+    });
+    // Token rechazado (403) o administración deshabilitada en el servidor (404 sin token)
+    if (response.status === 403 || (response.status === 404 && url === '/admin/trabajos')) {
+        sessionStorage.removeItem('tokenAdmin');
+        mostrarAdmin(false);
+    }
+    return response;
+}
+
+async function ingresarAdmin() {
+    const token = prompt('Token de administración:');
+    if (!token) return;
+    sessionStorage.setItem('tokenAdmin', token);
+    const estado = document.getElementById('estadoReentreno');
+    const response = await pedirAdmin('/admin/trabajos');
+    if (response.status === 404) {
+        estado.innerText = 'La administración no está habilitada en este servidor';
+    } else if (!response.ok) {
+        estado.innerText = 'Token de administración inválido';
+    } else {
+        estado.innerText = '';
+        mostrarAdmin(true);
+        await cargarUltimoTrabajo();
+    }
+}
+
+function mostrarTrabajo(trabajo) {
+    trabajoActual = trabajo;
+    const estado = document.getElementById('estadoReentreno');
+    const enCurso = trabajo && !ESTADOS_FINALES.includes(trabajo.estado);
+    document.getElementById('btnReentrenar').disabled = enCurso;
+    document.getElementById('btnCancelarReentreno').style.display = enCurso ? 'inline-block' : 'none';
+    document.getElementById('btnAplicarModelo').style.display =
+        trabajo && trabajo.estado === 'terminado' && trabajo.version ? 'inline-block' : 'none';
+    if (!trabajo) {
+        estado.innerText = '';
+        return;
+    }
+
+    let texto = `Trabajo ${trabajo.id}: ${trabajo.estado.replace('_', ' ')}`;
+    if (trabajo.total) {
+        const ultimo = trabajo.clientes.length ? trabajo.clientes[trabajo.clientes.length - 1].cliente : '';
+        texto += ` (${trabajo.completados}/${trabajo.total} clientes${ultimo ? ', último: ' + ultimo : ''})`;
+    }
+    if (trabajo.cancelacion_pedida && enCurso) texto += ' — cancelando al terminar el cliente en curso';
+    if (trabajo.error) texto += ` — ${trabajo.error}`;
+    const comparacion = trabajo.comparacion;
+    if (comparacion && comparacion.mae_nuevo != null && comparacion.mae_actual != null) {
+        texto += ` — MAE nuevo ${comparacion.mae_nuevo.toFixed(4)} vs actual ${comparacion.mae_actual.toFixed(4)}`;
+    }
+    estado.innerText = texto;
+}
+
+async function seguirTrabajo(id) {
+    while (true) {
+        const response = await pedirAdmin(`/admin/trabajos/${id}`);
+        if (!response.ok) return;
+        const trabajo = await response.json();
+        mostrarTrabajo(trabajo);
+        if (ESTADOS_FINALES.includes(trabajo.estado)) return;
+        await new Promise(resolve => setTimeout(resolve, INTERVALO_TRABAJO_MS));
+    }
+}
+
+async function reentrenarModelo() {
+    try {
+        const response = await pedirAdmin('/admin/reentrenar', 'POST', {});
+        const data = await response.json();
+        if (response.status === 409 && data.trabajo) {
+            seguirTrabajo(data.trabajo);
+            return;
+        }
+        if (!response.ok) {
+            document.getElementById('estadoReentreno').innerText = data.error || 'No se pudo iniciar el reentrenamiento';
+            return;
+        }
+        mostrarTrabajo(data);
+        seguirTrabajo(data.id);
+    } catch (error) {
+        console.error('Error al iniciar el reentrenamiento:', error);
+    }
+}
+
+async function cancelarReentreno() {
+    if (!trabajoActual) return;
+    const response = await pedirAdmin(`/admin/trabajos/${trabajoActual.id}/cancelar`, 'POST');
+    if (response.ok) mostrarTrabajo(await response.json());
+}
+
+async function aplicarModeloNuevo() {
+    if (!trabajoActual || !confirm('¿Aplicar el modelo nuevo como oficial?')) return;
+    const response = await pedirAdmin(`/admin/trabajos/${trabajoActual.id}/aplicar`, 'POST');
+    const data = await response.json();
+    if (!response.ok) {
+        document.getElementById('estadoReentreno').innerText = data.error || 'No se pudo aplicar el modelo';
+        return;
+    }
+    document.getElementById('estadoReentreno').innerText = `Modelo aplicado: versión ${data.version}`;
+    document.getElementById('btnAplicarModelo').style.display = 'none';
+    cargarDashboard();
+}
+
+async function cargarUltimoTrabajo() {
+    // Sin token guardado en la sesión no se consulta nada
+    if (!sessionStorage.getItem('tokenAdmin')) return;
+    try {
+        const response = await pedirAdmin('/admin/trabajos');
+        if (!response.ok) return;
+        mostrarAdmin(true);
+        const lista = await response.json();
+        if (!lista.length) return;
+        mostrarTrabajo(lista[0]);
+        if (!ESTADOS_FINALES.includes(lista[0].estado)) seguirTrabajo(lista[0].id);
+    } catch (error) {
+        console.error('Error al consultar los reentrenamientos:', error);
+    }
+}
+
 window.onload = async () => {
     // Inicializa flatpickr en los inputs de fecha
     flatpickr("#fechaInicio", {
@@ -447,24 +607,35 @@ window.onload = async () => {
     const fechaInicio = document.getElementById('fechaInicio').value;
     const fechaFin = document.getElementById('fechaFin').value;
     if (fechaInicio && fechaFin) {
-        cargarKPIs();
-        cargarGraficoConsumo();
-        cargarGraficoRiesgoCliente();
-        cargarHeatmapAnomalias();
-        cargarTablaRegistros();
+        cargarDashboard();
     }
 
     // Añadir listeners a los filtros
     ['cliente', 'fechaInicio', 'fechaFin', 'riesgoFiltro'].forEach(id => {
         document.getElementById(id).addEventListener('change', () => {
-            cargarKPIs();
-            cargarGraficoConsumo();
-            cargarGraficoRiesgoCliente();
-            cargarHeatmapAnomalias();
-            cargarTablaRegistros();
+            cargarDashboard();
         });
     });
 
+    // Orden y paginación de la tabla de registros
+    document.getElementById('ordenTabla').addEventListener('change', async () => {
+        try {
+            const response = await fetch(`/dashboard?${obtenerParametros()}&paneles=tabla_registros&orden=${ordenTabla()}`, { cache: 'no-cache' });
+            const data = await response.json();
+            cargarTablaRegistros(data.tabla_registros);
+        } catch (error) {
+            console.error('Error al ordenar la tabla de registros:', error);
+        }
+    });
+    document.getElementById('btnMasRegistros').addEventListener('click', cargarMasRegistros);
+
+    // Reentrenamiento del modelo
+    document.getElementById('btnIngresarAdmin').addEventListener('click', ingresarAdmin);
+    document.getElementById('btnReentrenar').addEventListener('click', reentrenarModelo);
+    document.getElementById('btnCancelarReentreno').addEventListener('click', cancelarReentreno);
+    document.getElementById('btnAplicarModelo').addEventListener('click', aplicarModeloNuevo);
+    cargarUltimoTrabajo();
+
     // Redimensionar gráficos
     window.addEventListener('resize', () => {
         if (window.myChart) window.myChart.resize();
@@ -495,4 +666,9 @@ window.onload = async () => {
             document.body.classList.remove('exportar');
         });
     });
+
+    // Registros con los filtros actuales; el navegador descarga el archivo a medida que llega
+    document.getElementById('btnExportarCSV').addEventListener('click', () => {
+        window.location.href = `/exportar?${obtenerParametros()}&formato=csv`;
+    });
 };
@@ -0,0 +1,28 @@
+import gc
+import os
+
+# ------------------------------------------------------
+# Configuración de gunicorn (se lee sola al ejecutar
+# `gunicorn app:server` desde backend/). La app se carga una vez
+# en el proceso maestro y los workers la heredan al hacer fork:
+# el conjunto compacto (conjunto.compactar) queda compartido
+# copy-on-write y sus columnas apuntan al archivo mapeado. En las
+# recargas cada worker abre con memory-map el índice y los cubos
+# guardados al publicar la versión (conjunto.preparar_servicio).
+# La cantidad de workers se toma de WEB_CONCURRENCY.
+# Las rutas /admin (recarga, reentrenamiento, aplicar modelo) solo
+# se habilitan con CONTUGAS_TOKEN_ADMIN; en Railway se define como
+# variable del servicio, nunca en railway.json.
+# ------------------------------------------------------
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Los objetos cargados en el maestro pasan a la generación permanente
+    # para que el recolector de los workers no toque (ni copie) sus páginas
+    gc.freeze()
+
+
+def when_ready(server):
+    if not os.environ.get('CONTUGAS_TOKEN_ADMIN'):
+        server.log.warning("CONTUGAS_TOKEN_ADMIN no está definido: las rutas /admin quedan deshabilitadas")
@@ -0,0 +1,387 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.neighbors import KDTree
+
+import almacen
+from comparacion import comparar_versiones
+from conjunto import preparar_servicio
+from ingesta import agregar_variables_calendario
+from modelo import CLASES_RIESGO
+from puntuacion import puntuar_cliente, puntuar_lecturas
+from reentrenamiento import clientes_almacen, reentrenar_clientes
+
+# ------------------------------------------------------
+# Puntuación incremental de lecturas nuevas. Por cliente se
+# mantiene el paquete ajustado (escaladores y regresor) y una
+# ventana de las últimas lecturas con su árbol de vecinos: cada
+# lectura nueva toma el cluster DBSCAN del punto núcleo más
+# cercano a menos de eps, sin volver a agrupar la historia.
+# Las lecturas puntuadas se publican como una versión nueva del
+# almacén (base + agregadas) y el reajuste completo solo se hace
+# ante deriva o por antigüedad del modelo; queda en 'nuevo' para
+# revisarlo salvo con --promover. Cada publicación copia la base
+# lote por lote desde el memory-map y rearma la copia de servicio
+# y el índice (los cubos se actualizan a partir de los de la base),
+# así que su costo crece con la historia y no con el lote: se
+# publica de a muchas lecturas (--publicar-cada).
+# Un solo proceso debe escribir (p. ej. `python incremental.py
+# lecturas.jsonl`); el servidor toma cada versión publicada con
+# el vigilante del puntero.
+# ------------------------------------------------------
+VENTANA = int(os.environ.get('CONTUGAS_VENTANA_INCREMENTAL', '2000'))
+# Lecturas agregadas a la ventana antes de reconstruir el árbol de vecinos
+REINDEXAR = int(os.environ.get('CONTUGAS_REINDEXAR_INCREMENTAL', '64'))
+# Deriva: mediana del error reciente mayor que FACTOR_DERIVA veces la de la
+# ventana inicial, o más de MAX_RUIDO de lecturas recientes sin cluster
+VENTANA_DERIVA = int(os.environ.get('CONTUGAS_VENTANA_DERIVA', '500'))
+MIN_DERIVA = 50
+FACTOR_DERIVA = float(os.environ.get('CONTUGAS_FACTOR_DERIVA', '2.0'))
+MAX_RUIDO = float(os.environ.get('CONTUGAS_MAX_RUIDO', '0.5'))
+# Reajuste programado: horas desde el último entrenamiento completo (0 = nunca)
+MAX_EDAD_HORAS = float(os.environ.get('CONTUGAS_MAX_EDAD_MODELO_HORAS', '0'))
+COLUMNAS_VENTANA = ['Fecha', 'Volumen', 'MSE', 'Residual', 'outlier', 'cluster_dbscan', 'Riesgo', 'Residual_Promedio_Abs']
+SIN_RIESGO = CLASES_RIESGO[-1]
+
+
+def _escalar(escalador, valores):
+    # Igual que escalador.transform, sin la validación de nombres de columnas
+    return (valores - escalador.mean_) / escalador.scale_
+
+
+class EstadoCliente:
+
+    def __init__(self, paquete, historia, filas):
+        # historia: últimas lecturas del cliente en el almacén (COLUMNAS_VENTANA)
+        self.paquete = paquete
+        self.filas = filas
+        self.fecha_max = historia['Fecha'].max() if len(historia) else paquete.get('fecha_max')
+        self.mse = float(historia['MSE'].iloc[-1]) if len(historia) else np.nan
+
+        etiquetas = historia['cluster_dbscan'].to_numpy(dtype=np.float64)
+        self.etiquetas = np.where(np.isnan(etiquetas), -1, etiquetas).astype(np.int64)
+        self.puntos = self._puntos(
+            historia['Fecha'], historia['Volumen'].to_numpy(dtype=np.float64), filas - len(historia)
+        )
+
+        # Clase y residual promedio de cada cluster (los que asignó riesgo_cluster)
+        riesgo = historia['Riesgo'].astype(object).fillna(SIN_RIESGO).to_numpy()
+        con_riesgo = (riesgo != SIN_RIESGO) & (self.etiquetas >= 0)
+        promedio = historia['Residual_Promedio_Abs'].to_numpy(dtype=np.float64)
+        self.riesgo_cluster = dict(zip(self.etiquetas[con_riesgo], riesgo[con_riesgo]))
+        self.promedio_cluster = dict(zip(self.etiquetas[con_riesgo], promedio[con_riesgo]))
+
+        # Referencia para la deriva: mediana del error absoluto en la ventana
+        residual = np.abs(historia['Residual'].to_numpy(dtype=np.float64))
+        self.error_base = float(np.nanmedian(residual)) if np.isfinite(residual).any() else None
+        self.errores = deque(maxlen=VENTANA_DERIVA)
+        self.agregadas = 0
+        self.nucleo = np.zeros(len(historia), dtype=bool)
+        self.sin_indexar = len(historia)
+        self._indexar()
+
+    def _puntos(self, fechas, volumen, desde):
+        # Mismo espacio que DBSCAN en el entrenamiento: (x_seq, Mes, Dia_Semana) y Volumen escalados
+        fechas = pd.DatetimeIndex(fechas)
+        X = np.column_stack([np.arange(desde, desde + len(fechas)), fechas.month, fechas.dayofweek]).astype(np.float64)
+        Y = volumen.reshape(-1, 1)
+        return np.hstack([_escalar(self.paquete['scaler_X'], X), _escalar(self.paquete['scaler_Y'], Y)])
+
+    def _indexar(self):
+        # Puntos núcleo de la ventana (al menos min_samples vecinos a menos de eps)
+        # y su árbol; las lecturas nuevas se asignan al núcleo más cercano. Los
+        # núcleos nuevos se unen por componentes conexas: toman el cluster que ya
+        # tenía su componente o, si no tenía, abren uno nuevo. Las lecturas
+        # agregadas que no son núcleo quedan como borde del núcleo más cercano
+        eps = self.paquete['eps']
+        validos = np.flatnonzero(np.isfinite(self.puntos).all(axis=1))
+        recientes = validos[validos >= len(self.puntos) - self.sin_indexar]
+        self.sin_indexar = 0
+        if len(validos) >= 2:
+            # Solo las lecturas nuevas y sus vecinas pueden pasar a ser núcleo
+            puntos = self.puntos[validos]
+            arbol = KDTree(puntos)
+            if len(recientes) < len(validos):
+                posiciones = np.searchsorted(validos, recientes)
+                candidatos = np.unique(np.concatenate(arbol.query_radius(puntos[posiciones], r=eps)))
+            else:
+                candidatos = np.arange(len(validos))
+            conteo = arbol.query_radius(puntos[candidatos], r=eps, count_only=True)
+            self.nucleo[validos[candidatos]] = conteo >= self.paquete['min_samples']
+        nucleo = np.flatnonzero(self.nucleo)
+        if not len(nucleo):
+            self.arbol = None
+            return
+
+        arbol = KDTree(self.puntos[nucleo])
+        etiquetas = self.etiquetas[nucleo]
+        nuevos = np.flatnonzero(etiquetas < 0)
+        if len(nuevos):
+            # Aristas solo desde los núcleos sin cluster; las componentes sin
+            # núcleos nuevos no cambian
+            vecinos = arbol.query_radius(self.puntos[nucleo[nuevos]], r=eps)
+            origen = np.repeat(nuevos, [len(v) for v in vecinos])
+            grafo = coo_matrix(
+                (np.ones(len(origen)), (origen, np.concatenate(vecinos))), shape=(len(nucleo), len(nucleo))
+            )
+            _, componente = connected_components(grafo, directed=False)
+            conocidas = pd.Series(etiquetas[etiquetas >= 0], index=componente[etiquetas >= 0])
+            conocidas = conocidas[conocidas.index.isin(componente[nuevos])]
+            moda = conocidas.groupby(level=0).agg(lambda e: e.value_counts().idxmax())
+            sin_cluster = np.setdiff1d(componente[nuevos], moda.index)
+            siguiente = max(self.etiquetas.max(), -1) + 1
+            asignadas = pd.concat([moda, pd.Series(np.arange(siguiente, siguiente + len(sin_cluster)), index=sin_cluster)])
+            etiquetas[nuevos] = asignadas.reindex(componente[nuevos]).to_numpy()
+            self.etiquetas[nucleo] = etiquetas
+
+        self.arbol = arbol
+        self.etiquetas_nucleo = etiquetas
+        agregadas = np.arange(max(len(self.puntos) - self.agregadas, 0), len(self.puntos))
+        sueltas = agregadas[self.etiquetas[agregadas] < 0]
+        if len(sueltas):
+            self.etiquetas[sueltas] = self.asignar_clusters(self.puntos[sueltas])
+
+    def asignar_clusters(self, puntos):
+        etiquetas = np.full(len(puntos), -1, dtype=np.int64)
+        finitos = np.isfinite(puntos).all(axis=1)
+        if self.arbol is None or not finitos.any():
+            return etiquetas
+        distancia, indice = self.arbol.query(puntos[finitos], k=1)
+        cerca = distancia[:, 0] <= self.paquete['eps']
+        etiquetas[np.flatnonzero(finitos)[cerca]] = self.etiquetas_nucleo[indice[cerca, 0]]
+        return etiquetas
+
+    def puntuar(self, lecturas):
+        # lecturas: del cliente, válidas y ordenadas por fecha
+        resultado = puntuar_cliente(lecturas, self.paquete)
+        puntos = self._puntos(lecturas['Fecha'], lecturas['Volumen'].to_numpy(dtype=np.float64), self.filas)
+
+        # Ventana acotada; el árbol se reconstruye cada REINDEXAR lecturas y,
+        # si toca en este lote, sus lecturas toman la etiqueta ya reindexada
+        self.puntos = np.vstack([self.puntos, puntos])[-VENTANA:]
+        self.etiquetas = np.r_[self.etiquetas, self.asignar_clusters(puntos)][-VENTANA:]
+        self.nucleo = np.r_[self.nucleo, np.zeros(len(puntos), dtype=bool)][-VENTANA:]
+        self.filas += len(lecturas)
+        fecha_max = lecturas['Fecha'].max()
+        self.fecha_max = fecha_max if self.fecha_max is None else max(self.fecha_max, fecha_max)
+        self.agregadas += len(lecturas)
+        self.sin_indexar += len(lecturas)
+        if self.sin_indexar >= REINDEXAR:
+            self._indexar()
+        etiquetas = self.etiquetas[-len(lecturas):]
+
+        # Un cluster con clase de riesgo la transmite a sus lecturas nuevas (como
+        # riesgo_cluster); sin cluster se usa la clasificación por residual
+        riesgo_cluster = np.array([self.riesgo_cluster.get(e) for e in etiquetas], dtype=object)
+        con_cluster = pd.notna(riesgo_cluster)
+        resultado['Riesgo'] = np.where(con_cluster, riesgo_cluster, resultado['Riesgo'].to_numpy())
+        resultado['cluster_dbscan'] = etiquetas.astype(np.float64)
+        resultado['Residual_Promedio_Abs'] = np.array(
+            [self.promedio_cluster.get(e, np.nan) for e in etiquetas], dtype=np.float64
+        )
+        resultado['x_seq'] = np.arange(self.filas - len(lecturas), self.filas)
+        resultado['MSE'] = self.mse
+
+        self.errores.extend(np.abs(resultado['Residual'].to_numpy()))
+        return resultado
+
+    def deriva(self):
+        if len(self.errores) < MIN_DERIVA:
+            return None
+        if self.error_base and np.nanmedian(self.errores) > FACTOR_DERIVA * self.error_base:
+            return 'error'
+        # Ruido: lecturas agregadas ya reindexadas que siguen sin cluster
+        fin = len(self.etiquetas) - self.sin_indexar
+        evaluadas = min(self.agregadas - self.sin_indexar, VENTANA_DERIVA, fin)
+        if evaluadas >= MIN_DERIVA and np.mean(self.etiquetas[fin - evaluadas:fin] < 0) > MAX_RUIDO:
+            return 'ruido'
+        return None
+
+    def paquete_actualizado(self):
+        self.paquete['filas'] = self.filas
+        self.paquete['fecha_max'] = self.fecha_max
+        return self.paquete
+
+
+class PuntuadorIncremental:
+
+    def __init__(self, version=None):
+        self.version = version or almacen.leer_puntero('actual')
+        if not self.version:
+            raise ValueError("No hay una versión en el almacén para puntuar")
+        self._cargar_version()
+
+    def _cargar_version(self):
+        self.meta = almacen.leer_meta(self.version)
+        self.tabla = almacen.abrir_tabla(self.version, COLUMNAS_VENTANA)
+        self.estados = {}
+        self.pendientes = []
+
+    def estado(self, cliente):
+        # Se arma en el primer uso con las últimas VENTANA filas del cliente
+        if cliente not in self.estados:
+            paquete = almacen.cargar_paquete(self.version, cliente)
+            particion = self.meta['clientes'].get(cliente)
+            if paquete is None or particion is None:
+                self.estados[cliente] = None
+            else:
+                a, b = particion
+                inicio = max(a, b - VENTANA)
+                historia = self.tabla.slice(inicio, b - inicio).to_pandas()
+                self.estados[cliente] = EstadoCliente(paquete, historia, b - a)
+        return self.estados[cliente]
+
+    def puntuar(self, lecturas):
+        # Devuelve una fila por lectura (con 'error' si no se pudo puntuar);
+        # las puntuadas quedan pendientes de publicar
+        return puntuar_lecturas(lecturas, self.estado, self._puntuar_cliente)
+
+    def _puntuar_cliente(self, lecturas, estado):
+        lecturas = lecturas.sort_values('Fecha', kind='stable')
+        puntuado = estado.puntuar(lecturas)
+        self.pendientes.append(pd.concat([lecturas, puntuado], axis=1))
+        return puntuado
+
+    def lecturas_pendientes(self):
+        return sum(len(p) for p in self.pendientes)
+
+    def publicar(self, puntero='actual'):
+        # Versión nueva = versión base + lecturas puntuadas (ver
+        # almacen.agregar_resultado); los paquetes avanzan su contador de
+        # filas para que x_seq siga la secuencia
+        if not self.pendientes:
+            return self.version
+        nuevas = pd.concat(self.pendientes, ignore_index=True).rename(columns={'cliente': 'Numero_Cliente'})
+        nuevas = agregar_variables_calendario(nuevas)
+        nuevas['Dia_Semana'] = nuevas['dia_semana']
+
+        paquetes = {}
+        for cliente in self.meta.get('modelos', []):
+            estado = self.estados.get(cliente)
+            paquetes[cliente] = estado.paquete_actualizado() if estado else almacen.cargar_paquete(self.version, cliente)
+
+        version = almacen.agregar_resultado(self.version, nuevas, puntero=None, paquetes=paquetes, metadatos={
+            'incremental_de': self.version,
+            'lecturas_incrementales': len(nuevas),
+            'entrenado': self.meta.get('entrenado', self.meta['creado']),
+        })
+        # El servidor encuentra el índice y los cubos ya guardados; los cubos
+        # se actualizan con las lecturas nuevas sobre los de la base
+        preparar_servicio(version, base=self.version, nuevas=nuevas)
+        if puntero:
+            almacen.fijar_puntero(puntero, version)
+        # Los estados siguen valiendo: la ventana ya incluye las lecturas publicadas
+        estados = self.estados
+        self.version = version
+        self._cargar_version()
+        self.estados = estados
+        return version
+
+    def motivo_reajuste(self):
+        # 'deriva: CLIENTE (error|ruido), ...', 'programado' o None
+        derivas = {c: e.deriva() for c, e in self.estados.items() if e is not None}
+        derivas = {c: m for c, m in derivas.items() if m}
+        if derivas:
+            return 'deriva: ' + ', '.join(f'{c} ({m})' for c, m in sorted(derivas.items()))
+        if MAX_EDAD_HORAS > 0:
+            entrenado = datetime.fromisoformat(self.meta.get('entrenado', self.meta['creado']))
+            if (datetime.now() - entrenado).total_seconds() > MAX_EDAD_HORAS * 3600:
+                return 'programado'
+        return None
+
+    def reajustar(self, promover=False, **kwargs):
+        # Reentrenamiento completo con los datos publicados (base + agregadas).
+        # La versión nueva queda en 'nuevo' con su comparación contra la
+        # anterior para revisarla (p. ej. con admin_modelos.py); con
+        # promover=True pasa a 'actual' solo si su MAE no es peor. Si se
+        # promovió, self.version pasa a ser la devuelta.
+        self.publicar()
+        anterior = self.version
+        version = reentrenar_clientes(
+            clientes_almacen(anterior), len(self.meta['clientes']), puntero='nuevo', **kwargs
+        )
+        reporte = comparar_versiones(anterior, version)
+        almacen.guardar_reporte(version, reporte, almacen.ARCHIVO_COMPARACION)
+        total = reporte['total']
+        no_peor = None not in (total['mae_nuevo'], total['mae_actual']) and total['mae_nuevo'] <= total['mae_actual']
+        if promover and no_peor:
+            almacen.fijar_puntero('actual', version)
+            self.version = version
+            self._cargar_version()
+        return version
+
+
+def _lotes(fuente, tamano):
+    # Lecturas como JSON por línea (objetos con las columnas de COLUMNAS_LECTURA)
+    lote = []
+    for linea in fuente:
+        linea = linea.strip()
+        if not linea:
+            continue
+        lote.append(json.loads(linea))
+        if len(lote) >= tamano:
+            yield pd.DataFrame(lote)
+            lote = []
+    if lote:
+        yield pd.DataFrame(lote)
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Puntuación incremental de lecturas nuevas (JSON por línea)')
+    parser.add_argument('entrada', nargs='?', default='-', help='Archivo .jsonl (por defecto, la entrada estándar)')
+    parser.add_argument('--lote', type=int, default=1000, help='Lecturas por lote de puntuación')
+    parser.add_argument('--publicar-cada', type=int, default=50000,
+                        help='Lecturas entre publicaciones (cada una reescribe la versión completa)')
+    parser.add_argument('--sin-reajuste', action='store_true', help='Solo avisar la deriva, sin reentrenar')
+    parser.add_argument('--promover', action='store_true',
+                        help="Pasar el reajuste a 'actual' si su MAE no es peor que el de la versión anterior")
+    args = parser.parse_args(argumentos)
+
+    puntuador = PuntuadorIncremental()
+    fuente = sys.stdin if args.entrada == '-' else open(args.entrada, encoding='utf-8')
+    total, errores, avisado, inicio = 0, 0, None, time.perf_counter()
+    # Reajuste sin promover: queda en 'nuevo' y no se repite hasta revisarlo
+    pendiente = None
+    try:
+        for lote in _lotes(fuente, args.lote):
+            resultado = puntuador.puntuar(lote)
+            total += len(resultado)
+            if 'error' in resultado.columns:
+                errores += int(resultado['error'].notna().sum())
+
+            if puntuador.lecturas_pendientes() >= args.publicar_cada:
+                print(f"Versión publicada: {puntuador.publicar()}")
+            motivo = puntuador.motivo_reajuste()
+            if motivo and motivo != avisado:
+                print(f"Reajuste necesario ({motivo})")
+            avisado = motivo
+            if motivo and not args.sin_reajuste and not pendiente:
+                version = puntuador.reajustar(promover=args.promover, progreso=None)
+                if puntuador.version == version:
+                    print(f"Versión reajustada y promovida: {version}")
+                    avisado = None
+                else:
+                    print(f"Versión reajustada en 'nuevo', pendiente de revisión: {version}")
+                    pendiente = version
+        if puntuador.lecturas_pendientes():
+            print(f"Versión publicada: {puntuador.publicar()}")
+    finally:
+        if fuente is not sys.stdin:
+            fuente.close()
+
+    segundos = time.perf_counter() - inicio
+    print(f"Lecturas: {total} | con error: {errores} | {total / max(segundos, 1e-9):.0f} lecturas/s")
+
+
+# El pool de procesos del reajuste vuelve a importar este módulo en Windows
+if __name__ == '__main__':
+    main()
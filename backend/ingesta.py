@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+# ------------------------------------------------------
+# Ingesta de los datos de entrada (una hoja por cliente).
+# Las hojas se leen en modo read-only y se entregan de a una,
+# así la memoria queda acotada por el cliente más grande y no
+# por el libro completo.
+# ------------------------------------------------------
+TIPOS_ENTRADA = {
+    'Presion': np.float64,
+    'Temperatura': np.float64,
+    'Volumen': np.float64,
+}
+
+
+def agregar_variables_calendario(df):
+    fecha = df['Fecha'].dt
+    df['Mes'] = fecha.month
+    df['dia_semana'] = fecha.dayofweek
+    df['semana_anio'] = fecha.isocalendar().week
+    df['es_fin_de_semana'] = (df['dia_semana'] >= 5).astype(np.int64)
+    return df
+
+
+def _hoja_a_dataframe(hoja):
+    filas = hoja.iter_rows(values_only=True)
+    encabezado = next(filas, None)
+    if encabezado is None:
+        return pd.DataFrame(columns=['Fecha', *TIPOS_ENTRADA])
+
+    columnas = [str(c).strip() if c is not None else f'col_{i}' for i, c in enumerate(encabezado)]
+    df = pd.DataFrame.from_records(
+        (fila for fila in filas if any(v is not None for v in fila)), columns=columnas
+    )
+    df['Fecha'] = pd.to_datetime(df['Fecha'])
+    for columna, tipo in TIPOS_ENTRADA.items():
+        if columna in df.columns:
+            df[columna] = pd.to_numeric(df[columna], errors='coerce').astype(tipo)
+    return df
+
+
+def leer_clientes(ruta):
+    # Genera (cliente_id, df) por cada hoja del libro, en orden
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        for i, nombre in enumerate(libro.sheetnames, start=1):
+            df = _hoja_a_dataframe(libro[nombre])
+            cliente_id = f'CLIENTE{i}'
+            df['Numero_Cliente'] = cliente_id
+            yield cliente_id, agregar_variables_calendario(df)
+    finally:
+        libro.close()
+
+
+def cargar_datos(ruta):
+    # Todos los clientes en un solo DataFrame (una única concatenación)
+    return pd.concat([df for _, df in leer_clientes(ruta)], ignore_index=True)
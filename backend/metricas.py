@@ -0,0 +1,145 @@
+import math
+import threading
+from collections import defaultdict
+
+# ------------------------------------------------------
+# Métricas del servidor en formato de texto de Prometheus.
+# Contadores e histogramas en memoria, por proceso: con varios
+# workers de gunicorn cada uno expone los suyos (Prometheus los
+# distingue por instancia o se suman al consultar). Los valores
+# que ya existen en otro lado (caché, reporte de entrenamiento)
+# se agregan con recolectores que se leen al exponer.
+# ------------------------------------------------------
+CUBETAS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CUBETAS_FILAS = (0, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in pares) + '}'
+
+
+def _numero(valor):
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return 'NaN'
+    if valor == math.inf:
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _encabezado(nombre, tipo, ayuda):
+    return [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}']
+
+
+class Contador:
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.valores = defaultdict(float)
+        self._cerrojo = threading.Lock()
+
+    def incrementar(self, valor=1, **etiquetas):
+        with self._cerrojo:
+            self.valores[tuple(sorted(etiquetas.items()))] += valor
+
+    def lineas(self):
+        with self._cerrojo:
+            valores = list(self.valores.items())
+        return _encabezado(self.nombre, 'counter', self.ayuda) + [
+            f'{self.nombre}{_etiquetas(pares)} {_numero(valor)}' for pares, valor in valores
+        ]
+
+
+class Histograma:
+
+    def __init__(self, nombre, ayuda, cubetas=CUBETAS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.cubetas = tuple(cubetas)
+        # etiquetas -> [conteo por cubeta (no acumulado) + desborde, suma]
+        self.valores = {}
+        self._cerrojo = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        i = next((i for i, limite in enumerate(self.cubetas) if valor <= limite), len(self.cubetas))
+        with self._cerrojo:
+            conteos, suma = self.valores.get(clave, ([0] * (len(self.cubetas) + 1), 0.0))
+            conteos[i] += 1
+            self.valores[clave] = (conteos, suma + valor)
+
+    def lineas(self):
+        with self._cerrojo:
+            valores = [(pares, list(conteos), suma) for pares, (conteos, suma) in self.valores.items()]
+        lineas = _encabezado(self.nombre, 'histogram', self.ayuda)
+        for pares, conteos, suma in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.cubetas + (math.inf,), conteos):
+                acumulado += conteo
+                lineas.append(f'{self.nombre}_bucket{_etiquetas(pares + (("le", _numero(limite)),))} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(pares)} {_numero(suma)}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(pares)} {acumulado}')
+        return lineas
+
+
+class RegistroMetricas:
+
+    def __init__(self):
+        self.metricas = []
+        self.recolectores = []
+
+    def contador(self, nombre, ayuda):
+        metrica = Contador(nombre, ayuda)
+        self.metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nombre, ayuda, cubetas=CUBETAS_SEGUNDOS):
+        metrica = Histograma(nombre, ayuda, cubetas)
+        self.metricas.append(metrica)
+        return metrica
+
+    def recolector(self, funcion):
+        # funcion() -> lista de (nombre, tipo, ayuda, [(etiquetas dict, valor)])
+        self.recolectores.append(funcion)
+        return funcion
+
+    def exponer(self):
+        lineas = []
+        for metrica in self.metricas:
+            lineas += metrica.lineas()
+        for funcion in self.recolectores:
+            for nombre, tipo, ayuda, muestras in funcion():
+                lineas += _encabezado(nombre, tipo, ayuda)
+                lineas += [f'{nombre}{_etiquetas(sorted(e.items()))} {_numero(v)}' for e, v in muestras]
+        return '\n'.join(lineas) + '\n'
+
+
+def metricas_entrenamiento(reporte):
+    # Reporte de entrenamiento (ver reentrenamiento.reporte_entrenamiento)
+    # como gauges: tiempos por etapa del flujo y, por cliente, iteraciones,
+    # filas descartadas como filamentos y segundos por etapa
+    if not reporte:
+        return []
+    clientes = reporte.get('clientes', {})
+    version = reporte.get('version')
+    return [
+        ('contugas_entrenamiento_etapa_segundos', 'gauge',
+         'Segundos por etapa del último reentrenamiento de la versión servida',
+         [({'version': version, 'etapa': etapa}, s) for etapa, s in reporte.get('etapas', {}).items()]),
+        ('contugas_entrenamiento_cliente_etapa_segundos', 'gauge',
+         'Segundos por etapa del entrenamiento de cada cliente',
+         [({'cliente': c, 'etapa': etapa}, s) for c, d in clientes.items() for etapa, s in d.get('tiempos', {}).items()]),
+        ('contugas_entrenamiento_cliente_iteraciones', 'gauge',
+         'Iteraciones DBSCAN/SVR de cada cliente',
+         [({'cliente': c}, d['iteraciones']) for c, d in clientes.items() if 'iteraciones' in d]),
+        ('contugas_entrenamiento_cliente_filas_filamento', 'gauge',
+         'Filas descartadas como filamentos en cada cliente',
+         [({'cliente': c}, d['filas_filamento']) for c, d in clientes.items() if 'filas_filamento' in d]),
+    ]
@@ -1,165 +1,402 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
 import numpy as np
 import pandas as pd
-from sklearn.svm import SVR
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.kernel_approximation import Nystroem
+from sklearn.svm import SVR, LinearSVR
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import DBSCAN
 from sklearn.neighbors import NearestNeighbors
 from sklearn.metrics import mean_squared_error
 
+from perfil import Cronometro, etapa
 
-def modelo_hibrido_svr_dbscan_2(df, usar_temperatura=True, usar_presion=True, median_factor=1.5, max_iter=5, min_samples=8):
-    df = df.copy()
-    df['Fecha'] = pd.to_datetime(df['Fecha'])
-    df = df.set_index('Fecha')
-    df['Mes'] = df.index.month
-    df['Dia_Semana'] = df.index.dayofweek
 
-    resultados = []
+def imprimir_progreso(cliente_id, completados, total):
+    print(f"CLIENTE {cliente_id} -> DONE")
 
-    for cliente_id, grupo in df.groupby("Numero_Cliente"):
-        grupo = grupo.sort_index()
 
-        for var in ["Temperatura", "Presion"]:
-            if var in grupo.columns:
-                max_val = grupo[var].max(skipna=True)
-                grupo[var] = grupo[var].fillna(100 * max_val)
+# ------------------------------------------------------
+# Regresores de costo acotado para historias largas.
+# El SVR con kernel escala entre n^2 y n^3 con el número de filas;
+# estas variantes fijan el costo con max_filas_regresor.
+# ------------------------------------------------------
+class SVRSubmuestreado(BaseEstimator, RegressorMixin):
+    # SVR exacto ajustado sobre una submuestra aleatoria de max_filas filas
 
-        grupo['Volumen'] = grupo['Volumen'].fillna(100 * grupo['Volumen'].max(skipna=True))
-        grupo['x_seq'] = np.arange(len(grupo))
+    def __init__(self, max_filas=2000, random_state=0):
+        self.max_filas = max_filas
+        self.random_state = random_state
 
-        features = ['x_seq', 'Mes', 'Dia_Semana']
-        if usar_temperatura and 'Temperatura' in grupo.columns:
-            features.insert(0, 'Temperatura')
-        if usar_presion and 'Presion' in grupo.columns:
-            features.insert(0, 'Presion')
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if len(X) > self.max_filas:
+            rng = np.random.default_rng(self.random_state)
+            idx = np.sort(rng.choice(len(X), self.max_filas, replace=False))
+            X, y = X[idx], y[idx]
+        self.svr_ = SVR().fit(X, y)
+        return self
 
-        X_base = grupo[features]
-        Y = grupo['Volumen'].copy()
+    def predict(self, X):
+        return self.svr_.predict(np.asarray(X, dtype=float))
 
-        SVR_features = [col for col in features if col != 'x_seq']
-        X_base_SVR = grupo[SVR_features]
-        clustering_features = ['x_seq', 'Mes', 'Dia_Semana']
-        X_base_dbscan = grupo[clustering_features]
 
-        outlier_filamentos_idx = set()
-        final_labels = pd.Series(index=grupo.index, data=np.nan)
-        umbral_residual = 0.05 * Y.max()
+class SVRNystroem(BaseEstimator, RegressorMixin):
+    # Aproximación del kernel RBF (Nystroem) + SVR lineal. Usa el mismo gamma
+    # que SVR(gamma='scale') y la misma pérdida epsilon-insensible.
 
-        for _ in range(max_iter):
-            if Y.isna().any():
-                max_y = Y.max(skipna=True)
-                Y = Y.fillna(100 * max_y if not pd.isna(max_y) else 1e6)
-
-            scaler_X = StandardScaler()
-            X_scaled = scaler_X.fit_transform(X_base_dbscan)
+    def __init__(self, n_componentes=300, random_state=0):
+        self.n_componentes = n_componentes
+        self.random_state = random_state
 
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        varianza = X.var()
+        gamma = 1.0 / (X.shape[1] * varianza) if varianza > 0 else 1.0
+        self.mapa_ = Nystroem(
+            gamma=gamma, n_components=min(self.n_componentes, len(X)), random_state=self.random_state
+        )
+        Z = self.mapa_.fit_transform(X)
+        self.lineal_ = LinearSVR(C=1.0, epsilon=0.1, dual=True, max_iter=10000, random_state=self.random_state)
+        self.lineal_.fit(Z, y)
+        return self
+
+    def predict(self, X):
+        return self.lineal_.predict(self.mapa_.transform(np.asarray(X, dtype=float)))
+
+
+REGRESORES = ('svr', 'submuestra', 'nystroem')
+
+
+def crear_regresor(regresor='svr', max_filas_regresor=2000):
+    if regresor == 'svr':
+        return SVR()
+    if regresor == 'submuestra':
+        return SVRSubmuestreado(max_filas=max_filas_regresor)
+    if regresor == 'nystroem':
+        return SVRNystroem(n_componentes=max_filas_regresor)
+    raise ValueError(f"Regresor desconocido: {regresor}. Opciones: {', '.join(REGRESORES)}")
+
+
+def _agrupar_dbscan(XY_scaled, min_samples, cronometro=None):
+    # Un solo índice de vecinos por iteración: el mismo árbol da las
+    # distancias k-NN para fijar eps y el grafo disperso de radio eps que
+    # DBSCAN recibe como distancia precomputada (sin reconstruir su índice)
+    k = min(20, len(XY_scaled) - 1)
+    with etapa(cronometro, 'knn'):
+        neighbors = NearestNeighbors(n_neighbors=k).fit(XY_scaled)
+        distances, _ = neighbors.kneighbors(XY_scaled)
+        distances_k = np.sort(distances[:, k - 1])
+        eps = np.percentile(distances_k, 95)
+
+        grafo = neighbors.radius_neighbors_graph(XY_scaled, radius=eps, mode='distance', sort_results=True)
+    with etapa(cronometro, 'dbscan'):
+        labels = DBSCAN(eps=eps, min_samples=min_samples, metric='precomputed').fit_predict(grafo)
+    return eps, labels
+
+
+def _entrenar_cliente(cliente_id, grupo, usar_temperatura=True, usar_presion=True, median_factor=1.5, max_iter=5, min_samples=8,
+                      regresor='svr', max_filas_regresor=2000):
+    cronometro = Cronometro()
+    grupo = grupo.sort_index()
+
+    relleno = {}
+    for var in ["Temperatura", "Presion"]:
+        if var in grupo.columns:
+            max_val = grupo[var].max(skipna=True)
+            grupo[var] = grupo[var].fillna(100 * max_val)
+            relleno[var] = 100 * max_val
+
+    grupo['Volumen'] = grupo['Volumen'].fillna(100 * grupo['Volumen'].max(skipna=True))
+    grupo['x_seq'] = np.arange(len(grupo))
+
+    features = ['x_seq', 'Mes', 'Dia_Semana']
+    if usar_temperatura and 'Temperatura' in grupo.columns:
+        features.insert(0, 'Temperatura')
+    if usar_presion and 'Presion' in grupo.columns:
+        features.insert(0, 'Presion')
+
+    X_base = grupo[features]
+    Y = grupo['Volumen'].copy()
+
+    SVR_features = [col for col in features if col != 'x_seq']
+    X_base_SVR = grupo[SVR_features]
+    clustering_features = ['x_seq', 'Mes', 'Dia_Semana']
+    X_base_dbscan = grupo[clustering_features]
+
+    outlier_filamentos_idx = set()
+    final_labels = pd.Series(index=grupo.index, data=np.nan)
+    umbral_residual = 0.05 * Y.max()
+
+    # X_base_dbscan no cambia entre iteraciones: se escala una sola vez
+    with cronometro.etapa('escalado'):
+        scaler_X = StandardScaler()
+        X_scaled = scaler_X.fit_transform(X_base_dbscan)
+    Y_modificado = True
+    iteraciones = 0
+
+    for _ in range(max_iter):
+        iteraciones += 1
+        if Y.isna().any():
+            max_y = Y.max(skipna=True)
+            Y = Y.fillna(100 * max_y if not pd.isna(max_y) else 1e6)
+
+        with cronometro.etapa('escalado'):
             scaler_Y = StandardScaler()
             Y_scaled = scaler_Y.fit_transform(Y.values.reshape(-1, 1))
 
             XY_scaled = np.hstack([X_scaled, Y_scaled])
 
-            k = min(20, len(XY_scaled) - 1)
-            neighbors = NearestNeighbors(n_neighbors=k)
-            distances, _ = neighbors.fit(XY_scaled).kneighbors(XY_scaled)
-            distances_k = np.sort(distances[:, k - 1])
-            eps = np.percentile(distances_k, 95)
-
-            db = DBSCAN(eps=eps, min_samples=min_samples)
-            labels = db.fit_predict(XY_scaled)
+        eps, labels = _agrupar_dbscan(XY_scaled, min_samples, cronometro)
+        Y_modificado = False
 
-            inliers_mask = labels != -1
-            if inliers_mask.sum() < 5:
-                break
+        inliers_mask = labels != -1
+        if inliers_mask.sum() < 5:
+            break
 
-            X_train = X_base_SVR[inliers_mask]
-            Y_train = Y[inliers_mask]
-            svr = SVR()
+        X_train = X_base_SVR[inliers_mask]
+        Y_train = Y[inliers_mask]
+        with cronometro.etapa('svr'):
+            svr = crear_regresor(regresor, max_filas_regresor)
             svr.fit(X_train, Y_train)
             Y_pred = svr.predict(X_train)
-            residuals = np.abs(Y_train - Y_pred)
+        residuals = np.abs(Y_train - Y_pred)
 
-            df_temp = pd.DataFrame({'label': labels[inliers_mask], 'residual': residuals})
-            cluster_residual_mean = df_temp.groupby('label')['residual'].mean()
+        df_temp = pd.DataFrame({'label': labels[inliers_mask], 'residual': residuals})
+        cluster_residual_mean = df_temp.groupby('label')['residual'].mean()
 
-            if cluster_residual_mean.empty:
-                break
+        if cluster_residual_mean.empty:
+            break
 
-            top_cluster = cluster_residual_mean.idxmax()
-            top_residual = cluster_residual_mean.max()
-            if top_residual < umbral_residual:
-                break
+        top_cluster = cluster_residual_mean.idxmax()
+        top_residual = cluster_residual_mean.max()
+        if top_residual < umbral_residual:
+            break
 
-            cluster_mask = (labels == top_cluster)
-            cluster_idx = grupo.index[cluster_mask]
-            outlier_filamentos_idx.update(cluster_idx)
-            Y.loc[cluster_idx] = np.nan
+        cluster_mask = (labels == top_cluster)
+        cluster_idx = grupo.index[cluster_mask]
+        outlier_filamentos_idx.update(cluster_idx)
+        Y.loc[cluster_idx] = np.nan
+        Y_modificado = True
 
-        X_final_train = X_base_SVR.drop(index=outlier_filamentos_idx)
-        Y_final_train = Y.drop(index=outlier_filamentos_idx)
-        modelo_final = SVR()
+    X_final_train = X_base_SVR.drop(index=outlier_filamentos_idx)
+    Y_final_train = Y.drop(index=outlier_filamentos_idx)
+    with cronometro.etapa('svr'):
+        modelo_final = crear_regresor(regresor, max_filas_regresor)
         modelo_final.fit(X_final_train, Y_final_train)
 
-        X_to_predict = X_base_SVR.copy()
-        Y_filled = Y.copy()
-        if Y_filled.isna().any():
-            max_y = Y_filled.max(skipna=True)
-            Y_filled = Y_filled.fillna(100 * max_y if not pd.isna(max_y) else 1e6)
+    X_to_predict = X_base_SVR.copy()
+    Y_filled = Y.copy()
+    if Y_filled.isna().any():
+        max_y = Y_filled.max(skipna=True)
+        Y_filled = Y_filled.fillna(100 * max_y if not pd.isna(max_y) else 1e6)
 
+    with cronometro.etapa('svr'):
         Y_pred_final = modelo_final.predict(X_to_predict)
-        mse = mean_squared_error(Y_filled, Y_pred_final)
+    mse = mean_squared_error(Y_filled, Y_pred_final)
+
+    grupo_resultado = grupo.copy()
+    grupo_resultado['Volumen_Predicho'] = Y_pred_final
+    grupo_resultado['MSE'] = mse
+    grupo_resultado['outlier'] = False
+    grupo_resultado.loc[list(outlier_filamentos_idx), 'outlier'] = True
+
+    val_mask = X_to_predict.notnull().all(axis=1) & Y_filled.notnull()
+    X_valid_dbscan = grupo.loc[val_mask, clustering_features]
+    Y_valid = Y_filled[val_mask]
+
+    if not Y_modificado and val_mask.all():
+        # Mismos datos y escaladores que la última iteración: mismas etiquetas
+        labels_pred = labels
+    else:
+        with cronometro.etapa('escalado'):
+            XY_scaled_pred = np.hstack([
+                scaler_X.transform(X_valid_dbscan),
+                scaler_Y.transform(Y_valid.values.reshape(-1, 1))
+            ])
+        with cronometro.etapa('dbscan'):
+            labels_pred = DBSCAN(eps=eps, min_samples=min_samples).fit_predict(XY_scaled_pred)
+    final_labels_partial = pd.Series(index=X_valid_dbscan.index, data=labels_pred)
+    final_labels.update(final_labels_partial)
+
+    grupo_resultado['cluster_dbscan'] = final_labels
+
+    # Estado ajustado del cliente para puntuar lecturas nuevas sin reentrenar
+    paquete = {
+        'cliente': cliente_id,
+        'features': SVR_features,
+        'relleno': relleno,
+        'regresor': modelo_final,
+        'scaler_X': scaler_X,
+        'scaler_Y': scaler_Y,
+        'eps': float(eps),
+        'min_samples': min_samples,
+        'umbral_residual': float(umbral_residual),
+        'filas': len(grupo),
+        'fecha_max': grupo.index.max(),
+        # Perfil del entrenamiento (segundos por etapa) para reportes y benchmarks
+        'perfil': {
+            'iteraciones': iteraciones,
+            'filas_filamento': len(outlier_filamentos_idx),
+            'tiempos': cronometro.resumen(),
+        },
+    }
+    return cliente_id, grupo_resultado, paquete
+
+
+def _preparar_cliente(df):
+    df = df.copy()
+    df['Fecha'] = pd.to_datetime(df['Fecha'])
+    df = df.set_index('Fecha')
+    df['Mes'] = df.index.month
+    df['Dia_Semana'] = df.index.dayofweek
+    return df
+
+
+def entrenar_flujo(clientes, usar_temperatura=True, usar_presion=True, median_factor=1.5, max_iter=5, min_samples=8, n_jobs=1,
+                   regresor='svr', max_filas_regresor=2000, max_pendientes=None):
+    # Entrena un flujo de (cliente_id, df) y genera (cliente_id, resultado,
+    # paquete) a medida que termina cada cliente. Con n_jobs > 1 (o -1 para usar todos
+    # los núcleos) se usa un pool de procesos con a lo sumo max_pendientes
+    # clientes en vuelo (por defecto 2 por proceso), de modo que la memoria
+    # depende de los clientes en curso y no del total.
+    parametros = dict(
+        usar_temperatura=usar_temperatura, usar_presion=usar_presion,
+        median_factor=median_factor, max_iter=max_iter, min_samples=min_samples,
+        regresor=regresor, max_filas_regresor=max_filas_regresor
+    )
 
-        grupo_resultado = grupo.copy()
-        grupo_resultado['Volumen_Predicho'] = Y_pred_final
-        grupo_resultado['MSE'] = mse
-        grupo_resultado['outlier'] = False
-        grupo_resultado.loc[list(outlier_filamentos_idx), 'outlier'] = True
+    if n_jobs is None or n_jobs == 1:
+        for cliente_id, df in clientes:
+            yield _entrenar_cliente(cliente_id, _preparar_cliente(df), **parametros)
+        return
+
+    max_workers = os.cpu_count() if n_jobs < 0 else n_jobs
+    max_pendientes = max_pendientes or 2 * max_workers
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pendientes = set()
+        for cliente_id, df in clientes:
+            pendientes.add(pool.submit(_entrenar_cliente, cliente_id, _preparar_cliente(df), **parametros))
+            if len(pendientes) >= max_pendientes:
+                hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    yield futuro.result()
+        for futuro in as_completed(pendientes):
+            yield futuro.result()
+
+
+def entrenar_clientes(df, usar_temperatura=True, usar_presion=True, median_factor=1.5, max_iter=5, min_samples=8, n_jobs=1,
+                      regresor='svr', max_filas_regresor=2000):
+    # Igual que entrenar_flujo pero a partir de un DataFrame con todos los
+    # clientes; en paralelo se agenda primero a los que tienen más registros
+    grupos = df.groupby("Numero_Cliente")
+    if n_jobs is not None and n_jobs != 1:
+        grupos = sorted(grupos, key=lambda item: len(item[1]), reverse=True)
+    yield from entrenar_flujo(
+        grupos, usar_temperatura, usar_presion, median_factor, max_iter, min_samples, n_jobs,
+        regresor, max_filas_regresor, max_pendientes=len(grupos)
+    )
 
-        val_mask = X_to_predict.notnull().all(axis=1) & Y_filled.notnull()
-        X_valid_dbscan = grupo.loc[val_mask, clustering_features]
-        Y_valid = Y_filled[val_mask]
 
-        XY_scaled_pred = np.hstack([
-            scaler_X.transform(X_valid_dbscan),
-            scaler_Y.transform(Y_valid.values.reshape(-1, 1))
-        ])
-        labels_pred = db.fit_predict(XY_scaled_pred)
-        final_labels_partial = pd.Series(index=X_valid_dbscan.index, data=labels_pred)
-        final_labels.update(final_labels_partial)
+def modelo_hibrido_svr_dbscan_2(df, usar_temperatura=True, usar_presion=True, median_factor=1.5, max_iter=5, min_samples=8, n_jobs=1,
+                                progreso=imprimir_progreso, regresor='svr', max_filas_regresor=2000):
+    # progreso(cliente_id, completados, total) se llama al terminar cada cliente.
+    # regresor: 'svr' (exacto), 'submuestra' o 'nystroem' (costo acotado por
+    # max_filas_regresor); ver comparar_regresores para medir la diferencia.
+    total = df["Numero_Cliente"].nunique()
+    resultados = {}
+    for cliente_id, grupo_resultado, _ in entrenar_clientes(
+        df, usar_temperatura=usar_temperatura, usar_presion=usar_presion, median_factor=median_factor,
+        max_iter=max_iter, min_samples=min_samples, n_jobs=n_jobs,
+        regresor=regresor, max_filas_regresor=max_filas_regresor
+    ):
+        resultados[cliente_id] = grupo_resultado
+        if progreso:
+            progreso(cliente_id, len(resultados), total)
+
+    # Mismo orden que la ejecución en serie (groupby ordena por cliente)
+    return pd.concat([resultados[c] for c in sorted(resultados)])
+
+
+def comparar_regresores(df, regresor='nystroem', max_filas_regresor=2000, **kwargs):
+    # Entrena con el SVR exacto y con el regresor aproximado y reporta, por
+    # cliente, el tiempo de cada uno y la diferencia en Volumen_Predicho y MSE
+    filas = []
+    for cliente_id, grupo in df.groupby("Numero_Cliente"):
+        inicio = time.perf_counter()
+        exacto = modelo_hibrido_svr_dbscan_2(grupo, n_jobs=1, progreso=None, regresor='svr', **kwargs)
+        t_exacto = time.perf_counter() - inicio
 
-        grupo_resultado['cluster_dbscan'] = final_labels
-        resultados.append(grupo_resultado)
-        print(f"CLIENTE {cliente_id} -> DONE")
+        inicio = time.perf_counter()
+        aprox = modelo_hibrido_svr_dbscan_2(
+            grupo, n_jobs=1, progreso=None, regresor=regresor, max_filas_regresor=max_filas_regresor, **kwargs
+        )
+        t_aprox = time.perf_counter() - inicio
+
+        diferencia = np.abs(exacto['Volumen_Predicho'].to_numpy() - aprox['Volumen_Predicho'].to_numpy())
+        filas.append({
+            'Numero_Cliente': cliente_id,
+            'filas': len(grupo),
+            'segundos_exacto': t_exacto,
+            'segundos_aprox': t_aprox,
+            'MSE_exacto': exacto['MSE'].iloc[0],
+            'MSE_aprox': aprox['MSE'].iloc[0],
+            'gap_MSE': aprox['MSE'].iloc[0] - exacto['MSE'].iloc[0],
+            'gap_predicho_medio': diferencia.mean(),
+            'gap_predicho_max': diferencia.max(),
+            'coincidencia_outlier': (exacto['outlier'].to_numpy() == aprox['outlier'].to_numpy()).mean(),
+        })
+    return pd.DataFrame(filas)
+
+
+def umbrales_riesgo(df):
+    # Percentiles 33 y 66 del residual promedio de los clusters outlier de
+    # cada cliente (los mismos cortes que usa riesgo_cluster)
+    clusters = (
+        df[df['outlier'] == 1]
+        .drop_duplicates(['Numero_Cliente', 'cluster_dbscan'])
+        .dropna(subset=['Residual_Promedio_Abs'])
+    )
+    cortes = clusters.groupby('Numero_Cliente')['Residual_Promedio_Abs'].quantile([0.33, 0.66]).unstack()
+    return {cliente: (float(fila[0.33]), float(fila[0.66])) for cliente, fila in cortes.iterrows()}
 
-    return pd.concat(resultados)
 
+# Clase de riesgo según el código de digitize_riesgo; el último valor es para
+# las filas cuyo (cliente, cluster) no tiene resumen
+CLASES_RIESGO = np.array(['Bajo', 'Medio', 'Alto', 'Sin riesgo'], dtype=object)
 
-def riesgo_cluster(df):
-    df_outliers = df[df['outlier'] == 1].copy()
-    resumen = (
-        df_outliers.groupby(['Numero_Cliente', 'cluster_dbscan'])['Residual']
-        .apply(lambda x: np.mean(np.abs(x)))
-        .reset_index(name='Residual_Promedio_Abs')
-    )
 
-    def asignar_riesgo(grupo):
-        p33 = grupo['Residual_Promedio_Abs'].quantile(0.33)
-        p66 = grupo['Residual_Promedio_Abs'].quantile(0.66)
-        grupo = grupo.copy()
-        grupo['Riesgo'] = grupo['Residual_Promedio_Abs'].apply(
-            lambda valor: 'Bajo' if valor <= p33 else 'Medio' if valor <= p66 else 'Alto'
-        )
-        return grupo
+def digitize_riesgo(valor, p33, p66):
+    # Como np.digitize(valor, [p33, p66], right=True) pero con cortes por
+    # fila (los de su cliente). Un NaN, o un cliente sin cortes, queda 'Alto'.
+    return 2 - (valor <= p33).astype(np.int8) - (valor <= p66).astype(np.int8)
 
-    resultado = (
-        resumen.groupby('Numero_Cliente', group_keys=False)
-        .apply(asignar_riesgo)
-        .reset_index(drop=True)
-    )
 
-    df = df.merge(
-        resultado[['Numero_Cliente', 'cluster_dbscan', 'Riesgo', 'Residual_Promedio_Abs']],
-        on=['Numero_Cliente', 'cluster_dbscan'],
-        how='left'
-    )
-    df['Riesgo'] = df['Riesgo'].fillna("Sin riesgo")
-    return df
\ No newline at end of file
+def riesgo_cluster(df):
+    # Residual absoluto promedio por (cliente, cluster) de los outliers y
+    # percentiles 33/66 de esos promedios por cliente, todo con agregaciones
+    # agrupadas; luego cada fila toma la clase de su cluster por posición
+    outliers = df['outlier'] == 1
+    residual_abs = df.loc[outliers, 'Residual'].abs()
+    resumen = residual_abs.groupby(
+        [df.loc[outliers, 'Numero_Cliente'], df.loc[outliers, 'cluster_dbscan']], observed=True
+    ).mean()
+
+    cortes = resumen.groupby(level=0, observed=True).quantile([0.33, 0.66]).unstack()
+    clientes = resumen.index.get_level_values(0)
+    valor = resumen.to_numpy(dtype=np.float64)
+    codigos = digitize_riesgo(
+        valor, cortes[0.33].reindex(clientes).to_numpy(), cortes[0.66].reindex(clientes).to_numpy()
+    ) if len(resumen) else np.array([], dtype=np.int8)
+
+    # -1 (sin resumen) toma el último elemento: 'Sin riesgo' y NaN
+    posiciones = resumen.index.get_indexer(pd.MultiIndex.from_arrays([df['Numero_Cliente'], df['cluster_dbscan']]))
+    df = df.reset_index(drop=True)
+    df['Riesgo'] = np.r_[CLASES_RIESGO[codigos], CLASES_RIESGO[-1:]][posiciones]
+    df['Residual_Promedio_Abs'] = np.r_[valor, np.nan][posiciones]
+    return df
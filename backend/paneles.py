@@ -0,0 +1,257 @@
+import base64
+import json
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+import submuestreo
+from consulta import CLAVES_ORDEN
+
+# ------------------------------------------------------
+# Paneles del dashboard. Cada panel recibe una ConsultaPanel,
+# que filtra el conjunto una sola vez (y solo si algún panel lo
+# necesita), así los endpoints individuales y /dashboard
+# comparten el mismo cálculo.
+# ------------------------------------------------------
+DIAS_ES = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+# Orden de gravedad: el riesgo de un punto agrupado es el máximo de sus registros
+NIVELES_RIESGO = ['Sin riesgo', 'Bajo', 'Medio', 'Alto']
+MINUTO_NS = 60 * 10**9
+
+
+class ConsultaPanel:
+
+    def __init__(self, datos, cliente=None, inicio=None, fin=None, riesgos=None):
+        self.datos = datos
+        self.filtro = {'cliente': cliente, 'inicio': inicio, 'fin': fin, 'riesgos': riesgos}
+        # Filas leídas por los filtros y los paneles (ver metricas.py)
+        self.estadisticas = {'filas_recorridas': 0}
+
+    @cached_property
+    def posiciones(self):
+        return self.datos.indice.posiciones(**self.filtro, estadisticas=self.estadisticas)
+
+    @cached_property
+    def df(self):
+        df = self.datos.indice.df.iloc[self.posiciones]
+        self.estadisticas['filas_recorridas'] += len(df)
+        return df
+
+    @cached_property
+    def posiciones_grafico(self):
+        # El gráfico cuenta los registros sin riesgo como 'Sin riesgo'; el
+        # resultado solo difiere del filtro común si se pide uno y no el otro
+        riesgos = self.filtro['riesgos']
+        if riesgos and ('Sin riesgo' in riesgos) != ('' in riesgos):
+            return self.datos.indice.posiciones(**self.filtro, riesgo_nulo='Sin riesgo', estadisticas=self.estadisticas)
+        return self.posiciones
+
+    def cardinalidad(self):
+        # Registros que cumplen el filtro, si algún panel llegó a calcularlos
+        if 'posiciones' not in self.__dict__:
+            return None
+        posiciones = self.posiciones
+        if isinstance(posiciones, slice):
+            return posiciones.stop - posiciones.start
+        return len(posiciones)
+
+    def filtro_normalizado(self):
+        # Filtro equivalente en forma canónica (para claves de caché y ETag):
+        # 'todos' = sin cliente, riesgos ordenados y fechas fuera del rango
+        # de datos recortadas a "sin límite"
+        cliente, inicio, fin, riesgos = (self.filtro[k] for k in ('cliente', 'inicio', 'fin', 'riesgos'))
+        if not cliente or cliente.lower() == 'todos':
+            cliente = None
+        minimo, maximo = self.datos.indice.rango_fechas(cliente)
+
+        def fecha(valor, limite, antes):
+            if not valor:
+                return None
+            try:
+                valor = pd.Timestamp(valor)
+            except ValueError:
+                return str(valor)
+            if limite is not None and (valor <= limite if antes else valor >= limite):
+                return None
+            return valor.isoformat()
+
+        return {
+            'cliente': cliente,
+            'inicio': fecha(inicio, minimo, True),
+            'fin': fecha(fin, maximo, False),
+            'riesgos': sorted(set(riesgos)) if riesgos else None,
+        }
+
+    def columna(self, nombre, posiciones):
+        # Se indexa antes de convertir: la conversión a float64 es O(k) y no
+        # O(n) sobre la columna entera
+        return self.datos.indice.df[nombre].to_numpy()[posiciones].astype(np.float64)
+
+
+def kpis(consulta):
+    if consulta.datos.cubo.alineado:
+        return consulta.datos.cubo.kpis(**consulta.filtro)
+
+    df_filtrado = consulta.df
+    return {
+        'total_clientes': df_filtrado['Numero_Cliente'].nunique(),
+        'total_anomalias': int(df_filtrado['outlier'].sum()) if 'outlier' in df_filtrado.columns else 0,
+        'alertas_criticas': int(df_filtrado[df_filtrado['Riesgo'] == 'Alto'].shape[0]),
+        'promedio_volumen': round(float(df_filtrado['Volumen'].mean()), 2),
+        'promedio_presion': round(float(df_filtrado['Presion'].mean()), 2),
+        'promedio_temperatura': round(float(df_filtrado['Temperatura'].mean()), 2)
+    }
+
+
+def _sumar_por_grupo(valores, inicios):
+    # Media por grupo ignorando NaN (como el mean de pandas)
+    validos = ~np.isnan(valores)
+    sumas = np.add.reduceat(np.where(validos, valores, 0.0), inicios)
+    cuentas = np.add.reduceat(validos.astype(np.int64), inicios)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(cuentas > 0, sumas / np.maximum(cuentas, 1), np.nan)
+
+
+def grafico_volumen(consulta, max_puntos=None, metodo='lttb'):
+    # Serie por minuto (promedio de todos los clientes filtrados). Con
+    # max_puntos se reduce a lo sumo a esa cantidad de puntos con LTTB o
+    # min/max por cubetas de tiempo; el riesgo de cada punto es el máximo
+    # de su cubeta, así una anomalía no desaparece al reducir.
+    indice = consulta.datos.indice
+    posiciones = consulta.posiciones_grafico
+    if indice.codigos_riesgo is None:
+        return {"datos": []}
+    minutos = indice.fechas[posiciones] // MINUTO_NS
+    consulta.estadisticas['filas_recorridas'] += len(minutos)
+    if len(minutos) == 0:
+        return {"datos": []}
+
+    # Agrupar por minuto: los datos vienen ordenados por cliente, no por fecha
+    orden = np.argsort(minutos, kind='stable')
+    minutos = minutos[orden]
+    inicios = np.flatnonzero(np.r_[True, minutos[1:] != minutos[:-1]])
+    minutos = minutos[inicios]
+    medias = {
+        col: _sumar_por_grupo(consulta.columna(col, posiciones)[orden], inicios)
+        for col in ('Volumen', 'Presion', 'Temperatura')
+    }
+    ordinal = np.array([NIVELES_RIESGO.index(c) if c in NIVELES_RIESGO else 0 for c in indice.categorias_riesgo] + [0])
+    riesgo = np.maximum.reduceat(ordinal[indice.codigos_riesgo[posiciones][orden]], inicios)
+
+    if max_puntos and len(minutos) > max_puntos:
+        elegidos, cubeta = submuestreo.reducir(minutos, medias['Volumen'], max_puntos, metodo)
+        riesgo = submuestreo.maximo_por_cubeta(riesgo, cubeta)
+        minutos, riesgo = minutos[elegidos], riesgo[elegidos]
+        medias = {col: valores[elegidos] for col, valores in medias.items()}
+
+    etiquetas = np.datetime_as_string(minutos.astype('datetime64[m]'), unit='m')
+    return {
+        "datos": [
+            {
+                "x": x.replace('T', ' '),
+                "y": y,
+                "presion": presion,
+                "temperatura": temperatura,
+                "riesgo": NIVELES_RIESGO[r]
+            }
+            for x, y, presion, temperatura, r in zip(
+                etiquetas.tolist(),
+                np.round(medias['Volumen'], 2).tolist(),
+                np.round(medias['Presion'], 2).tolist(),
+                np.round(medias['Temperatura'], 2).tolist(),
+                riesgo.tolist()
+            )
+        ]
+    }
+
+
+def riesgo_por_cliente(consulta):
+    conteo = consulta.df.groupby(['Numero_Cliente', 'Riesgo']).size().unstack(fill_value=0)
+
+    return {
+        "clientes": list(conteo.index),
+        "riesgos": list(conteo.columns),
+        "valores": conteo.to_dict(orient='list')
+    }
+
+
+def _matriz(heatmap):
+    return {
+        "dias": list(heatmap.index),
+        "horas": [str(h).zfill(2) for h in heatmap.columns],
+        "matriz": heatmap.fillna(0).values.tolist()
+    }
+
+
+def anomalias_por_dia_hora(consulta):
+    vacio = {"dias": [], "horas": [], "matriz": []}
+    datos = consulta.datos
+    if datos.cubo.alineado:
+        heatmap = datos.cubo.matriz_anomalias(**consulta.filtro)
+        return vacio if heatmap.empty else _matriz(heatmap)
+
+    if 'outlier' not in datos.df.columns:
+        return vacio
+    df_filtrado = consulta.df
+    df_filtrado = df_filtrado[df_filtrado['outlier'] == True]
+    if df_filtrado.empty:
+        return vacio
+
+    dia_nombre = df_filtrado['Fecha'].dt.dayofweek.map(dict(enumerate(DIAS_ES))).rename('dia_nombre')
+    hora = df_filtrado['Fecha'].dt.hour.rename('hora')
+    heatmap = df_filtrado.groupby([dia_nombre, hora]).size().unstack(fill_value=0)
+    # Esto asegura el orden correcto
+    return _matriz(heatmap.reindex(DIAS_ES))
+
+
+def codificar_cursor(version, orden, rango):
+    texto = json.dumps({'v': version, 'o': orden, 'r': rango}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, version, orden):
+    # El cursor es el rango global del último registro entregado; solo vale
+    # para la misma versión y el mismo orden
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        rango = int(datos['r'])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Cursor inválido")
+    if datos.get('v') != version or datos.get('o') != orden:
+        raise ValueError("El cursor corresponde a otra versión del modelo u otro orden")
+    return rango
+
+
+def tabla_registros(consulta, orden='riesgo', limite=30, cursor=None):
+    # Página de registros en el orden pedido ('riesgo', 'residual' o 'fecha')
+    # y cursor de la siguiente. Solo se ordenan los registros de la página.
+    if orden not in CLAVES_ORDEN:
+        raise ValueError(f"Orden desconocido: {orden} (usar {', '.join(CLAVES_ORDEN)})")
+    version = consulta.datos.version
+    despues = decodificar_cursor(cursor, version, orden) if cursor else -1
+    posiciones, ultimo = consulta.datos.indice.pagina(orden, **consulta.filtro, despues=despues, limite=limite,
+                                                     estadisticas=consulta.estadisticas)
+
+    columnas = ['Fecha', 'Presion', 'Temperatura', 'Volumen', 'Volumen_Predicho', 'Residual', 'Riesgo']
+    df_pagina = consulta.datos.indice.df[columnas].take(posiciones)
+    df_pagina['Riesgo'] = df_pagina['Riesgo'].astype(object).fillna('')
+    # Las medidas se sirven en float32: se devuelven con su representación
+    # más corta (115.84423 y no 115.84423065185547)
+    for col in df_pagina.columns[df_pagina.dtypes == np.float32]:
+        df_pagina[col] = df_pagina[col].astype(str).astype(float)
+    df_pagina['Fecha'] = pd.to_datetime(df_pagina['Fecha']).dt.strftime('%Y-%m-%d %H:%M:%S')
+
+    return {
+        "registros": df_pagina.to_dict(orient='records'),
+        "siguiente": codificar_cursor(version, orden, ultimo) if len(posiciones) == limite else None
+    }
+
+
+PANELES = {
+    'kpis': kpis,
+    'grafico_volumen': grafico_volumen,
+    'riesgo_por_cliente': riesgo_por_cliente,
+    'anomalias_por_dia_hora': anomalias_por_dia_hora,
+    'tabla_registros': tabla_registros,
+}
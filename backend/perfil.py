@@ -0,0 +1,38 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# ------------------------------------------------------
+# Medición de tiempos por etapa. Un Cronometro acumula los
+# segundos de cada etapa (una etapa puede repetirse, p. ej. una
+# vez por iteración) y se devuelve como diccionario simple para
+# que viaje entre procesos y se pueda guardar en JSON.
+# ------------------------------------------------------
+class Cronometro:
+
+    def __init__(self):
+        self.tiempos = defaultdict(float)
+        self.inicio = time.perf_counter()
+
+    @contextmanager
+    def etapa(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tiempos[nombre] += time.perf_counter() - inicio
+
+    def resumen(self):
+        tiempos = {nombre: round(segundos, 6) for nombre, segundos in self.tiempos.items()}
+        tiempos['total'] = round(time.perf_counter() - self.inicio, 6)
+        return tiempos
+
+
+@contextmanager
+def _sin_medir(nombre):
+    yield
+
+
+def etapa(cronometro, nombre):
+    # Permite instrumentar funciones que reciben cronometro=None
+    return cronometro.etapa(nombre) if cronometro is not None else _sin_medir(nombre)
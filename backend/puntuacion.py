@@ -0,0 +1,88 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import almacen
+
+# ------------------------------------------------------
+# Puntuación en línea de lecturas nuevas con los modelos
+# ajustados por cliente de una versión del almacén. Los paquetes
+# se cargan bajo demanda y se mantienen en una caché LRU por
+# (versión, cliente), así que cambiar de versión no mezcla modelos.
+# ------------------------------------------------------
+MAX_PAQUETES = int(os.environ.get("CONTUGAS_MAX_PAQUETES", "64"))
+COLUMNAS_LECTURA = ['cliente', 'Fecha', 'Temperatura', 'Presion', 'Volumen']
+
+
+@lru_cache(maxsize=MAX_PAQUETES)
+def cargar_paquete(version, cliente):
+    return almacen.cargar_paquete(version, cliente)
+
+
+def clasificar_riesgo(residual_abs, umbral_residual, umbrales):
+    # Mismos cortes que riesgo_cluster: Bajo <= p33 < Medio <= p66 < Alto
+    riesgo = np.full(len(residual_abs), 'Sin riesgo', dtype=object)
+    anomalo = residual_abs >= umbral_residual
+    if umbrales is None:
+        riesgo[anomalo] = 'Alto'
+        return anomalo, riesgo
+    p33, p66 = umbrales
+    riesgo[anomalo] = np.where(
+        residual_abs[anomalo] <= p33, 'Bajo', np.where(residual_abs[anomalo] <= p66, 'Medio', 'Alto')
+    )
+    return anomalo, riesgo
+
+
+def puntuar_cliente(lecturas, paquete):
+    X = pd.DataFrame({
+        'Temperatura': lecturas['Temperatura'],
+        'Presion': lecturas['Presion'],
+        'Mes': lecturas['Fecha'].dt.month,
+        'Dia_Semana': lecturas['Fecha'].dt.dayofweek,
+    }, index=lecturas.index)
+    for var, valor in paquete['relleno'].items():
+        X[var] = X[var].fillna(valor)
+
+    predicho = paquete['regresor'].predict(X[paquete['features']])
+    residual = lecturas['Volumen'].to_numpy(dtype=np.float64) - predicho
+    anomalo, riesgo = clasificar_riesgo(
+        np.abs(residual), paquete['umbral_residual'], paquete.get('umbrales_riesgo')
+    )
+    return pd.DataFrame({
+        'Volumen_Predicho': predicho,
+        'Residual': residual,
+        'outlier': anomalo,
+        'Riesgo': riesgo,
+    }, index=lecturas.index)
+
+
+def puntuar_lecturas(lecturas, buscar, puntuar_grupo=puntuar_cliente):
+    # lecturas: DataFrame con COLUMNAS_LECTURA. Devuelve una fila por lectura
+    # en el mismo orden; los clientes sin modelo quedan con 'error'.
+    # buscar(cliente) da el paquete del cliente (None si no tiene modelo) y
+    # puntuar_grupo(lecturas válidas del cliente, paquete) sus puntuaciones
+    lecturas = lecturas.reindex(columns=COLUMNAS_LECTURA).reset_index(drop=True)
+    lecturas['Fecha'] = pd.to_datetime(lecturas['Fecha'], errors='coerce', format='mixed')
+    for col in ('Temperatura', 'Presion', 'Volumen'):
+        lecturas[col] = pd.to_numeric(lecturas[col], errors='coerce')
+
+    partes = []
+    for cliente, grupo in lecturas.groupby('cliente', sort=False, dropna=False):
+        paquete = buscar(cliente) if isinstance(cliente, str) else None
+        if paquete is None:
+            partes.append(pd.DataFrame({'error': 'Cliente sin modelo'}, index=grupo.index))
+            continue
+        validas = grupo['Fecha'].notna() & grupo['Volumen'].notna()
+        if (~validas).any():
+            partes.append(pd.DataFrame({'error': 'Fecha o Volumen inválido'}, index=grupo.index[~validas]))
+        if validas.any():
+            partes.append(puntuar_grupo(grupo[validas], paquete))
+
+    resultado = pd.concat(partes).reindex(lecturas.index) if partes else pd.DataFrame(index=lecturas.index)
+    return pd.concat([lecturas[['cliente', 'Fecha']], resultado], axis=1)
+
+
+def puntuar(lecturas, version):
+    return puntuar_lecturas(lecturas, lambda cliente: cargar_paquete(version, cliente))
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import joblib
+import pandas as pd
+from openpyxl import load_workbook
+
+import almacen
+from conjunto import preparar_servicio
+from ingesta import agregar_variables_calendario, leer_clientes
+from modelo import entrenar_flujo, imprimir_progreso, riesgo_cluster, umbrales_riesgo
+from perfil import Cronometro
+
+# ------------------------------------------------------
+# Flujo de reentrenamiento compartido por entrenamiento_modelo.py
+# y admin_modelos.py: lee los clientes de a uno, los entrena a
+# medida que llegan y guarda el resultado como versión nueva.
+# ------------------------------------------------------
+# Procesos para entrenar clientes en paralelo (1 = en serie, -1 = todos los núcleos)
+N_JOBS = int(os.environ.get("CONTUGAS_N_JOBS", "1"))
+# Regresor: 'svr' (exacto), 'submuestra' o 'nystroem' (costo acotado)
+REGRESOR = os.environ.get("CONTUGAS_REGRESOR", "svr")
+MAX_FILAS_REGRESOR = int(os.environ.get("CONTUGAS_MAX_FILAS_REGRESOR", "2000"))
+
+# Caché por cliente para el reentrenamiento incremental. Cambiar
+# VERSION_MODELO invalida todas las entradas (p. ej. si cambia modelo.py).
+DIR_CACHE = os.path.join(almacen.DATA_DIR, 'cache_clientes')
+VERSION_MODELO = 1
+COLUMNAS_ENTRADA = ['Fecha', 'Presion', 'Temperatura', 'Volumen']
+
+
+def huella_cliente(df, parametros):
+    # Hash del contenido de entrada del cliente más los parámetros del modelo
+    columnas = [c for c in COLUMNAS_ENTRADA if c in df.columns]
+    h = hashlib.sha256()
+    h.update(json.dumps({'version': VERSION_MODELO, 'columnas': columnas, **parametros}, sort_keys=True).encode())
+    h.update(pd.util.hash_pandas_object(df[columnas], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class CacheClientes:
+    # Un directorio por cliente con el resultado del modelo (<huella>.arrow)
+    # y el paquete ajustado (<huella>.joblib) de la última huella entrenada
+
+    def __init__(self, directorio=DIR_CACHE):
+        self.directorio = directorio
+
+    def _ruta(self, cliente_id, huella, extension):
+        return os.path.join(self.directorio, str(cliente_id), f'{huella}.{extension}')
+
+    def leer(self, cliente_id, huella):
+        ruta_resultado = self._ruta(cliente_id, huella, 'arrow')
+        ruta_paquete = self._ruta(cliente_id, huella, 'joblib')
+        if not (os.path.exists(ruta_resultado) and os.path.exists(ruta_paquete)):
+            return None
+        return pd.read_feather(ruta_resultado), joblib.load(ruta_paquete)
+
+    def guardar(self, cliente_id, huella, resultado, paquete):
+        ruta_resultado = self._ruta(cliente_id, huella, 'arrow')
+        ruta_paquete = self._ruta(cliente_id, huella, 'joblib')
+        directorio = os.path.dirname(ruta_resultado)
+        os.makedirs(directorio, exist_ok=True)
+
+        temporal = f'{ruta_paquete}.{os.getpid()}.tmp'
+        joblib.dump(paquete, temporal)
+        os.replace(temporal, ruta_paquete)
+        # El resultado se escribe al final: sin él la entrada no se considera válida
+        temporal = f'{ruta_resultado}.{os.getpid()}.tmp'
+        resultado.reset_index(drop=True).to_feather(temporal)
+        os.replace(temporal, ruta_resultado)
+
+        # Las huellas anteriores del cliente ya no sirven
+        vigentes = {os.path.basename(ruta_resultado), os.path.basename(ruta_paquete)}
+        for nombre in os.listdir(directorio):
+            if nombre not in vigentes and not nombre.endswith('.tmp'):
+                os.remove(os.path.join(directorio, nombre))
+
+
+def contar_clientes(ruta_entrada):
+    libro = load_workbook(ruta_entrada, read_only=True)
+    try:
+        return len(libro.sheetnames)
+    finally:
+        libro.close()
+
+
+def clientes_almacen(version):
+    # (cliente_id, df) con las columnas de entrada de una versión del almacén,
+    # p. ej. para reajustar con las lecturas agregadas por incremental.py
+    tabla = almacen.abrir_tabla(version, COLUMNAS_ENTRADA)
+    for cliente_id, (a, b) in almacen.leer_meta(version)['clientes'].items():
+        df = tabla.slice(a, b - a).to_pandas()
+        df['Numero_Cliente'] = cliente_id
+        yield cliente_id, agregar_variables_calendario(df)
+
+
+def reentrenar(ruta_entrada, puntero='nuevo', **kwargs):
+    # Reentrena a partir del libro de entrada (una hoja por cliente)
+    return reentrenar_clientes(leer_clientes(ruta_entrada), contar_clientes(ruta_entrada), puntero, **kwargs)
+
+
+def reentrenar_clientes(clientes, total, puntero='nuevo', usar_temperatura=True, usar_presion=False,
+                        n_jobs=N_JOBS, regresor=REGRESOR, max_filas_regresor=MAX_FILAS_REGRESOR,
+                        progreso=imprimir_progreso, incremental=True, cache=None):
+    # clientes: iterable de (cliente_id, df). Con incremental=True solo se
+    # entrenan los clientes nuevos o cuyos datos (o parámetros) cambiaron; el
+    # resto se toma de la caché por cliente
+    parametros = dict(
+        usar_temperatura=usar_temperatura, usar_presion=usar_presion,
+        regresor=regresor, max_filas_regresor=max_filas_regresor
+    )
+    cache = cache or CacheClientes()
+    cronometro = Cronometro()
+    resultados = []
+    paquetes = {}
+    huellas = {}
+
+    def clientes_a_entrenar():
+        lector = iter(clientes)
+        while True:
+            with cronometro.etapa('lectura'):
+                siguiente = next(lector, None)
+            if siguiente is None:
+                return
+            cliente_id, df = siguiente
+            with cronometro.etapa('cache'):
+                huella = huella_cliente(df, parametros)
+                en_cache = cache.leer(cliente_id, huella) if incremental else None
+            if en_cache is not None:
+                resultados.append(en_cache[0])
+                paquetes[cliente_id] = en_cache[1]
+                continue
+            huellas[cliente_id] = huella
+            yield cliente_id, df
+
+    for cliente_id, resultado, paquete in entrenar_flujo(clientes_a_entrenar(), n_jobs=n_jobs, **parametros):
+        # Conservar la fecha como columna y calcular el residual que usa riesgo_cluster
+        resultado = resultado.reset_index()
+        resultado['Residual'] = resultado['Volumen'] - resultado['Volumen_Predicho']
+        with cronometro.etapa('cache'):
+            cache.guardar(cliente_id, huellas[cliente_id], resultado, paquete)
+        resultados.append(resultado)
+        paquetes[cliente_id] = paquete
+        if progreso:
+            progreso(cliente_id, len(resultados), total)
+
+    print(f"Clientes reentrenados: {len(huellas)} | reutilizados de la caché: {len(resultados) - len(huellas)}")
+
+    with cronometro.etapa('riesgo_cluster'):
+        df_resultado = pd.concat(resultados, ignore_index=True)
+        df_resultado_riesgo = riesgo_cluster(df_resultado)
+
+        # Cortes de riesgo por cliente para la puntuación en línea
+        umbrales = umbrales_riesgo(df_resultado_riesgo)
+        for cliente_id, paquete in paquetes.items():
+            paquete['umbrales_riesgo'] = umbrales.get(cliente_id)
+
+    with cronometro.etapa('guardado'):
+        version = almacen.guardar_resultado(
+            df_resultado_riesgo, puntero=None, paquetes=paquetes,
+            metadatos={'clientes_reentrenados': sorted(huellas)}
+        )
+
+    # El reporte, el índice y los cubos quedan junto al resultado antes de
+    # publicar el puntero
+    almacen.guardar_reporte(version, reporte_entrenamiento(version, paquetes, huellas, cronometro))
+    preparar_servicio(version)
+    if puntero:
+        almacen.fijar_puntero(puntero, version)
+    return version
+
+
+def reporte_entrenamiento(version, paquetes, reentrenados, cronometro):
+    # Tiempos del flujo completo ('modelo' = tiempo de pared del entrenamiento,
+    # el resto de 'total' menos las etapas medidas) y perfil de cada cliente.
+    # Los clientes tomados de la caché conservan el perfil de cuando se entrenaron.
+    etapas = cronometro.resumen()
+    etapas['modelo'] = round(max(etapas['total'] - sum(v for k, v in etapas.items() if k != 'total'), 0.0), 6)
+    clientes = {
+        cliente_id: {
+            'reutilizado': cliente_id not in reentrenados,
+            'filas': paquete.get('filas'),
+            **paquete.get('perfil', {}),
+        }
+        for cliente_id, paquete in sorted(paquetes.items())
+    }
+    suma_etapas = {}
+    for cliente_id, datos in clientes.items():
+        if datos['reutilizado']:
+            continue
+        for etapa, segundos in datos.get('tiempos', {}).items():
+            suma_etapas[etapa] = round(suma_etapas.get(etapa, 0.0) + segundos, 6)
+    return {
+        'version': version,
+        'creado': datetime.now().isoformat(timespec='seconds'),
+        'clientes_total': len(clientes),
+        'clientes_reentrenados': len(reentrenados),
+        'etapas': etapas,
+        # Suma por etapa de los clientes reentrenados (con n_jobs > 1 es tiempo de CPU entre procesos)
+        'etapas_clientes': suma_etapas,
+        'clientes': clientes,
+    }
@@ -8,15 +8,15 @@ echo ========================================
 :: Ejecutar el script de entrenamiento
 python entrenamiento_modelo.py
 
-IF EXIST data\resultado_modelo_nuevo.xlsx (
+IF EXIST data\resultados\nuevo (
     echo Modelo entrenado correctamente.
 ) ELSE (
-    echo ERROR: No se generó el archivo resultado_modelo_nuevo.xlsx
+    echo ERROR: No se generó una versión nueva en data\resultados
     pause
     exit /b 1
 )
 
-IF EXIST data\resultado_modelo_actual.xlsx (
+IF EXIST data\resultados\actual (
     echo Comparando modelo nuevo con actual...
     python -c "from admin_modelos import comparar_modelos; comparar_modelos()"
 ) ELSE (
@@ -25,7 +25,7 @@ IF EXIST data\resultado_modelo_actual.xlsx (
 
 set /p confirm="¿Deseas aplicar el modelo nuevo como oficial? (s/n): "
 if "%confirm%"=="s" (
-    copy /Y data\resultado_modelo_nuevo.xlsx data\resultado_modelo_actual.xlsx
+    python -c "from admin_modelos import aplicar_nuevo_modelo; aplicar_nuevo_modelo()"
     echo Modelo nuevo aplicado correctamente.
 ) else (
     echo El modelo nuevo NO fue aplicado.
@@ -0,0 +1,77 @@
+import numpy as np
+
+# ------------------------------------------------------
+# Reducción de series temporales para graficar. Los puntos llegan
+# ordenados por tiempo y se reparten en cubetas de igual duración;
+# de cada cubeta se conserva el punto que mejor preserva la forma
+# (LTTB) o sus extremos (min/max). Devuelven las posiciones de los
+# puntos elegidos y la cubeta de cada punto de entrada.
+# ------------------------------------------------------
+METODOS = ('lttb', 'minmax')
+# LTTB conserva el primer y el último punto y al menos una cubeta
+MIN_PUNTOS = 3
+
+
+def cubetas_tiempo(t, n_cubetas):
+    # t: enteros ordenados (p. ej. minutos). Cubetas de igual duración.
+    t = t - t[0]
+    return t * n_cubetas // (t[-1] + 1)
+
+
+def _cortes(cubeta):
+    return np.flatnonzero(np.r_[True, cubeta[1:] != cubeta[:-1]])
+
+
+def maximo_por_cubeta(valores, cubeta):
+    # Valor máximo de cada punto en su cubeta (p. ej. el riesgo ordinal)
+    inicios = _cortes(cubeta)
+    maximos = np.maximum.reduceat(valores, inicios)
+    return maximos[np.cumsum(np.r_[0, cubeta[1:] != cubeta[:-1]])]
+
+
+def min_max(y, cubeta):
+    # Mínimo y máximo de cada cubeta (los NaN nunca se eligen si hay valores)
+    n = len(y)
+    nulos = np.isnan(y)
+    orden_min = np.lexsort((np.where(nulos, np.inf, y), cubeta))
+    orden_max = np.lexsort((np.where(nulos, -np.inf, y), cubeta))
+    inicios = _cortes(cubeta)
+    fines = np.r_[inicios[1:], n] - 1
+    return np.unique(np.r_[orden_min[inicios], orden_max[fines]])
+
+
+def lttb(x, y, cubeta):
+    # Largest-Triangle-Three-Buckets sobre cubetas de tiempo. El primer y el
+    # último punto siempre se conservan; el recorrido es por cubeta (no por
+    # punto), así que el costo en Python queda acotado por n_cubetas.
+    n = len(y)
+    if n <= 2:
+        return np.arange(n)
+    finitos = np.isfinite(y)
+    y = np.where(finitos, y, np.nanmean(y) if finitos.any() else 0.0)
+
+    limites = np.r_[0, _cortes(cubeta[1:-1]) + 1, n - 1, n]
+    sumas_x = np.add.reduceat(x, limites[:-1])
+    sumas_y = np.add.reduceat(y, limites[:-1])
+    tamanos = np.diff(limites)
+    medias_x, medias_y = sumas_x / tamanos, sumas_y / tamanos
+
+    elegidos = [0]
+    a = 0
+    for k in range(1, len(limites) - 2):
+        ini, fin = limites[k], limites[k + 1]
+        xc, yc = medias_x[k + 1], medias_y[k + 1]
+        area = np.abs((x[a] - xc) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (yc - y[a]))
+        a = ini + int(area.argmax())
+        elegidos.append(a)
+    elegidos.append(n - 1)
+    return np.asarray(elegidos)
+
+
+def reducir(x, y, max_puntos, metodo='lttb'):
+    # Devuelve (posiciones elegidas, cubeta de cada punto de entrada)
+    if metodo == 'minmax':
+        cubeta = cubetas_tiempo(x, max(max_puntos // 2, 1))
+        return min_max(y, cubeta), cubeta
+    cubeta = cubetas_tiempo(x, max(max_puntos - 2, 1))
+    return lttb(x.astype(np.float64), y, cubeta), cubeta
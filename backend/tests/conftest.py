@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos del backend se importan como en el servidor (desde backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import almacen  # noqa: E402
+
+
+@pytest.fixture
+def almacen_temporal(tmp_path, monkeypatch):
+    # Almacén vacío en un directorio temporal
+    monkeypatch.setattr(almacen, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(almacen, 'DIR_RESULTADOS', str(tmp_path / 'resultados'))
+    return tmp_path
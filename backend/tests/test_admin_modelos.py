@@ -0,0 +1,25 @@
+import pytest
+
+import admin_modelos
+import almacen
+
+
+@pytest.mark.parametrize('mae_actual, mae_nuevo, esperado', [
+    (2.0, 1.0, 'El modelo NUEVO es mejor.'),
+    (1.0, 2.0, 'El modelo ACTUAL es mejor.'),
+    (1.0, None, 'No hay lecturas comparables'),
+    (None, None, 'No hay lecturas comparables'),
+])
+def test_comparar_modelos_elige_por_mae(monkeypatch, tmp_path, capsys, mae_actual, mae_nuevo, esperado):
+    total = {
+        'mae_actual': mae_actual, 'mae_nuevo': mae_nuevo, 'mse_actual': None, 'mse_nuevo': None,
+        'coincidencia_outlier': None, 'tasa_cambio_riesgo': None,
+    }
+    monkeypatch.setattr(almacen, 'leer_puntero', lambda nombre: f'v_{nombre}')
+    monkeypatch.setattr(almacen, 'guardar_reporte', lambda *args: str(tmp_path / 'comparacion.json'))
+    monkeypatch.setattr(admin_modelos, 'comparar_versiones', lambda actual, nueva: {'total': total})
+    admin_modelos.comparar_modelos()
+    salida = capsys.readouterr().out
+    assert esperado in salida
+    if mae_nuevo is None:
+        assert 'MAE del modelo nuevo : sin datos' in salida
@@ -0,0 +1,32 @@
+import os
+
+import joblib
+import pandas as pd
+import pytest
+
+import almacen
+
+
+@pytest.fixture
+def version_con_modelo(almacen_temporal):
+    df = pd.DataFrame({
+        'Numero_Cliente': ['CLIENTE1'] * 3,
+        'Fecha': pd.date_range('2024-01-01', periods=3, freq='h'),
+        'Volumen': [1.0, 2.0, 3.0],
+    })
+    version = almacen.guardar_resultado(df, puntero='actual', paquetes={'CLIENTE1': {'cliente': 'CLIENTE1'}})
+    # Pickle fuera del directorio de modelos de la versión
+    joblib.dump({'cliente': 'ajeno'}, os.path.join(almacen.ruta_version(version), 'ajeno.joblib'))
+    joblib.dump({'cliente': 'ajeno'}, os.path.join(almacen_temporal, 'ajeno.joblib'))
+    return version
+
+
+def test_cargar_paquete_de_un_cliente_con_modelo(version_con_modelo):
+    assert almacen.cargar_paquete(version_con_modelo, 'CLIENTE1') == {'cliente': 'CLIENTE1'}
+
+
+@pytest.mark.parametrize('cliente', [
+    '../ajeno', '../../../ajeno', 'CLIENTE1/../../ajeno', '..', os.sep + 'ajeno', 'CLIENTE2', '', None, 5,
+])
+def test_cargar_paquete_rechaza_clientes_sin_modelo(version_con_modelo, cliente):
+    assert almacen.cargar_paquete(version_con_modelo, cliente) is None
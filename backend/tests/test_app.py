@@ -0,0 +1,125 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import almacen
+from conjunto import ConjuntoDatos, compactar
+from paneles import ConsultaPanel
+
+# Formas equivalentes del mismo filtro: misma clave de caché y mismo ETag
+EQUIVALENTES = [
+    ('', 'cliente=todos', 'cliente=TODOS', 'inicio=2023-01-01&fin=2030-01-01'),
+    ('riesgos=Alto,Bajo', 'riesgos=Bajo,Alto', 'riesgos=Bajo,Alto,Bajo'),
+    ('cliente=CLIENTE1&inicio=2024-01-05', 'inicio=2024-01-05 00:00&cliente=CLIENTE1',
+     'cliente=CLIENTE1&inicio=2024-01-05T00:00:00&fin=2024-12-31'),
+]
+
+
+def _lecturas():
+    rng = np.random.default_rng(0)
+    partes = []
+    for i in range(3):
+        n = 24 * 20
+        outlier = rng.random(n) < 0.1
+        partes.append(pd.DataFrame({
+            'Numero_Cliente': f'CLIENTE{i}',
+            'Fecha': pd.date_range('2024-01-01', periods=n, freq='h'),
+            'Presion': rng.normal(10, 1, n),
+            'Temperatura': rng.normal(20, 2, n),
+            'Volumen': rng.normal(100, 10, n),
+            'Volumen_Predicho': rng.normal(100, 10, n),
+            'Residual': rng.normal(0, 5, n),
+            'outlier': outlier,
+            'Riesgo': np.where(outlier, rng.choice(['Bajo', 'Medio', 'Alto'], n), None),
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def app_modulo(tmp_path_factory):
+    # La app carga la versión 'actual' al importarse: se importa con un
+    # almacén temporal que ya tiene una
+    directorio = tmp_path_factory.mktemp('datos')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(almacen, 'DATA_DIR', str(directorio))
+        mp.setattr(almacen, 'DIR_RESULTADOS', str(directorio / 'resultados'))
+        mp.setenv('CONTUGAS_INTERVALO_RECARGA', '0')
+        almacen.guardar_resultado(_lecturas(), puntero='actual')
+        yield importlib.import_module('app')
+
+
+@pytest.fixture
+def cliente(app_modulo):
+    app_modulo.cache.limpiar()
+    return app_modulo.app.test_client()
+
+
+def test_filtro_normalizado():
+    datos = ConjuntoDatos(compactar(_lecturas()))
+
+    def normalizado(**filtro):
+        return ConsultaPanel(datos, **filtro).filtro_normalizado()
+
+    assert normalizado() == normalizado(cliente='todos') == normalizado(cliente='Todos', inicio='2023-12-01')
+    assert normalizado(fin='2024-01-20 23:00') == normalizado(fin='2025-01-01') == normalizado()
+    assert normalizado(fin='2024-01-20 22:00') != normalizado()
+    assert normalizado(riesgos=['Medio', 'Alto', 'Medio']) == normalizado(riesgos=['Alto', 'Medio'])
+    assert normalizado(inicio='2024-01-05') == normalizado(inicio='2024-01-05 00:00:00')
+    # El rango se mide sobre el cliente pedido, no sobre todos
+    assert normalizado(cliente='CLIENTE2', inicio='2024-01-01') == normalizado(cliente='CLIENTE2')
+    assert normalizado(inicio='no es fecha')['inicio'] == 'no es fecha'
+
+
+@pytest.mark.parametrize('formas', EQUIVALENTES)
+def test_filtros_equivalentes_comparten_la_entrada(app_modulo, cliente, formas):
+    respuestas = [cliente.get(f'/kpis?{forma}') for forma in formas]
+    assert all(r.status_code == 200 for r in respuestas)
+    assert all(r.get_data() == respuestas[0].get_data() for r in respuestas)
+    estadisticas = app_modulo.cache.estadisticas()
+    assert estadisticas['entradas'] == 1
+    assert estadisticas['aciertos'] >= len(formas) - 1
+
+
+@pytest.mark.parametrize('formas', EQUIVALENTES)
+def test_dashboard_etag(cliente, formas):
+    etags = {cliente.get(f'/dashboard?paneles=kpis,grafico_volumen&{forma}').headers['ETag'] for forma in formas}
+    assert len(etags) == 1
+    etag = etags.pop()
+    for forma in formas:
+        respuesta = cliente.get(f'/dashboard?paneles=kpis,grafico_volumen&{forma}', headers={'If-None-Match': etag})
+        assert respuesta.status_code == 304
+        assert respuesta.get_data() == b''
+
+
+def test_dashboard_etag_cambia_con_el_filtro_y_la_version(app_modulo, cliente):
+    respuesta = cliente.get('/dashboard?paneles=kpis')
+    etag = respuesta.headers['ETag']
+    assert respuesta.status_code == 200 and respuesta.json['version'] == app_modulo.conjunto.version
+    assert cliente.get('/dashboard?paneles=kpis&cliente=CLIENTE0', headers={'If-None-Match': etag}).status_code == 200
+    assert cliente.get('/dashboard?paneles=tabla_registros', headers={'If-None-Match': etag}).status_code == 200
+
+    servido = app_modulo.conjunto
+    app_modulo.conjunto = ConjuntoDatos(servido.df, version='otra', cubo=servido.cubo)
+    try:
+        otra = cliente.get('/dashboard?paneles=kpis', headers={'If-None-Match': etag})
+        assert otra.status_code == 200 and otra.headers['ETag'] != etag
+    finally:
+        app_modulo.conjunto = servido
+
+
+@pytest.mark.parametrize('cuerpo, campo', [
+    ({'incremental': 'false'}, 'incremental'),
+    ({'incremental': 0}, 'incremental'),
+    ({'n_jobs': 0}, 'n_jobs'),
+    ({'n_jobs': -2}, 'n_jobs'),
+    ({'n_jobs': '4'}, 'n_jobs'),
+    ({'n_jobs': 2.5}, 'n_jobs'),
+    ({'n_jobs': True}, 'n_jobs'),
+])
+def test_reentrenar_rechaza_parametros_invalidos(app_modulo, cliente, monkeypatch, cuerpo, campo):
+    monkeypatch.setattr(app_modulo, 'TOKEN_ADMIN', 'secreto')
+    respuesta = cliente.post('/admin/reentrenar', json=cuerpo, headers={'X-Token-Admin': 'secreto'})
+    assert respuesta.status_code == 400
+    assert respuesta.json['error'].startswith(campo)
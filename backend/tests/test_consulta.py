@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import paneles
+from consulta import CLAVES_ORDEN, ORDEN_RIESGO, IndiceConsulta
+from conjunto import ConjuntoDatos, compactar
+from paneles import ConsultaPanel
+
+# Con 10 clientes, un cliente solo pasa por la selección parcial y el
+# conjunto entero por el recorrido del orden global
+FILTROS = [
+    dict(),
+    dict(cliente='CLIENTE3'),
+    dict(inicio='2024-01-02', fin='2024-01-03 12:00'),
+    dict(riesgos=['Alto', '']),
+    dict(riesgos=['Medio']),
+    dict(cliente='CLIENTE7', fin='2024-01-02', riesgos=['Bajo', 'Sin riesgo']),
+    dict(cliente='NO_EXISTE'),
+]
+
+
+@pytest.fixture(scope='module')
+def lecturas():
+    # Muchos empates: pocos riesgos, residuales redondeados y la misma fecha
+    # en todos los clientes
+    rng = np.random.default_rng(0)
+    partes = []
+    for i in rng.permutation(10):
+        n = 200 + 10 * i
+        residual = np.round(rng.normal(0, 2, n))
+        residual[rng.random(n) < 0.05] = np.nan
+        partes.append(pd.DataFrame({
+            'Numero_Cliente': f'CLIENTE{i}',
+            'Fecha': pd.date_range('2024-01-01', periods=n, freq='30min'),
+            'Presion': rng.normal(10, 1, n),
+            'Temperatura': rng.normal(20, 2, n),
+            'Volumen': rng.normal(100, 10, n),
+            'Volumen_Predicho': rng.normal(100, 10, n),
+            'Residual': residual,
+            'Riesgo': rng.choice(['Bajo', 'Medio', 'Alto', 'Sin riesgo', None], n, p=[0.1, 0.1, 0.05, 0.05, 0.7]),
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+
+def _esperado(lecturas, clave, cliente=None, inicio=None, fin=None, riesgos=None):
+    # Orden total estable con pandas: la clave y, en los empates, (cliente, fecha)
+    df = lecturas.sort_values(['Numero_Cliente', 'Fecha'], kind='stable').reset_index(drop=True)
+    if clave == 'riesgo':
+        orden = df['Riesgo'].map(lambda r: 3 if pd.isna(r) else ORDEN_RIESGO.get(r, 4))
+    elif clave == 'residual':
+        orden = -df['Residual'].abs()
+    else:
+        orden = -df['Fecha'].astype('int64')
+    df = df.assign(_orden=orden).sort_values('_orden', kind='stable', na_position='last')
+
+    filtro = pd.Series(True, index=df.index)
+    if cliente:
+        filtro &= df['Numero_Cliente'] == cliente
+    if inicio:
+        filtro &= df['Fecha'] >= pd.Timestamp(inicio)
+    if fin:
+        filtro &= df['Fecha'] <= pd.Timestamp(fin)
+    if riesgos:
+        filtro &= df['Riesgo'].fillna('').isin(riesgos)
+    return df[filtro].index.to_numpy()
+
+
+@pytest.mark.parametrize('limite', [1, 7, 30])
+@pytest.mark.parametrize('filtro', FILTROS)
+@pytest.mark.parametrize('clave', CLAVES_ORDEN)
+def test_paginas_concatenadas_igual_al_orden_completo(lecturas, clave, filtro, limite):
+    indice = IndiceConsulta(lecturas)
+    paginas, despues = [], -1
+    while True:
+        posiciones, ultimo = indice.pagina(clave, **filtro, despues=despues, limite=limite)
+        paginas.append(posiciones)
+        if len(posiciones) < limite:
+            break
+        despues = ultimo
+    np.testing.assert_array_equal(np.concatenate(paginas), _esperado(lecturas, clave, **filtro))
+
+
+@pytest.mark.parametrize('clave', CLAVES_ORDEN)
+def test_tabla_registros_sigue_el_cursor(lecturas, clave):
+    datos = ConjuntoDatos(compactar(lecturas), version='v1')
+    fechas, cursor = [], None
+    while True:
+        pagina = paneles.tabla_registros(ConsultaPanel(datos, cliente='CLIENTE2'), orden=clave, limite=25, cursor=cursor)
+        fechas += [r['Fecha'] for r in pagina['registros']]
+        cursor = pagina['siguiente']
+        if cursor is None:
+            break
+    esperado = datos.indice.df.loc[_esperado(datos.indice.df, clave, cliente='CLIENTE2'), 'Fecha']
+    assert fechas == esperado.dt.strftime('%Y-%m-%d %H:%M:%S').tolist()
+
+
+def test_cursor_de_otra_version_u_orden(lecturas):
+    datos = ConjuntoDatos(compactar(lecturas), version='v1')
+    cursor = paneles.tabla_registros(ConsultaPanel(datos), orden='fecha', limite=5)['siguiente']
+    with pytest.raises(ValueError):
+        paneles.tabla_registros(ConsultaPanel(datos), orden='riesgo', cursor=cursor)
+    with pytest.raises(ValueError):
+        paneles.tabla_registros(ConsultaPanel(ConjuntoDatos(datos.df, version='v2')), orden='fecha', cursor=cursor)
+    with pytest.raises(ValueError):
+        paneles.tabla_registros(ConsultaPanel(datos), orden='fecha', cursor='no-es-un-cursor')
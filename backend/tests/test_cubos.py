@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import almacen
+from conjunto import ConjuntoDatos, compactar, preparar_servicio
+from cubos import DIAS_ES, MEDIDAS, CuboAgregados
+
+CONSULTAS = [
+    dict(cliente=cliente, inicio=inicio, fin=fin, riesgos=riesgos)
+    for cliente in (None, 'CLIENTE0', 'CLIENTE2')
+    for inicio, fin in [(None, None), ('2024-01-03 05:00', '2024-01-20 17:00'), ('2024-01-09', None),
+                        (None, '2024-01-02 03:00'), ('2024-01-05 10:00', '2024-01-05 13:00')]
+    for riesgos in (None, ['Alto'], ['Bajo', 'Sin riesgo', ''])
+]
+
+
+def _lecturas(semilla=0, clientes=3, horas=24 * 30):
+    rng = np.random.default_rng(semilla)
+    partes = []
+    for i in range(clientes):
+        n = horas - 17 * i
+        volumen = rng.normal(100, 10, n)
+        volumen[rng.random(n) < 0.05] = np.nan
+        outlier = rng.random(n) < 0.1
+        partes.append(pd.DataFrame({
+            'Numero_Cliente': f'CLIENTE{i}',
+            'Fecha': pd.date_range('2024-01-01', periods=n, freq='h') + pd.Timedelta(hours=5 * i),
+            'Presion': rng.normal(10, 1, n),
+            'Temperatura': rng.normal(20, 2, n),
+            'Volumen': volumen,
+            'Volumen_Predicho': rng.normal(100, 10, n),
+            'Residual': rng.normal(0, 5, n),
+            'outlier': outlier,
+            'Riesgo': np.where(outlier, rng.choice(['Bajo', 'Medio', 'Alto'], n), None),
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+
+def _partir(df, clase_nueva=True):
+    # Base: hasta el 20 de enero; nuevas: el resto (salvo CLIENTE0, que solo
+    # recibe lecturas dentro de sus semanas), un cliente nuevo, lecturas
+    # anteriores a la base de CLIENTE1 y, con clase_nueva, una clase de riesgo
+    # que la base no tiene (amplía todos los cubos)
+    corte = df['Fecha'] < '2024-01-20'
+    base, nuevas = df[corte], df[~corte & (df['Numero_Cliente'] != 'CLIENTE0')].copy()
+    if clase_nueva:
+        nuevas.loc[nuevas.index[:5], 'Riesgo'] = 'Critico'
+    repetidas = base[base['Numero_Cliente'] == 'CLIENTE0'].iloc[200:220]
+    nuevo_cliente = df[df['Numero_Cliente'] == 'CLIENTE2'].head(50).assign(Numero_Cliente='CLIENTE9')
+    anteriores = df[df['Numero_Cliente'] == 'CLIENTE1'].head(30).copy()
+    anteriores['Fecha'] -= pd.Timedelta(days=40)
+    return base, pd.concat([nuevas, repetidas, nuevo_cliente, anteriores], ignore_index=True)
+
+
+def _por_riesgo(cubo, **consulta):
+    clientes, total = cubo.consultar(**consulta)
+    return clientes, {r: total[:, i] for i, r in enumerate(cubo.riesgos) if total[:, i].any()}
+
+
+def _comparar(esperado, obtenido):
+    for consulta in CONSULTAS:
+        clientes_a, a = _por_riesgo(esperado, **consulta)
+        clientes_b, b = _por_riesgo(obtenido, **consulta)
+        assert clientes_a == clientes_b, consulta
+        assert a.keys() == b.keys(), consulta
+        for riesgo in a:
+            np.testing.assert_allclose(a[riesgo], b[riesgo], rtol=1e-5, err_msg=str(consulta))
+        assert esperado.matriz_anomalias(**consulta).equals(obtenido.matriz_anomalias(**consulta)), consulta
+
+
+def _guardado(cubo, directorio):
+    # Mismo formato que almacen.guardar_agregados: .npy abiertos con memory-map
+    arreglos, meta = cubo.arreglos()
+    for nombre, arreglo in arreglos.items():
+        np.save(directorio / f'{nombre}.npy', arreglo)
+    return {n: np.load(directorio / f'{n}.npy', mmap_mode='r') for n in arreglos}, meta
+
+
+def test_cubo_agregado_igual_al_construido_de_cero():
+    df = _lecturas()
+    base, nuevas = _partir(df)
+    completo = CuboAgregados(compactar(pd.concat([base, nuevas], ignore_index=True)))
+
+    cubo = CuboAgregados(compactar(base))
+    cubo.agregar(compactar(nuevas))
+    _comparar(completo, cubo)
+
+
+@pytest.mark.parametrize('clase_nueva', [False, True])
+def test_cubo_guardado_de_solo_lectura_admite_agregar(tmp_path, clase_nueva):
+    df = _lecturas(semilla=1)
+    base, nuevas = _partir(df, clase_nueva)
+    completo = CuboAgregados(compactar(pd.concat([base, nuevas], ignore_index=True)))
+
+    cubo = CuboAgregados(None, _guardado(CuboAgregados(compactar(base)), tmp_path))
+    cubo.agregar(compactar(nuevas))
+    _comparar(completo, cubo)
+
+
+def test_cubo_igual_a_groupby():
+    df = _lecturas(semilla=2)
+    compacto = compactar(df)
+    cubo = CuboAgregados(compacto)
+    for consulta in CONSULTAS:
+        filtro = pd.Series(True, index=df.index)
+        if consulta['cliente']:
+            filtro &= df['Numero_Cliente'] == consulta['cliente']
+        if consulta['inicio']:
+            filtro &= df['Fecha'] >= pd.Timestamp(consulta['inicio'])
+        if consulta['fin']:
+            filtro &= df['Fecha'] <= pd.Timestamp(consulta['fin'])
+        if consulta['riesgos']:
+            filtro &= df['Riesgo'].fillna('').isin(consulta['riesgos'])
+        filas = compacto[filtro.to_numpy()]
+
+        kpis = cubo.kpis(**consulta)
+        assert kpis['total_clientes'] == filas['Numero_Cliente'].nunique()
+        assert kpis['total_anomalias'] == int(filas['outlier'].sum())
+        assert kpis['alertas_criticas'] == int((filas['Riesgo'] == 'Alto').sum())
+        for medida in MEDIDAS:
+            esperado = filas[medida].astype(np.float64).mean()
+            obtenido = kpis[f'promedio_{medida.lower()}']
+            if np.isnan(esperado):
+                assert np.isnan(obtenido)
+            else:
+                assert obtenido == pytest.approx(esperado, abs=0.01)
+
+        anomalias = filas[filas['outlier']]
+        esperado = anomalias.groupby([anomalias['Fecha'].dt.dayofweek, anomalias['Fecha'].dt.hour]).size()
+        matriz = cubo.matriz_anomalias(**consulta)
+        obtenido = {} if matriz.empty else {
+            (DIAS_ES.index(dia), int(hora)): int(n) for (dia, hora), n in matriz.stack().items() if n > 0
+        }
+        assert obtenido == {clave: int(n) for clave, n in esperado.items()}
+
+
+def test_publicar_extiende_los_cubos_de_la_base(almacen_temporal):
+    df = _lecturas(semilla=3)
+    base, nuevas = _partir(df, clase_nueva=False)
+    version_base = almacen.guardar_resultado(base, puntero=None)
+    preparar_servicio(version_base)
+
+    version = almacen.agregar_resultado(version_base, nuevas, puntero=None)
+    publicado = preparar_servicio(version, base=version_base, nuevas=nuevas)
+    completo = ConjuntoDatos(compactar(almacen.leer_dataframe(version)), version)
+    _comparar(completo.cubo, publicado.cubo)
+    # Lo guardado al publicar es lo que abren los workers
+    _comparar(completo.cubo, preparar_servicio(version).cubo)
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import paneles
+from conjunto import ConjuntoDatos, compactar
+from paneles import ConsultaPanel
+
+FILTROS = [
+    dict(),
+    dict(cliente='CLIENTE1'),
+    dict(inicio='2024-01-02 06:00', fin='2024-01-04 18:30'),
+    dict(riesgos=['Alto', 'Medio']),
+    dict(cliente='CLIENTE0', inicio='2024-01-03', riesgos=['Bajo']),
+]
+
+
+@pytest.fixture(scope='module')
+def lecturas():
+    # Lecturas cada 20 minutos, con minutos repetidos entre clientes
+    rng = np.random.default_rng(0)
+    partes = []
+    for i in range(3):
+        n = 400 + 30 * i
+        volumen = rng.normal(100, 10, n)
+        volumen[rng.random(n) < 0.05] = np.nan
+        partes.append(pd.DataFrame({
+            'Numero_Cliente': f'CLIENTE{i}',
+            'Fecha': pd.date_range('2024-01-01', periods=n, freq='20min') + pd.Timedelta(minutes=20 * i),
+            'Presion': rng.normal(10, 1, n),
+            'Temperatura': rng.normal(20, 2, n),
+            'Volumen': volumen,
+            'outlier': rng.random(n) < 0.1,
+            'Riesgo': rng.choice(['Bajo', 'Medio', 'Alto', None], n, p=[0.1, 0.1, 0.1, 0.7]),
+        }))
+    return pd.concat(partes, ignore_index=True)
+
+
+@pytest.fixture(scope='module')
+def datos(lecturas):
+    return ConjuntoDatos(compactar(lecturas))
+
+
+def _filtrar(df, cliente=None, inicio=None, fin=None, riesgos=None):
+    filtro = pd.Series(True, index=df.index)
+    if cliente:
+        filtro &= df['Numero_Cliente'] == cliente
+    if inicio:
+        filtro &= df['Fecha'] >= pd.Timestamp(inicio)
+    if fin:
+        filtro &= df['Fecha'] <= pd.Timestamp(fin)
+    if riesgos:
+        filtro &= df['Riesgo'].isin(riesgos)
+    return df[filtro]
+
+
+@pytest.mark.parametrize('filtro', FILTROS)
+def test_grafico_volumen_igual_a_groupby(datos, filtro):
+    esperado = _filtrar(datos.df, **filtro).groupby('Fecha')[['Volumen', 'Presion', 'Temperatura']].mean()
+    puntos = paneles.grafico_volumen(ConsultaPanel(datos, **filtro))['datos']
+    assert [p['x'] for p in puntos] == esperado.index.strftime('%Y-%m-%d %H:%M').tolist()
+    np.testing.assert_allclose([p['y'] for p in puntos], esperado['Volumen'].round(2), atol=0.011)
+    np.testing.assert_allclose([p['presion'] for p in puntos], esperado['Presion'].round(2), atol=0.011)
+
+
+@pytest.mark.parametrize('metodo', ['lttb', 'minmax'])
+def test_grafico_volumen_reducido(datos, metodo):
+    completo = paneles.grafico_volumen(ConsultaPanel(datos))['datos']
+    reducido = paneles.grafico_volumen(ConsultaPanel(datos), max_puntos=50, metodo=metodo)['datos']
+    assert len(reducido) <= 50
+    # Cada punto reducido es uno de la serie completa, y ninguna anomalía
+    # grave desaparece: el riesgo de un punto es el máximo de su cubeta
+    por_x = {p['x']: p for p in completo}
+    assert all(por_x[p['x']]['y'] == p['y'] or np.isnan(p['y']) for p in reducido)
+    assert any(p['riesgo'] == 'Alto' for p in reducido)
+
+
+def test_columna_convierte_solo_las_filas_pedidas(datos):
+    posiciones = np.array([5, 1, 30])
+    valores = ConsultaPanel(datos).columna('Volumen', posiciones)
+    assert valores.dtype == np.float64
+    np.testing.assert_array_equal(valores, datos.df['Volumen'].to_numpy()[posiciones].astype(np.float64))
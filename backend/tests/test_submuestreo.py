@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import submuestreo
+
+
+def _serie(n, semilla=0):
+    rng = np.random.default_rng(semilla)
+    x = np.cumsum(rng.integers(1, 5, n))
+    y = np.cumsum(rng.normal(0, 1, n))
+    return x, y
+
+
+def _lttb_referencia(x, y, cubeta):
+    # LTTB punto por punto sobre las mismas cubetas: primer y último punto
+    # fijos, y de cada cubeta intermedia el punto que forma el triángulo de
+    # mayor área con el elegido anterior y la media de la cubeta siguiente
+    n = len(y)
+    grupos = [[0]]
+    for i in range(1, n - 1):
+        if len(grupos) == 1 or cubeta[i] != cubeta[i - 1]:
+            grupos.append([])
+        grupos[-1].append(i)
+    grupos.append([n - 1])
+
+    elegidos = [0]
+    for k in range(1, len(grupos) - 1):
+        a = elegidos[-1]
+        siguiente = grupos[k + 1]
+        xc, yc = np.mean(x[siguiente]), np.mean(y[siguiente])
+        areas = [abs((x[a] - xc) * (y[i] - y[a]) - (x[a] - x[i]) * (yc - y[a])) for i in grupos[k]]
+        elegidos.append(grupos[k][int(np.argmax(areas))])
+    elegidos.append(n - 1)
+    return np.array(elegidos)
+
+
+@pytest.mark.parametrize('n, max_puntos', [(50, 10), (1000, 100), (1000, 3), (5000, 997)])
+def test_lttb_igual_a_la_referencia(n, max_puntos):
+    x, y = _serie(n)
+    cubeta = submuestreo.cubetas_tiempo(x, max(max_puntos - 2, 1))
+    np.testing.assert_array_equal(submuestreo.lttb(x.astype(np.float64), y, cubeta), _lttb_referencia(x, y, cubeta))
+
+
+@pytest.mark.parametrize('metodo', submuestreo.METODOS)
+@pytest.mark.parametrize('max_puntos', [submuestreo.MIN_PUNTOS, 10, 500])
+def test_reducir_respeta_max_puntos(metodo, max_puntos):
+    x, y = _serie(2000, semilla=1)
+    elegidos, cubeta = submuestreo.reducir(x, y, max_puntos, metodo)
+    assert len(elegidos) <= max_puntos
+    assert np.all(np.diff(elegidos) > 0)
+    assert len(cubeta) == len(x)
+    if metodo == 'lttb':
+        assert elegidos[0] == 0 and elegidos[-1] == len(x) - 1
+
+
+def test_min_max_conserva_los_extremos_de_cada_cubeta():
+    x, y = _serie(3000, semilla=2)
+    y[::97] = np.nan
+    cubeta = submuestreo.cubetas_tiempo(x, 40)
+    elegidos = set(submuestreo.min_max(y, cubeta).tolist())
+    for c in np.unique(cubeta):
+        posiciones = np.flatnonzero(cubeta == c)
+        assert posiciones[np.nanargmin(y[posiciones])] in elegidos
+        assert posiciones[np.nanargmax(y[posiciones])] in elegidos
+        assert not any(np.isnan(y[p]) for p in elegidos.intersection(posiciones.tolist()))
+
+
+def test_maximo_por_cubeta():
+    valores = np.array([0, 2, 1, 0, 3, 0])
+    cubeta = np.array([0, 0, 0, 1, 1, 2])
+    np.testing.assert_array_equal(submuestreo.maximo_por_cubeta(valores, cubeta), [2, 2, 2, 3, 3, 0])
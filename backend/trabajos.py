@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import almacen
+from comparacion import comparar_versiones
+from modelo import REGRESORES
+from reentrenamiento import reentrenar
+
+# ------------------------------------------------------
+# Reentrenamientos en segundo plano lanzados desde la app.
+# Cada trabajo corre en un pool de procesos acotado (la API sigue
+# respondiendo) y deja su estado en DATA_DIR/trabajos/<id>.json,
+# así cualquier worker de gunicorn puede consultarlo. Un archivo
+# de bloqueo por archivo de entrada impide dos reentrenamientos
+# simultáneos sobre los mismos datos, también entre workers.
+# Al terminar, la versión queda en el puntero 'nuevo' con su
+# comparación contra 'actual', lista para aplicarse.
+# ------------------------------------------------------
+DIR_TRABAJOS = os.path.join(almacen.DATA_DIR, 'trabajos')
+DIR_ENTRADA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'input')
+ENTRADA_POR_DEFECTO = 'Datos Contugas.xlsx'
+# Procesos para trabajos y trabajos en espera (por worker del servidor)
+MAX_PROCESOS = int(os.environ.get('CONTUGAS_MAX_TRABAJOS', '1'))
+MAX_COLA = int(os.environ.get('CONTUGAS_MAX_COLA_TRABAJOS', '4'))
+# Un bloqueo cuyo trabajo no da señales por más de este tiempo se considera abandonado
+VENCIMIENTO_BLOQUEO = float(os.environ.get('CONTUGAS_VENCIMIENTO_BLOQUEO', str(6 * 3600)))
+TERMINALES = ('terminado', 'cancelado', 'error')
+_ID_VALIDO = re.compile(r'^[0-9a-f]{12}$')
+
+_cerrojo = threading.Lock()
+_ejecutor = None
+_ejecutor_pid = None
+_futuros = {}
+
+
+class TrabajoCancelado(Exception):
+    pass
+
+
+class TrabajoEnCurso(Exception):
+    # Ya hay un reentrenamiento sobre los mismos datos
+    def __init__(self, trabajo_id):
+        super().__init__(f"Ya hay un reentrenamiento en curso sobre estos datos: {trabajo_id}")
+        self.trabajo_id = trabajo_id
+
+
+class ColaLlena(Exception):
+    pass
+
+
+def _ahora():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _ruta(trabajo_id, extension='json'):
+    return os.path.join(DIR_TRABAJOS, f'{trabajo_id}.{extension}')
+
+
+def _guardar(estado):
+    os.makedirs(DIR_TRABAJOS, exist_ok=True)
+    estado['actualizado'] = _ahora()
+    ruta = _ruta(estado['id'])
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(temporal, ruta)
+
+
+def leer_trabajo(trabajo_id):
+    if not _ID_VALIDO.match(str(trabajo_id)):
+        return None
+    try:
+        with open(_ruta(trabajo_id), encoding='utf-8') as f:
+            estado = json.load(f)
+    except (OSError, ValueError):
+        return None
+    estado['cancelacion_pedida'] = os.path.exists(_ruta(trabajo_id, 'cancelar'))
+    return estado
+
+
+def listar_trabajos(limite=20):
+    if not os.path.isdir(DIR_TRABAJOS):
+        return []
+    ids = [n[:-5] for n in os.listdir(DIR_TRABAJOS) if n.endswith('.json')]
+    trabajos = [t for t in map(leer_trabajo, ids) if t is not None]
+    return sorted(trabajos, key=lambda t: t['creado'], reverse=True)[:limite]
+
+
+def resolver_entrada(nombre=None):
+    # Solo archivos de la carpeta input (sin rutas)
+    nombre = os.path.basename(nombre or ENTRADA_POR_DEFECTO)
+    ruta = os.path.join(DIR_ENTRADA, nombre)
+    if not os.path.isfile(ruta):
+        raise ValueError(f"No existe el archivo de entrada: {nombre}")
+    return ruta
+
+
+def _quitar_marca(trabajo_id):
+    try:
+        os.remove(_ruta(trabajo_id, 'cancelar'))
+    except OSError:
+        pass
+
+
+def _ruta_bloqueo(ruta_entrada):
+    clave = hashlib.sha1(os.path.realpath(ruta_entrada).encode()).hexdigest()[:16]
+    return os.path.join(DIR_TRABAJOS, f'bloqueo_{clave}')
+
+
+def _vencido(trabajo_id):
+    estado = leer_trabajo(trabajo_id)
+    if estado is None or estado['estado'] in TERMINALES:
+        return True
+    return time.time() - os.path.getmtime(_ruta(trabajo_id)) > VENCIMIENTO_BLOQUEO
+
+
+def _tomar_bloqueo(ruta_bloqueo, trabajo_id):
+    # Creación exclusiva del archivo: atómica también entre procesos
+    os.makedirs(DIR_TRABAJOS, exist_ok=True)
+    for _ in range(2):
+        try:
+            descriptor = os.open(ruta_bloqueo, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(ruta_bloqueo, encoding='utf-8') as f:
+                    dueno = f.read().strip()
+            except OSError:
+                continue
+            if not _vencido(dueno):
+                raise TrabajoEnCurso(dueno)
+            _liberar_bloqueo(ruta_bloqueo, dueno)
+            continue
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            f.write(trabajo_id)
+        return
+    raise TrabajoEnCurso(None)
+
+
+def _liberar_bloqueo(ruta_bloqueo, trabajo_id):
+    try:
+        with open(ruta_bloqueo, encoding='utf-8') as f:
+            if f.read().strip() != trabajo_id:
+                return
+        os.remove(ruta_bloqueo)
+    except OSError:
+        pass
+
+
+def _ejecutor_proceso():
+    # Un pool por proceso, creado en el primer uso (no en el maestro de gunicorn)
+    global _ejecutor, _ejecutor_pid
+    # Si un proceso del pool murió, el pool queda inutilizable y se reemplaza
+    if _ejecutor_pid != os.getpid() or getattr(_ejecutor, '_broken', False):
+        _ejecutor = ProcessPoolExecutor(max_workers=MAX_PROCESOS)
+        _ejecutor_pid = os.getpid()
+        _futuros.clear()
+    return _ejecutor
+
+
+def enviar(entrada=None, incremental=True, n_jobs=None, regresor=None):
+    # Registra el trabajo y lo agenda; devuelve su estado inicial
+    # Los parámetros vienen del cuerpo JSON: "false" o 0 procesos no se aceptan
+    if not isinstance(incremental, bool):
+        raise ValueError("incremental debe ser true o false")
+    parametros = {'incremental': incremental}
+    if n_jobs is not None:
+        if isinstance(n_jobs, bool) or not isinstance(n_jobs, int) or (n_jobs < 1 and n_jobs != -1):
+            raise ValueError("n_jobs debe ser un entero mayor o igual que 1, o -1 (todos los núcleos)")
+        parametros['n_jobs'] = n_jobs
+    if regresor:
+        if regresor not in REGRESORES:
+            raise ValueError(f"Regresor desconocido: {regresor}. Opciones: {', '.join(REGRESORES)}")
+        parametros['regresor'] = regresor
+    ruta_entrada = resolver_entrada(entrada)
+
+    with _cerrojo:
+        ejecutor = _ejecutor_proceso()
+        if sum(not f.done() for f in _futuros.values()) >= MAX_PROCESOS + MAX_COLA:
+            raise ColaLlena("Hay demasiados reentrenamientos en espera")
+
+        trabajo_id = uuid.uuid4().hex[:12]
+        ruta_bloqueo = _ruta_bloqueo(ruta_entrada)
+        estado = {
+            'id': trabajo_id,
+            'estado': 'en_cola',
+            'entrada': os.path.basename(ruta_entrada),
+            'parametros': parametros,
+            'creado': _ahora(),
+            'iniciado': None,
+            'terminado': None,
+            'total': None,
+            'completados': 0,
+            'clientes': [],
+            'version': None,
+            'comparacion': None,
+            'error': None,
+        }
+        # Estado antes que bloqueo: un bloqueo sin estado se trataría como vencido
+        _guardar(estado)
+        try:
+            _tomar_bloqueo(ruta_bloqueo, trabajo_id)
+        except TrabajoEnCurso:
+            os.remove(_ruta(trabajo_id))
+            raise
+        futuro = ejecutor.submit(_ejecutar, trabajo_id, ruta_entrada, ruta_bloqueo, parametros)
+        _futuros[trabajo_id] = futuro
+    futuro.add_done_callback(lambda f: _al_terminar(trabajo_id, ruta_bloqueo, f))
+    return leer_trabajo(trabajo_id)
+
+
+def _al_terminar(trabajo_id, ruta_bloqueo, futuro):
+    # En el proceso que lo envió: cubre los trabajos cancelados antes de
+    # empezar y los procesos que murieron sin dejar su estado final
+    estado = leer_trabajo(trabajo_id)
+    if estado is not None and estado['estado'] not in TERMINALES:
+        if futuro.cancelled():
+            estado.update(estado='cancelado', terminado=_ahora())
+        else:
+            estado.update(estado='error', terminado=_ahora(), error=str(futuro.exception() or 'El proceso terminó sin estado'))
+        estado.pop('cancelacion_pedida', None)
+        _guardar(estado)
+        _quitar_marca(trabajo_id)
+    _liberar_bloqueo(ruta_bloqueo, trabajo_id)
+    with _cerrojo:
+        _futuros.pop(trabajo_id, None)
+
+
+def _ejecutar(trabajo_id, ruta_entrada, ruta_bloqueo, parametros):
+    # Corre en el proceso del pool
+    estado = leer_trabajo(trabajo_id)
+    estado.pop('cancelacion_pedida', None)
+    inicio = time.perf_counter()
+
+    def cancelado():
+        return os.path.exists(_ruta(trabajo_id, 'cancelar'))
+
+    def progreso(cliente_id, completados, total):
+        estado['completados'] = completados
+        estado['total'] = total
+        estado['clientes'].append({
+            'cliente': cliente_id, 'completados': completados, 'segundos': round(time.perf_counter() - inicio, 3)
+        })
+        _guardar(estado)
+        # La cancelación se atiende entre clientes
+        if cancelado():
+            raise TrabajoCancelado()
+
+    try:
+        if cancelado():
+            raise TrabajoCancelado()
+        estado.update(estado='ejecutando', iniciado=_ahora(), pid=os.getpid())
+        _guardar(estado)
+
+        version = reentrenar(ruta_entrada, puntero='nuevo', progreso=progreso, **parametros)
+        estado['version'] = version
+
+        # Versión candidata: comparación contra la servida, lista para aplicar
+        actual = almacen.leer_puntero('actual')
+        if actual and actual != version:
+            reporte = comparar_versiones(actual, version)
+            almacen.guardar_reporte(version, reporte, almacen.ARCHIVO_COMPARACION)
+            estado['comparacion'] = {'version_actual': actual, **reporte['total']}
+        estado['estado'] = 'terminado'
+    except TrabajoCancelado:
+        estado['estado'] = 'cancelado'
+    except Exception as e:
+        estado.update(estado='error', error=str(e))
+    finally:
+        estado['terminado'] = _ahora()
+        _guardar(estado)
+        _quitar_marca(trabajo_id)
+        _liberar_bloqueo(ruta_bloqueo, trabajo_id)
+    return estado['estado']
+
+
+def cancelar(trabajo_id):
+    # Marca la cancelación; el trabajo la ve al terminar el cliente en curso
+    estado = leer_trabajo(trabajo_id)
+    if estado is None or estado['estado'] in TERMINALES:
+        return estado
+    with open(_ruta(trabajo_id, 'cancelar'), 'w', encoding='utf-8') as f:
+        f.write(_ahora())
+    with _cerrojo:
+        futuro = _futuros.get(trabajo_id)
+    if futuro is not None:
+        futuro.cancel()
+    return leer_trabajo(trabajo_id)
+
+
+def aplicar(trabajo_id):
+    # Publica la versión del trabajo como 'actual'
+    estado = leer_trabajo(trabajo_id)
+    if estado is None:
+        return None
+    if estado['estado'] != 'terminado' or not estado['version']:
+        raise ValueError("El trabajo no terminó o no generó una versión")
+    almacen.fijar_puntero('actual', estado['version'])
+    return estado['version']